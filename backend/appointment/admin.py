@@ -1,44 +1,116 @@
 # backend/appointment/admin.py
-import openpyxl
-from django.http import HttpResponse
+import hashlib
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
 from django.utils.html import format_html
 from django.urls import reverse
-from .models import Schedule, Weekday, Workinghours, Service, PromoCode
+from django.utils import timezone
+from django.utils.functional import cached_property
+from . import blind_index
+from .models import Schedule, Weekday, Workinghours, Service, PromoCode, Outbox
+from .export import respuesta_csv, respuesta_excel
+from .booking import CANCELACION_AVISADA, CANCELACION_ERROR, CANCELACION_PASADA, cancelar
 from .forms import ScheduleAdminForm
 from .utils import enviar_email_cancelacion
 import logging
-from datetime import date
+from datetime import date, timedelta
 
 logger = logging.getLogger('appointment.admin')
 
-# --- Acción personalizada: exportar a Excel ---
+# --- Acciones personalizadas: exportar a Excel / CSV ---
 def exportar_excel(modeladmin, request, queryset):
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Citas"
-
-    # Encabezados
-    ws.append(['Cliente', 'Teléfono', 'Fecha', 'Hora'])
-
-    for cita in queryset:
-        ws.append([
-            cita.name,
-            cita.phone,
-            cita.date.strftime('%Y-%m-%d'),
-            cita.time.strftime('%H:%M')
-        ])
-
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename=citas.xlsx'
-    wb.save(response)
-    return response
+    return respuesta_excel(queryset)
 
 exportar_excel.short_description = "Exportar a Excel"
 
 
+def exportar_csv(modeladmin, request, queryset):
+    return respuesta_csv(queryset)
+
+exportar_csv.short_description = "Exportar a CSV"
+
+
+# --- Listado de citas para tablas grandes ---
+class ConteoEstimadoPaginator(Paginator):
+    """
+    Evita un COUNT(*) completo en cada carga del listado: en PostgreSQL, sin
+    filtros, usa la estimación del planificador si la tabla es grande; en el
+    resto de casos guarda el conteo exacto en caché unos segundos.
+    """
+    UMBRAL_ESTIMACION = 100_000
+    CACHE_TTL = 60
+
+    def _estimacion(self, queryset):
+        conexion = connections[queryset.db]
+        if conexion.vendor != 'postgresql' or queryset.query.where:
+            return None
+        with conexion.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table],
+            )
+            fila = cursor.fetchone()
+        if fila and fila[0] >= self.UMBRAL_ESTIMACION:
+            return int(fila[0])
+        return None
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        estimado = self._estimacion(queryset)
+        if estimado is not None:
+            return estimado
+
+        sql, params = queryset.query.sql_with_params()
+        clave = 'admin_conteo:' + hashlib.sha256(repr((queryset.db, sql, params)).encode()).hexdigest()
+        total = cache.get(clave)
+        if total is None:
+            total = queryset.count()
+            cache.set(clave, total, self.CACHE_TTL)
+        return total
+
+
+class CitaChangeList(ChangeList):
+    """Desencripta de una vez solo las citas de la página visible"""
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.result_list = Schedule.descifrar_lote(self.result_list)
+
+
+class RangoFechaFilter(admin.SimpleListFilter):
+    """
+    Rangos de fechas acotados en lugar de date_hierarchy, que recorre la
+    tabla entera para listar los años, meses y días con citas
+    """
+    title = 'fecha'
+    parameter_name = 'rango'
+    # Días desde hoy (inclusive) de cada opción
+    RANGOS = {
+        'hoy': ('Hoy', 0, 0),
+        'manana': ('Mañana', 1, 1),
+        'semana': ('Próximos 7 días', 0, 6),
+        'mes': ('Próximos 30 días', 0, 29),
+        'pasada': ('Últimos 7 días', -7, -1),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(clave, nombre) for clave, (nombre, _, _) in self.RANGOS.items()]
+
+    def queryset(self, request, queryset):
+        rango = self.RANGOS.get(self.value())
+        if rango is None:
+            return queryset
+        _, desde, hasta = rango
+        hoy = timezone.localdate()
+        return queryset.filter(date__range=(hoy + timedelta(days=desde), hoy + timedelta(days=hasta)))
+
+
 # --- Admin de Schedule (Citas) ---
 @admin.register(Schedule)
 class ScheduleAdmin(admin.ModelAdmin):
@@ -47,12 +119,22 @@ class ScheduleAdmin(admin.ModelAdmin):
     # Usar métodos personalizados en lugar de los campos directos
     list_display = ('date', 'time', 'get_name', 'get_email', 'get_phone', 'service')
     search_fields = ('_name', '_email', '_phone', 'description')
-    actions = [exportar_excel]
+    actions = [exportar_excel, exportar_csv]
+
+    # Listado: servicio en la misma consulta, filtro por rangos de fecha
+    # acotados (índice único date+time) y sin el segundo COUNT(*) del total sin filtrar
+    list_select_related = ('service',)
+    list_filter = (RangoFechaFilter,)
+    paginator = ConteoEstimadoPaginator
+    show_full_result_count = False
     
     # Campos que se mostrarán en el formulario de edición
     fields = ('date', 'time', 'name', 'email', 'phone', 'description', 
               'promo_code_allowed', 'service', 'promo_code')
 
+    def get_changelist(self, request, **kwargs):
+        return CitaChangeList
+
     def get_name(self, obj):
         """Muestra el nombre desencriptado"""
         return obj.name
@@ -72,16 +154,20 @@ class ScheduleAdmin(admin.ModelAdmin):
 
     def get_search_results(self, request, queryset, search_term):
         """
-        Personaliza la búsqueda para usar hashes en campos encriptados
+        Búsqueda parcial en campos encriptados mediante el índice ciego
+        (prefijos y trigramas con HMAC), sin desencriptar toda la tabla
         """
         # Si NO hay término de búsqueda, devolver todo el queryset sin filtrar
         if not search_term:
             return queryset, False
-        
-        # Si HAY término de búsqueda, filtrar por hash
+
+        # Coincidencia exacta por hash (citas aún sin indexar) o parcial por índice
         hash_term = Schedule.hash_value(search_term)
-        queryset = queryset.filter(name_hash=hash_term) | queryset.filter(email_hash=hash_term)
-        
+        ids = blind_index.buscar(search_term)
+        queryset = queryset.filter(
+            Q(name_hash=hash_term) | Q(email_hash=hash_term) | Q(pk__in=ids)
+        )
+
         return queryset, False
 
     # --- Dentro de ScheduleAdmin ---
@@ -89,34 +175,32 @@ class ScheduleAdmin(admin.ModelAdmin):
         """
         Se ejecuta cuando se elimina UNA cita desde el admin
         """
-        logger.info(f'[DELETE] Eliminando cita {obj.id} de {obj.name}')
+        logger.info('[DELETE] Eliminando cita %s', obj.id)
 
         try:
             # Solo enviar email si la fecha es hoy o futura
             if obj.date >= date.today():
-                logger.info(f'[EMAIL] Enviando correo de cancelación a {obj.email}')
+                logger.info('[EMAIL] Enviando correo de cancelación de la cita %s', obj.id)
                 email_enviado = enviar_email_cancelacion(obj)
 
                 if email_enviado:
-                    logger.info(f'[OK] Email de cancelación enviado a {obj.email}')
+                    logger.info('[OK] Email de cancelación de la cita %s enviado', obj.id)
                     self.message_user(
                         request,
                         f'Cita eliminada y correo de cancelación enviado a {obj.email}',
                         level='success'
                     )
                 else:
-                    logger.warning(f'[WARN] No se pudo enviar email de cancelación a {obj.email}')
+                    logger.warning('[WARN] No se pudo enviar email de cancelación de la cita %s', obj.id)
                     self.message_user(
                         request,
                         f'Cita eliminada pero no se pudo enviar el correo a {obj.email}',
                         level='warning'
                     )
             else:
-                logger.info(f'[SKIP] No se envía correo para cita pasada ({obj.date})')
+                logger.info('[SKIP] No se envía correo para cita pasada (%s)', obj.date)
         except Exception as e:
-            logger.error(f'[ERROR] Error al enviar email de cancelación: {str(e)}')
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception('[ERROR] Error al enviar email de cancelación: %s', e)
             self.message_user(
                 request,
                 f'Cita eliminada pero hubo un error al enviar el correo: {str(e)}',
@@ -128,33 +212,32 @@ class ScheduleAdmin(admin.ModelAdmin):
 
     def delete_queryset(self, request, queryset):
         """
-        Se ejecuta cuando se eliminan MÚLTIPLES citas desde el admin
+        Se ejecuta cuando se eliminan MÚLTIPLES citas desde el admin:
+        borrado en una transacción y avisos encolados en bloque
         """
-        logger.info(f'[DELETE_MULTIPLE] Eliminando {queryset.count()} citas')
-
-        emails_enviados = 0
-        for obj in queryset:
-            try:
-                if obj.date >= date.today():
-                    logger.info(f'[EMAIL] Enviando correo de cancelación a {obj.email} (cita {obj.id})')
-                    email_enviado = enviar_email_cancelacion(obj)
-                    if email_enviado:
-                        emails_enviados += 1
-                        logger.info(f'[OK] Email enviado a {obj.email}')
-                    else:
-                        logger.warning(f'[WARN] No se pudo enviar email a {obj.email}')
-                else:
-                    logger.info(f'[SKIP] No se envía correo para cita pasada ({obj.date})')
-            except Exception as e:
-                logger.error(f'[ERROR] Error al enviar email a {obj.email}: {str(e)}')
+        resultados = cancelar(queryset)
+        logger.info('[DELETE_MULTIPLE] %d citas eliminadas', len(resultados))
+
+        avisadas = sum(1 for _, estado, _ in resultados if estado == CANCELACION_AVISADA)
+        pasadas = sum(1 for _, estado, _ in resultados if estado == CANCELACION_PASADA)
+        errores = [(cita, detalle) for cita, estado, detalle in resultados if estado == CANCELACION_ERROR]
+        for cita, detalle in errores:
+            logger.error('[ERROR] Cita %s: no se pudo preparar el correo de cancelación: %s', cita.id, detalle)
 
-        # Eliminar todas las citas
-        super().delete_queryset(request, queryset)
         self.message_user(
             request,
-            f'{queryset.count()} citas eliminadas. Se enviaron {emails_enviados} correos de cancelación.',
+            f'{len(resultados)} citas eliminadas. {avisadas} correos de cancelación en cola, '
+            f'{pasadas} citas pasadas sin aviso.',
             level='success'
         )
+        if errores:
+            # Solo el id: el mensaje se guarda en la sesión y no debe llevar datos personales
+            detalle = ', '.join(f'#{cita.pk} ({cita.date} {cita.time:%H:%M})' for cita, _ in errores[:10])
+            self.message_user(
+                request,
+                f'{len(errores)} clientes no pudieron ser avisados (citas {detalle}); ver el registro',
+                level='warning'
+            )
 
 
 # --- Admin de Weekday (Días) ---
@@ -199,7 +282,37 @@ class ServiceAdmin(admin.ModelAdmin):
 # --- Admin de Códigos Promocionales ---
 @admin.register(PromoCode)
 class PromoCodeAdmin(admin.ModelAdmin):
-    list_display = ['code', 'discount_percentage', 'valid_from', 'valid_to', 'active', 'current_uses']
+    list_display = ['code', 'discount_percentage', 'valid_from', 'valid_to', 'active',
+                    'current_uses', 'max_uses', 'max_uses_per_customer']
     list_filter = ['active', 'valid_from', 'valid_to']
     search_fields = ['code']
-    ordering = ['-valid_to']
\ No newline at end of file
+    ordering = ['-valid_to']
+    readonly_fields = ['current_uses']
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # current_uses solo cambia por el canje atómico: no pisarlo con el valor del formulario
+        campos = [f.name for f in obj._meta.concrete_fields if not f.primary_key and f.name != 'current_uses']
+        obj.save(update_fields=campos)
+
+
+# --- Admin de la bandeja de salida ---
+@admin.register(Outbox)
+class OutboxAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'kind', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('kind', 'subject', 'schedule', 'status', 'attempts', 'next_attempt_at',
+                       'last_error', 'created_at', 'sent_at')
+    exclude = ('_payload', 'claim_token')
+    actions = ['reintentar']
+
+    def reintentar(self, request, queryset):
+        actualizados = queryset.exclude(status=Outbox.SENT).update(
+            status=Outbox.PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f'{actualizados} correos marcados para reenvío.', level='success')
+    reintentar.short_description = "Reintentar envío"
+
+    def has_add_permission(self, request):
+        return False
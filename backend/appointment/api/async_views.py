@@ -0,0 +1,143 @@
+# appointment/api/async_views.py
+"""
+Versiones asíncronas (ASGI) de la consulta de disponibilidad y de la reserva:
+    GET  /api/async/availability/?service=<id>&date_from=YYYY-MM-DD&date_to=YYYY-MM-DD
+    POST /api/async/schedule/
+Mismos parámetros, respuestas y errores que AvailabilityView y
+ScheduleViewSet.create.
+
+  - La disponibilidad se lee con el ORM asíncrono y la caché asíncrona.
+  - El captcha se verifica con un cliente HTTP asíncrono: mientras Google
+    responde, el worker sigue atendiendo otras peticiones.
+  - La reserva (transacción con bloqueo del día) sigue siendo síncrona y
+    se ejecuta en el hilo de sync_to_async. Los correos se encolan en
+    segundo plano, ya con la respuesta enviada.
+
+Bajo WSGI también funcionan, pero cada petición crea su propio event loop.
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import serializers
+
+from appointment import metrics
+from appointment.availability import acalcular_disponibilidad
+from appointment.captcha import CaptchaError, get_verifier
+from appointment.models import Service
+from .serializers import DisponibilidadQuerySerializer, ScheduleSerializer
+from .views import respuesta_disponibilidad
+
+logger = logging.getLogger(__name__)
+
+# El event loop solo guarda referencias débiles a las tareas
+_avisos_pendientes = set()
+
+
+class _ServicioPk(serializers.PrimaryKeyRelatedField):
+    """Solo valida el tipo de la clave; el servicio se busca después con el ORM asíncrono"""
+
+    def to_internal_value(self, data):
+        try:
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class DisponibilidadAsyncQuerySerializer(DisponibilidadQuerySerializer):
+    service = _ServicioPk(queryset=Service.objects.all())
+
+
+@require_GET
+async def disponibilidad(request):
+    params = DisponibilidadAsyncQuerySerializer(data=request.GET)
+    if not params.is_valid():
+        return JsonResponse(params.errors, status=400)
+
+    date_from = params.validated_data['date_from']
+    date_to = params.validated_data['date_to']
+    pk = params.validated_data['service']
+    try:
+        servicio = await Service.objects.aget(pk=pk)
+    except Service.DoesNotExist:
+        mensaje = _ServicioPk.default_error_messages['does_not_exist']
+        return JsonResponse({'service': [str(mensaje).format(pk_value=pk)]}, status=400)
+
+    dias = await acalcular_disponibilidad(servicio, date_from, date_to)
+    return JsonResponse(respuesta_disponibilidad(servicio, date_from, date_to, dias))
+
+
+def _crear_cita(datos):
+    """Validación y reserva con el ORM síncrono; devuelve (cita, cuerpo de la respuesta)"""
+    serializer = ScheduleSerializer(data=datos, context={'notificar': False})
+    try:
+        serializer.is_valid(raise_exception=True)
+        cita = serializer.save()
+    except serializers.ValidationError as e:
+        return None, e.detail
+    return cita, serializer.data
+
+
+def _notificar(cita):
+    try:
+        ScheduleSerializer.notificar(cita)
+    finally:
+        # Hilo del executor, fuera del ciclo de la petición: nadie más cierra sus
+        # conexiones, y close_old_connections() las dejaría abiertas hasta
+        # CONN_MAX_AGE, una por hilo del executor
+        connections.close_all()
+
+
+def _programar_avisos(cita):
+    tarea = asyncio.get_running_loop().create_task(
+        sync_to_async(_notificar, thread_sensitive=False)(cita)
+    )
+    _avisos_pendientes.add(tarea)
+    tarea.add_done_callback(_avisos_pendientes.discard)
+
+
+@csrf_exempt
+@require_POST
+async def reservar_cita(request):
+    try:
+        datos = json.loads(request.body) if request.content_type == 'application/json' else request.POST.dict()
+    except ValueError:
+        return JsonResponse({'detail': 'JSON inválido.'}, status=400)
+    if not isinstance(datos, dict):
+        return JsonResponse({'detail': 'Se esperaba un objeto JSON.'}, status=400)
+
+    captcha_token = datos.get('captchaToken')
+    if not captcha_token:
+        logger.warning("POST sin captcha token")
+        return JsonResponse({'error': 'Captcha token no proporcionado.'}, status=400)
+
+    verificador = get_verifier()
+    with metrics.medir('appointment_captcha_seconds', backend=type(verificador).__name__) as etiquetas:
+        etiquetas['result'] = 'error'
+        try:
+            result = await verificador.averify(captcha_token, request.META.get('REMOTE_ADDR'))
+        except CaptchaError as e:
+            metrics.incrementar('appointment_errors_total', target='captcha')
+            logger.error('Error al validar captcha: %s', e)
+            return JsonResponse({'error': 'Error al validar captcha.'}, status=500)
+        if result.reutilizado:
+            etiquetas['result'] = 'replay'
+        else:
+            etiquetas['result'] = 'ok' if result.success else 'rejected'
+
+    if not result.success:
+        logger.info('Captcha inválido: %s', result.errores)
+        return JsonResponse({'error': 'Falló la verificación de reCAPTCHA.'}, status=400)
+
+    cita, cuerpo = await sync_to_async(_crear_cita)(datos)
+    if cita is None:
+        return JsonResponse(cuerpo, status=400, safe=False)
+
+    _programar_avisos(cita)
+    logger.info('Schedule creado: %s (%s %s)', cuerpo.get('id'), cuerpo.get('date'), cuerpo.get('time'))
+    return JsonResponse(cuerpo, status=201)
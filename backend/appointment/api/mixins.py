@@ -0,0 +1,68 @@
+# appointment/api/mixins.py
+import hashlib
+import json
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from appointment.catalog import clave_catalogo
+
+CATALOGO_TIMEOUT = 60 * 60
+
+
+class CatalogoCacheMixin:
+    """
+    Caché de lectura para viewsets de catálogo (list/retrieve) y vistas que
+    llaman a _respuesta_cacheada().
+
+    La respuesta se guarda bajo la versión actual del catálogo, se sirve con
+    un ETag fuerte calculado sobre su contenido y responde 304 Not Modified
+    cuando el cliente envía If-None-Match con ese mismo ETag.
+
+    Solo los parámetros de cache_params entran en la clave: cualquier otro
+    (?_=123, utm_*, ...) comparte la entrada de la URL sin él, así que un
+    cliente no puede llenar la caché variando la query string.
+    """
+
+    cache_params = ()
+
+    def list(self, request, *args, **kwargs):
+        return self._respuesta_cacheada(request, lambda: super(CatalogoCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._respuesta_cacheada(request, lambda: super(CatalogoCacheMixin, self).retrieve(request, *args, **kwargs))
+
+    def _respuesta_cacheada(self, request, generar, *partes):
+        """
+        `partes` se añade a la clave para lo que la respuesta toma de fuera de
+        la URL (p. ej. el año actual cuando no se indica ?year=)
+        """
+        # El host forma parte de la clave porque las URLs de imágenes son absolutas
+        params = urlencode(sorted((p, v) for p in self.cache_params for v in request.query_params.getlist(p)))
+        clave = clave_catalogo('api', request.get_host(), request.path, params, *partes)
+        entrada = cache.get(clave)
+
+        if entrada is None:
+            response = generar()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            contenido = json.dumps(response.data, cls=JSONEncoder, sort_keys=True, separators=(',', ':'))
+            entrada = (f'"{hashlib.sha256(contenido.encode()).hexdigest()[:32]}"', json.loads(contenido))
+            cache.set(clave, entrada, CATALOGO_TIMEOUT)
+
+        etag, datos = entrada
+        if etag in self._etags_cliente(request):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(datos)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    @staticmethod
+    def _etags_cliente(request):
+        cabecera = request.META.get('HTTP_IF_NONE_MATCH', '')
+        return {etag.strip() for etag in cabecera.split(',') if etag.strip()}
@@ -1,7 +1,14 @@
 # appointment/api/serializers.py
 from rest_framework import serializers
-from appointment.models import Schedule, Service, Weekday, Workinghours, PromoCode, Holiday
+from appointment import metrics, promos
+from appointment.models import Schedule, Service, Weekday, Workinghours, Holiday
 from appointment.utils import enviar_email_confirmacion, enviar_email_notificacion_admin
+from appointment.availability import MAX_DIAS_RANGO
+from appointment.booking import HorarioOcupado, MENSAJE_CONFLICTO, reservar
+from appointment.intervals import intervalo_de_cita, obtener_indice
+from appointment.promos import PromoInvalida
+from datetime import timedelta
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from django.core.exceptions import ValidationError as DjangoValidationError
 import logging
@@ -31,6 +38,8 @@ class ScheduleSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'promo_code': {'read_only': True}
         }
+        # La unicidad (date, time) se resuelve como solapamiento en validate() y en reservar()
+        validators = []
 
     def validate(self, data):
         """
@@ -40,133 +49,125 @@ class ScheduleSerializer(serializers.ModelSerializer):
 
         if promo_code_input:
             try:
-                promo_code = PromoCode.objects.get(
-                    code__iexact=promo_code_input.strip()
-                )
-
-                if not promo_code.active:
-                    raise serializers.ValidationError({
-                        'promo_code': 'El código promocional no está activo.'
-                    })
-
-                if not promo_code.is_valid():
-                    now = timezone.now()
-                    if now < promo_code.valid_from:
-                        raise serializers.ValidationError({
-                            'promo_code': 'El código promocional aún no es válido.'
-                        })
-                    elif now > promo_code.valid_to:
-                        raise serializers.ValidationError({
-                            'promo_code': 'El código promocional ha expirado.'
-                        })
-
-                data['promo_code'] = promo_code
-                data['promo_code_allowed'] = True
-
-                logger.info(f'[OK] Codigo promocional valido: {promo_code.code} ({promo_code.discount_percentage}% descuento)')
-
-            except PromoCode.DoesNotExist:
-                raise serializers.ValidationError({
-                    'promo_code': 'El código promocional no existe.'
-                })
+                promo_code = promos.validar(promo_code_input)
+            except PromoInvalida as e:
+                raise serializers.ValidationError({'promo_code': str(e)})
+
+            data['promo_code'] = promo_code
+            data['promo_code_allowed'] = True
+
+            logger.info('[OK] Codigo promocional valido: %s (%s%% descuento)', promo_code.code, promo_code.discount_percentage)
         else:
             data['promo_code'] = None
             data['promo_code_allowed'] = False
 
-        date = data.get('date')
-        time = data.get('time')
+        date = data.get('date', getattr(self.instance, 'date', None))
+        time = data.get('time', getattr(self.instance, 'time', None))
+        service = data.get('service', getattr(self.instance, 'service', None))
         
-        if date and time:
-            existing_appointments = Schedule.objects.filter(
-                date=date,
-                time=time
-            )
-            
-            if self.instance:
-                existing_appointments = existing_appointments.exclude(pk=self.instance.pk)
-            
-            if existing_appointments.exists():
-                logger.warning(f'[DUPLICATE] Intento de crear cita duplicada para {date} a las {time}')
+        if date and time and service:
+            # La cita ocupa [inicio, inicio + duración): se rechaza cualquier solapamiento
+            inicio, fin = intervalo_de_cita(time, service.duration)
+            excluir = self.instance.pk if self.instance else None
+            with metrics.medir('appointment_booking_seconds', step='overlap_check'):
+                solapa = obtener_indice(date).solapa(inicio, fin, excluir=excluir)
+
+            if solapa:
+                logger.warning('[DUPLICATE] Intento de crear cita solapada para %s a las %s', date, time)
                 
                 raise serializers.ValidationError({
-                    'appointment_conflict': 'Este horario ya ha sido reservado. Por favor, selecciona otro horario disponible.'
+                    'appointment_conflict': MENSAJE_CONFLICTO
                 })
 
         return data
 
     def create(self, validated_data):
-        logger.info(f'[CREATE] Creando nueva cita para {validated_data.get("name")}')
+        logger.info('[CREATE] Creando nueva cita para %s a las %s', validated_data.get('date'), validated_data.get('time'))
 
         name = validated_data.pop('name')
         email = validated_data.pop('email')
         phone = validated_data.pop('phone')
 
-        try:
-            cita = Schedule(**validated_data)
+        cita = Schedule(**validated_data)
+        cita.name = name
+        cita.email = email
+        cita.phone = phone
+        self._reservar(cita, canjear_promo=bool(cita.promo_code))
+
+        logger.info('[OK] Cita %s creada exitosamente para %s a las %s', cita.id, cita.date, cita.time)
 
-            cita.name = name
-            cita.email = email
-            cita.phone = phone
+        # Con context['notificar'] = False los avisos los programa quien llama (vista asíncrona)
+        if self.context.get('notificar', True):
+            self.notificar(cita)
+        return cita
 
-            cita.save()
+    def update(self, instance, validated_data):
+        """
+        Las modificaciones pasan por reservar() igual que las altas: bloqueo del
+        día y comprobación de solapamiento contra la base, sin contar la propia cita
+        """
+        logger.info('[UPDATE] Actualizando cita %s', instance.pk)
+        promo_anterior = instance.promo_code_id
+        for campo, valor in validated_data.items():
+            setattr(instance, campo, valor)
 
-            logger.info(f'[OK] Cita {cita.id} creada exitosamente para {cita.date} a las {cita.time}')
+        # Solo se canjea un uso si la cita cambia a otro código
+        self._reservar(instance, canjear_promo=bool(instance.promo_code_id) and instance.promo_code_id != promo_anterior)
 
-            if cita.promo_code:
-                cita.promo_code.current_uses += 1
-                cita.promo_code.save()
-                logger.info(f'[PROMO] Codigo {cita.promo_code.code} usado. Total usos: {cita.promo_code.current_uses}')
+        logger.info('[OK] Cita %s actualizada para %s a las %s', instance.id, instance.date, instance.time)
+        return instance
 
-            try:
-                logger.info(f'[EMAIL] Intentando enviar email de confirmacion...')
-                email_enviado = enviar_email_confirmacion(cita)
-                if email_enviado:
-                    logger.info(f'[OK] Email de confirmacion enviado a {cita.email} para cita {cita.id}')
-                else:
-                    logger.warning(f'[WARN] No se pudo enviar email a {cita.email} para cita {cita.id}')
-            except Exception as e:
-                logger.error(f'[ERROR] Error al enviar email al cliente para cita {cita.id}: {str(e)}')
-                import traceback
-                logger.error(traceback.format_exc())
+    @staticmethod
+    def _reservar(cita, canjear_promo):
+        """Guarda la cita (y canjea su código) en una transacción; los rechazos se devuelven como errores de validación"""
+        try:
+            with transaction.atomic():
+                # Bloqueo del día + comprobación de solapamiento + guardado, todo atómico
+                with metrics.medir('appointment_booking_seconds', step='reserve'):
+                    reservar(cita)
 
-            try:
-                logger.info(f'[ADMIN] Intentando enviar notificacion al administrador...')
-                notif_enviada = enviar_email_notificacion_admin(cita)
-                if notif_enviada:
-                    logger.info(f'[OK] Notificacion enviada al administrador para cita {cita.id}')
-            except Exception as e:
-                logger.error(f'[ERROR] Error al enviar notificacion al admin para cita {cita.id}: {str(e)}')
-                import traceback
-                logger.error(traceback.format_exc())
+                # Incremento atómico con límites; si falla se deshace también la cita
+                if canjear_promo:
+                    promos.canjear(cita)
+                    logger.info('[PROMO] Codigo %s usado. Total usos: %s', cita.promo_code.code, cita.promo_code.current_uses)
+
+        except PromoInvalida as e:
+            logger.warning('[PROMO] Canje rechazado al confirmar la cita: %s', e)
+            raise serializers.ValidationError({'promo_code': str(e)})
 
-            return cita
+        except (HorarioOcupado, IntegrityError):
+            # IntegrityError: la restricción única (date, time) como última defensa
+            logger.warning('[DUPLICATE] Horario ya reservado al confirmar la cita: %s %s', cita.date, cita.time)
+            raise serializers.ValidationError({'appointment_conflict': MENSAJE_CONFLICTO})
 
         except DjangoValidationError as e:
-            logger.error(f'[ERROR] Error de validacion al crear cita: {str(e)}')
-            
+            logger.error('[ERROR] Error de validacion al guardar cita: %s', e)
             if hasattr(e, 'message_dict'):
-                friendly_errors = {}
-                for field, messages in e.message_dict.items():
-                    if field in ['date', 'time', '__all__'] or 'unique' in str(messages).lower() or 'conjunto único' in str(messages).lower():
-                        friendly_errors['appointment_conflict'] = 'Este horario ya ha sido reservado. Por favor, selecciona otro horario disponible.'
-                        break
-                    else:
-                        friendly_errors[field] = messages
-                
-                if not friendly_errors:
-                    friendly_errors['appointment_conflict'] = 'Este horario ya ha sido reservado. Por favor, selecciona otro horario disponible.'
-                
-                raise serializers.ValidationError(friendly_errors)
+                raise serializers.ValidationError(e.message_dict)
+            raise serializers.ValidationError({
+                'detail': 'Error al guardar la cita. Por favor, intenta nuevamente.'
+            })
+
+    @staticmethod
+    def notificar(cita):
+        """Confirmación al cliente y aviso al administrador de una cita nueva"""
+        try:
+            logger.info('[EMAIL] Intentando enviar email de confirmacion...')
+            email_enviado = enviar_email_confirmacion(cita)
+            if email_enviado:
+                logger.info('[OK] Email de confirmacion encolado para cita %s', cita.id)
             else:
-                error_msg = str(e).lower()
-                if 'unique' in error_msg or 'conjunto único' in error_msg or 'duplicat' in error_msg:
-                    raise serializers.ValidationError({
-                        'appointment_conflict': 'Este horario ya ha sido reservado. Por favor, selecciona otro horario disponible.'
-                    })
-                else:
-                    raise serializers.ValidationError({
-                        'detail': 'Error al crear la cita. Por favor, intenta nuevamente.'
-                    })
+                logger.warning('[WARN] No se pudo enviar email para cita %s', cita.id)
+        except Exception as e:
+            logger.exception('[ERROR] Error al enviar email al cliente para cita %s: %s', cita.id, e)
+
+        try:
+            logger.info('[ADMIN] Intentando enviar notificacion al administrador...')
+            notif_enviada = enviar_email_notificacion_admin(cita)
+            if notif_enviada:
+                logger.info('[OK] Notificacion enviada al administrador para cita %s', cita.id)
+        except Exception as e:
+            logger.exception('[ERROR] Error al enviar notificacion al admin para cita %s: %s', cita.id, e)
 
     def to_representation(self, instance):
         """
@@ -177,6 +178,34 @@ class ScheduleSerializer(serializers.ModelSerializer):
         return ret
 
 
+class OcupacionSerializer(serializers.Serializer):
+    """
+    Representación pública y mínima de una cita: solo indica qué horario está
+    ocupado. Trabaja sobre filas .values() y nunca toca las columnas cifradas.
+    """
+    id = serializers.IntegerField(read_only=True)
+    date = serializers.DateField(read_only=True)
+    time = serializers.TimeField(read_only=True)
+    service = serializers.IntegerField(read_only=True)
+    duration = serializers.DurationField(read_only=True)
+
+
+class OcupacionQuerySerializer(serializers.Serializer):
+    """Valida los filtros del listado público de /api/schedule/"""
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    service = serializers.IntegerField(required=False, min_value=1)
+
+    def validate(self, data):
+        date_from = data.get('date_from')
+        date_to = data.get('date_to')
+        if date_from and date_to and date_to < date_from:
+            raise serializers.ValidationError({
+                'date_to': 'La fecha final debe ser posterior a la fecha inicial.'
+            })
+        return data
+
+
 class ServiceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Service
@@ -207,4 +236,63 @@ class HolidaySerializer(serializers.ModelSerializer):
         """Retorna la fecha formateada"""
         if obj.recurring:
             return f"{obj.date.strftime('%d de %B')} (cada año)"
-        return obj.date.strftime('%d de %B de %Y')
\ No newline at end of file
+        return obj.date.strftime('%d de %B de %Y')
+
+
+class DisponibilidadQuerySerializer(serializers.Serializer):
+    """Valida los parámetros de consulta de /api/availability/"""
+    service = serializers.PrimaryKeyRelatedField(queryset=Service.objects.all())
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, data):
+        date_from = data.get('date_from') or timezone.localdate()
+        date_to = data.get('date_to') or date_from + timedelta(days=30)
+
+        if date_to < date_from:
+            raise serializers.ValidationError({
+                'date_to': 'La fecha final debe ser posterior a la fecha inicial.'
+            })
+
+        if (date_to - date_from).days >= MAX_DIAS_RANGO:
+            raise serializers.ValidationError({
+                'date_to': f'El rango no puede superar {MAX_DIAS_RANGO} días.'
+            })
+
+        data['date_from'] = date_from
+        data['date_to'] = date_to
+        return data
+
+
+
+class BlockedDatesQuerySerializer(serializers.Serializer):
+    """Valida el parámetro year de /api/blocked-dates/"""
+    year = serializers.IntegerField(required=False, min_value=1900, max_value=2999)
+
+
+
+class BootstrapQuerySerializer(serializers.Serializer):
+    """Valida los parámetros de /api/booking-bootstrap/"""
+    year = serializers.IntegerField(required=False, min_value=1900, max_value=2999)
+    month = serializers.IntegerField(required=False, min_value=1, max_value=12)
+    since = serializers.CharField(required=False, allow_blank=True, max_length=64)
+
+
+
+class CustomerLookupQuerySerializer(serializers.Serializer):
+    """Valida los parámetros de /api/customers/lookup/"""
+    q = serializers.CharField(min_length=2, max_length=100, trim_whitespace=True)
+    field = serializers.ChoiceField(choices=['name', 'email', 'phone'], required=False)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=200, default=50)
+
+
+class CustomerLookupSerializer(serializers.ModelSerializer):
+    """Cita encontrada por la búsqueda de clientes (solo administradores)"""
+    name = serializers.CharField(read_only=True)
+    email = serializers.CharField(read_only=True)
+    phone = serializers.CharField(read_only=True)
+    service_name = serializers.CharField(source='service.name', read_only=True)
+
+    class Meta:
+        model = Schedule
+        fields = ['id', 'date', 'time', 'name', 'email', 'phone', 'service', 'service_name']
@@ -1,6 +1,10 @@
 from rest_framework import routers
 from django.urls import path, include
-from .views import ScheduleViewSet, ServiceViewSet, WeekdayViewSet, WorkinghoursViewSet
+from . import async_views
+from .views import (
+    ScheduleViewSet, ServiceViewSet, WeekdayViewSet, WorkinghoursViewSet, AvailabilityView, BlockedDatesView,
+    BookingBootstrapView, CustomerLookupView,
+)
 
 router = routers.DefaultRouter()
 router.register(r'schedule', ScheduleViewSet)
@@ -9,5 +13,11 @@ router.register(r'weekday', WeekdayViewSet)
 router.register(r'workinghours', WorkinghoursViewSet)
 
 urlpatterns = [
+    path('availability/', AvailabilityView.as_view(), name='availability'),
+    path('blocked-dates/', BlockedDatesView.as_view(), name='blocked-dates'),
+    path('booking-bootstrap/', BookingBootstrapView.as_view(), name='booking-bootstrap'),
+    path('customers/lookup/', CustomerLookupView.as_view(), name='customer-lookup'),
+    path('async/availability/', async_views.disponibilidad, name='async-availability'),
+    path('async/schedule/', async_views.reservar_cita, name='async-schedule'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
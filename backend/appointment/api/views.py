@@ -1,17 +1,63 @@
 # appointment/api/views.py
-import requests
-from django.conf import settings
-from rest_framework import status, viewsets
+from django.db.models import F
+from django.utils import timezone
+from django.utils.duration import duration_string
+from rest_framework import permissions, status, viewsets
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
-from appointment.models import Schedule, Service, Weekday, Workinghours
-from .serializers import ScheduleSerializer, ServiceSerializer, WeekdaySerializer, WorkinghoursSerializer
+from rest_framework.views import APIView
+from appointment import blind_index, bootstrap, metrics
+from appointment.availability import calcular_disponibilidad
+from appointment.captcha import CaptchaError, get_verifier
+from appointment.models import Holiday, Schedule, Service, Weekday, Workinghours
+from .mixins import CatalogoCacheMixin
+from .serializers import (
+    ScheduleSerializer, ServiceSerializer, WeekdaySerializer, WorkinghoursSerializer,
+    DisponibilidadQuerySerializer, OcupacionSerializer, OcupacionQuerySerializer,
+    BlockedDatesQuerySerializer, BootstrapQuerySerializer,
+    CustomerLookupQuerySerializer, CustomerLookupSerializer,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+class OcupacionPagination(CursorPagination):
+    """Paginación por cursor: el coste por página no crece con el tamaño de la tabla"""
+    ordering = ('date', 'time')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
 class ScheduleViewSet(viewsets.ModelViewSet):
     queryset = Schedule.objects.all()
     serializer_class = ScheduleSerializer
+    pagination_class = OcupacionPagination
+
+    def get_queryset(self):
+        if self.action != 'list':
+            return super().get_queryset()
+
+        params = OcupacionQuerySerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        filtros = params.validated_data
+
+        # Solo columnas no cifradas: el listado público nunca desencripta
+        queryset = Schedule.objects.values('id', 'date', 'time', 'service').annotate(
+            duration=F('service__duration')
+        )
+        if 'date_from' in filtros:
+            queryset = queryset.filter(date__gte=filtros['date_from'])
+        if 'date_to' in filtros:
+            queryset = queryset.filter(date__lte=filtros['date_to'])
+        if 'service' in filtros:
+            queryset = queryset.filter(service_id=filtros['service'])
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return OcupacionSerializer
+        return super().get_serializer_class()
 
     def create(self, request, *args, **kwargs):
         captcha_token = request.data.get('captchaToken')
@@ -19,19 +65,23 @@ class ScheduleViewSet(viewsets.ModelViewSet):
             logger.warning("POST sin captcha token")
             return Response({'error': 'Captcha token no proporcionado.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            # Validar token con Google reCAPTCHA
-            r = requests.post('https://www.google.com/recaptcha/api/siteverify', data={
-                'secret': settings.RECAPTCHA_SECRET_KEY,
-                'response': captcha_token
-            })
-            result = r.json()
-        except Exception as e:
-            logger.error(f"Error al validar captcha: {e}")
-            return Response({'error': 'Error al validar captcha.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        if not result.get('success'):
-            logger.info(f"Captcha inválido: {result}")
+        verificador = get_verifier()
+        with metrics.medir('appointment_captcha_seconds', backend=type(verificador).__name__) as etiquetas:
+            etiquetas['result'] = 'error'
+            try:
+                # Validar token con el verificador configurado (reCAPTCHA por defecto)
+                result = verificador.verify(captcha_token, request.META.get('REMOTE_ADDR'))
+            except CaptchaError as e:
+                metrics.incrementar('appointment_errors_total', target='captcha')
+                logger.error('Error al validar captcha: %s', e)
+                return Response({'error': 'Error al validar captcha.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            if result.reutilizado:
+                etiquetas['result'] = 'replay'
+            else:
+                etiquetas['result'] = 'ok' if result.success else 'rejected'
+
+        if not result.success:
+            logger.info('Captcha inválido: %s', result.errores)
             return Response({'error': 'Falló la verificación de reCAPTCHA.'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Crear Schedule
@@ -40,20 +90,139 @@ class ScheduleViewSet(viewsets.ModelViewSet):
         self.perform_create(serializer)
         headers = self.get_success_headers(serializer.data)
 
-        logger.info(f"Schedule creado: {serializer.data}")
+        logger.info('Schedule creado: %s (%s %s)', serializer.data.get('id'), serializer.data.get('date'),
+                    serializer.data.get('time'))
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(CatalogoCacheMixin, viewsets.ModelViewSet):
     queryset = Service.objects.all()
     serializer_class = ServiceSerializer
 
 
-class WeekdayViewSet(viewsets.ModelViewSet):
+class WeekdayViewSet(CatalogoCacheMixin, viewsets.ModelViewSet):
     queryset = Weekday.objects.all()
     serializer_class = WeekdaySerializer
 
-class WorkinghoursViewSet(viewsets.ModelViewSet):
+class WorkinghoursViewSet(CatalogoCacheMixin, viewsets.ModelViewSet):
     queryset = Workinghours.objects.all()
     serializer_class = WorkinghoursSerializer
 
+
+
+class AvailabilityView(APIView):
+    """
+    Devuelve solo los horarios libres de un servicio en un rango de fechas:
+    GET /api/availability/?service=<id>&date_from=YYYY-MM-DD&date_to=YYYY-MM-DD
+    """
+
+    def get(self, request):
+        params = DisponibilidadQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        servicio = params.validated_data['service']
+        date_from = params.validated_data['date_from']
+        date_to = params.validated_data['date_to']
+
+        dias = calcular_disponibilidad(servicio, date_from, date_to)
+
+        return Response(respuesta_disponibilidad(servicio, date_from, date_to, dias))
+
+
+def respuesta_disponibilidad(servicio, date_from, date_to, dias):
+    """Cuerpo de /api/availability/ (compartido con la vista asíncrona)"""
+    return {
+        'service': servicio.id,
+        'duration': duration_string(servicio.duration),
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'days': [
+            {'date': dia['date'].isoformat(), 'slots': dia['slots']}
+            for dia in dias
+        ],
+    }
+
+
+class BlockedDatesView(CatalogoCacheMixin, APIView):
+    """
+    Días festivos (bloqueados) de un año completo, leídos del índice en caché:
+    GET /api/blocked-dates/?year=YYYY
+    Con ETag y 304 como el resto del catálogo; cambiar un Holiday lo invalida.
+    """
+
+    def get(self, request):
+        params = BlockedDatesQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        year = params.validated_data.get('year') or timezone.localdate().year
+        return self._respuesta_cacheada(request, lambda: self._festivos(year), year)
+
+    @staticmethod
+    def _festivos(year):
+        fechas = Holiday.fechas_del_año(year)
+        return Response({
+            'success': True,
+            'year': year,
+            'blocked_dates': [
+                {'date': fecha.isoformat(), 'name': nombre}
+                for fecha, nombre in sorted(fechas.items())
+            ],
+        })
+
+
+class BookingBootstrapView(APIView):
+    """
+    Todo lo que necesita la página de reservas en una sola petición:
+    GET /api/booking-bootstrap/?year=YYYY&month=M[&since=<version>]
+    Con `since` (el campo version de una respuesta anterior) solo se envía lo que cambió.
+    """
+
+    def get(self, request):
+        params = BootstrapQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        hoy = timezone.localdate()
+        year = params.validated_data.get('year') or hoy.year
+        month = params.validated_data.get('month') or hoy.month
+
+        datos = bootstrap.construir(
+            year, month, lambda: self._serializar_catalogo(request),
+            since=params.validated_data.get('since'), host=request.get_host(),
+        )
+        return Response(datos)
+
+    @staticmethod
+    def _serializar_catalogo(request):
+        contexto = {'request': request}
+        return {
+            'services': ServiceSerializer(Service.objects.all(), many=True, context=contexto).data,
+            'weekdays': WeekdaySerializer(Weekday.objects.all(), many=True, context=contexto).data,
+            'workinghours': WorkinghoursSerializer(Workinghours.objects.all(), many=True, context=contexto).data,
+        }
+
+
+class CustomerLookupView(APIView):
+    """
+    Búsqueda parcial de clientes por nombre, email o teléfono (solo administradores):
+    GET /api/customers/lookup/?q=juan[&field=name][&limit=50]
+    Se resuelve con el índice ciego; solo se desencriptan las citas encontradas.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        params = CustomerLookupQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        campo = params.validated_data.get('field')
+        limite = params.validated_data['limit']
+
+        ids = blind_index.buscar(
+            params.validated_data['q'],
+            campos=(campo,) if campo else blind_index.CAMPOS,
+        )
+        citas = list(
+            Schedule.objects.filter(pk__in=ids).select_related('service').order_by('-date', '-time')[:limite]
+        )
+        Schedule.descifrar_lote(citas)
+
+        return Response({
+            'count': len(ids),
+            'results': CustomerLookupSerializer(citas, many=True).data,
+        })
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class AppointmentConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'appointment'
+
+    def ready(self):
+        # Registrar las señales de la app
+        from . import signals  # noqa: F401
+        from . import checks  # noqa: F401
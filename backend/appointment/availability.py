@@ -0,0 +1,175 @@
+# appointment/availability.py
+"""
+Motor de disponibilidad: calcula en el servidor los horarios libres
+para un servicio dentro de un rango de fechas.
+
+El backend no tiene un modelo de descansos: un descanso fijo (p. ej. la
+comida) se define con dos registros de Workinghours para el mismo día,
+09:00-13:00 y 15:00-19:00, y los horarios se generan por separado dentro de
+cada uno. Los descansos que Calendario.jsx pide a /api/breaks/ (ruta que
+este backend no expone) se siguen aplicando solo en el navegador.
+"""
+import asyncio
+from collections import defaultdict
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .intervals import aobtener_indices, obtener_indices
+from .models import Holiday, Weekday, Workinghours
+
+# Rango máximo (en días) que se puede consultar en una sola petición
+MAX_DIAS_RANGO = 62
+
+
+def a_minutos(valor):
+    """Convierte un time en minutos desde la medianoche"""
+    return valor.hour * 60 + valor.minute
+
+
+def minutos_a_hora(minutos):
+    """Convierte minutos desde la medianoche en 'HH:MM'"""
+    return f'{minutos // 60:02d}:{minutos % 60:02d}'
+
+
+def duracion_en_minutos(duracion):
+    """Convierte un timedelta (Service.duration) en minutos enteros"""
+    if not duracion:
+        return 0
+    return int(duracion.total_seconds() // 60)
+
+
+def fusionar_intervalos(intervalos):
+    """Fusiona intervalos [inicio, fin) solapados o contenidos uno dentro de otro"""
+    fusionados = []
+    for inicio, fin in sorted(intervalos):
+        if fusionados and inicio < fusionados[-1][1]:
+            fusionados[-1][1] = max(fusionados[-1][1], fin)
+        else:
+            fusionados.append([inicio, fin])
+    return fusionados
+
+
+def espacios_libres(ocupados, inicio_laboral, fin_laboral):
+    """Calcula los huecos libres de un horario laboral dados los bloques ocupados"""
+    libres = []
+    cursor = inicio_laboral
+    for inicio, fin in fusionar_intervalos(ocupados):
+        if fin <= cursor:
+            continue
+        if inicio >= fin_laboral:
+            break
+        if inicio > cursor:
+            libres.append((cursor, inicio))
+        cursor = max(cursor, fin)
+    if cursor < fin_laboral:
+        libres.append((cursor, fin_laboral))
+    return libres
+
+
+def generar_horarios(libres, duracion):
+    """Genera los inicios de cita posibles dentro de cada hueco libre"""
+    horarios = []
+    for inicio, fin in libres:
+        minuto = inicio
+        while minuto + duracion <= fin:
+            horarios.append(minuto)
+            minuto += duracion
+    return horarios
+
+
+def _horario_semanal(dias_activos, horarios):
+    """{dia_id: [(inicio, fin), ...]} en minutos, solo de los días activos"""
+    horarios_por_dia = defaultdict(list)
+    for dia_id, inicio, fin in horarios:
+        if dia_id in dias_activos:
+            horarios_por_dia[dia_id].append((a_minutos(inicio), a_minutos(fin)))
+    return horarios_por_dia
+
+
+def _fechas_laborables(fecha_inicio, fecha_fin, horarios_por_dia, festivos):
+    """Fechas del rango (desde hoy) con horario y que no son festivo"""
+    fechas = []
+    fecha = max(fecha_inicio, timezone.localdate())
+    while fecha <= fecha_fin:
+        if horarios_por_dia.get(fecha.isoweekday()) and fecha not in festivos[fecha.year]:
+            fechas.append(fecha)
+        fecha += timedelta(days=1)
+    return fechas
+
+
+def _años(fecha_inicio, fecha_fin):
+    return range(max(fecha_inicio, timezone.localdate()).year, fecha_fin.year + 1)
+
+
+def _huecos(fechas, indices, horarios_por_dia, duracion):
+    ahora = timezone.localtime()
+    hoy = ahora.date()
+    minuto_actual = a_minutos(ahora)
+
+    resultado = []
+    for fecha in fechas:
+        ocupados = indices[fecha].intervalos()
+        minutos = set()
+        for inicio_laboral, fin_laboral in horarios_por_dia[fecha.isoweekday()]:
+            libres = espacios_libres(ocupados, inicio_laboral, fin_laboral)
+            minutos.update(generar_horarios(libres, duracion))
+
+        if fecha == hoy:
+            minutos = {m for m in minutos if m >= minuto_actual}
+
+        if minutos:
+            resultado.append({
+                'date': fecha,
+                'slots': [minutos_a_hora(m) for m in sorted(minutos)],
+            })
+
+    return resultado
+
+
+def calcular_disponibilidad(servicio, fecha_inicio, fecha_fin):
+    """
+    Devuelve una lista [{'date': fecha, 'slots': ['HH:MM', ...]}] con los
+    horarios libres para el servicio entre fecha_inicio y fecha_fin (incluidas).
+    Solo se incluyen los días con al menos un horario libre.
+    """
+    duracion = duracion_en_minutos(servicio.duration)
+    if duracion <= 0:
+        return []
+
+    horarios_por_dia = _horario_semanal(
+        set(Weekday.objects.filter(status=True).values_list('id', flat=True)),
+        Workinghours.objects.values_list('day_id', 'start_time', 'end_time'),
+    )
+    festivos = {año: Holiday.fechas_del_año(año) for año in _años(fecha_inicio, fecha_fin)}
+    fechas = _fechas_laborables(fecha_inicio, fecha_fin, horarios_por_dia, festivos)
+
+    # Índices de intervalos compartidos con la validación de reservas
+    # (solo columnas no cifradas: nunca se desencripta nada para calcular disponibilidad)
+    indices = obtener_indices(fechas) if fechas else {}
+    return _huecos(fechas, indices, horarios_por_dia, duracion)
+
+
+async def _alista(queryset):
+    return [fila async for fila in queryset]
+
+
+async def acalcular_disponibilidad(servicio, fecha_inicio, fecha_fin):
+    """calcular_disponibilidad con el ORM y la caché asíncronos (vistas ASGI)"""
+    duracion = duracion_en_minutos(servicio.duration)
+    if duracion <= 0:
+        return []
+
+    # Lecturas independientes a la vez: cada una es un viaje al hilo del ORM
+    años = _años(fecha_inicio, fecha_fin)
+    dias_activos, horarios, *festivos_por_año = await asyncio.gather(
+        _alista(Weekday.objects.filter(status=True).values_list('id', flat=True)),
+        _alista(Workinghours.objects.values_list('day_id', 'start_time', 'end_time')),
+        *(Holiday.afechas_del_año(año) for año in años),
+    )
+    horarios_por_dia = _horario_semanal(set(dias_activos), horarios)
+    festivos = dict(zip(años, festivos_por_año))
+    fechas = _fechas_laborables(fecha_inicio, fecha_fin, horarios_por_dia, festivos)
+
+    indices = await aobtener_indices(fechas) if fechas else {}
+    return _huecos(fechas, indices, horarios_por_dia, duracion)
@@ -0,0 +1,178 @@
+# appointment/blind_index.py
+"""
+Índice ciego (blind index) para buscar por nombre, email o teléfono sin
+desencriptar la tabla completa.
+
+Al guardar una cita (en el on_commit de su transacción, y solo si cambió
+algún campo cifrado) se normaliza cada campo y se guardan en SearchToken los
+HMAC-SHA256 (clave propia, derivada de FERNET_KEY si no se define
+BLIND_INDEX_KEY) de:
+  - 'p': los prefijos de cada palabra (nombre) o del valor completo (email,
+    teléfono), desde MIN_PREFIJO hasta MAX_PREFIJO caracteres;
+  - 'g': los trigramas del valor completo, para coincidencias intermedias.
+
+Una búsqueda de menos de 3 caracteres usa solo prefijos. Con 3 o más se
+exige que la cita tenga todos los trigramas del término y después se
+descifran únicamente esos candidatos para descartar falsos positivos.
+"""
+import hashlib
+import hmac
+import re
+import unicodedata
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import Count
+from django.dispatch import receiver
+
+from .models import Schedule, SearchToken
+
+MIN_PREFIJO = 2
+MAX_PREFIJO = 16
+TAMAÑO_GRAMA = 3
+LONGITUD_TOKEN = 32
+# Candidatos que se descifran por consulta al verificar un término
+LOTE_CANDIDATOS = 500
+
+CAMPOS = (SearchToken.NAME, SearchToken.EMAIL, SearchToken.PHONE)
+
+
+@lru_cache(maxsize=1)
+def _clave():
+    clave = getattr(settings, 'BLIND_INDEX_KEY', None)
+    if clave:
+        return clave.encode() if isinstance(clave, str) else clave
+    base = settings.FERNET_KEY
+    base = base.encode() if isinstance(base, str) else base
+    # Clave independiente de la de cifrado: nunca se usa la misma para ambas cosas
+    return hmac.new(base, b'appointment.blind_index', hashlib.sha256).digest()
+
+
+@receiver(setting_changed)
+def _reiniciar_clave(setting, **kwargs):
+    if setting in ('BLIND_INDEX_KEY', 'FERNET_KEY'):
+        _clave.cache_clear()
+
+
+def normalizar(campo, valor):
+    """Minúsculas, sin acentos ni espacios repetidos; el teléfono solo dígitos"""
+    if not valor:
+        return ''
+    if campo == SearchToken.PHONE:
+        return re.sub(r'\D', '', valor)
+    valor = unicodedata.normalize('NFKD', valor)
+    valor = ''.join(c for c in valor if not unicodedata.combining(c))
+    return ' '.join(valor.lower().split())
+
+
+def token(campo, tipo, fragmento):
+    mensaje = f'{campo}:{tipo}:{fragmento}'.encode()
+    return hmac.new(_clave(), mensaje, hashlib.sha256).hexdigest()[:LONGITUD_TOKEN]
+
+
+def _prefijos(texto):
+    return {texto[:n] for n in range(MIN_PREFIJO, min(len(texto), MAX_PREFIJO) + 1)}
+
+
+def _gramas(texto):
+    return {texto[i:i + TAMAÑO_GRAMA] for i in range(len(texto) - TAMAÑO_GRAMA + 1)}
+
+
+def fragmentos(campo, valor):
+    """Conjunto de (tipo, fragmento) que se indexan para un valor"""
+    texto = normalizar(campo, valor)
+    if not texto:
+        return set()
+    palabras = texto.split() if campo == SearchToken.NAME else [texto]
+    if campo == SearchToken.EMAIL:
+        # También el usuario sin dominio, para buscar "juan" en "juan.perez@..."
+        palabras += re.split(r'[^a-z0-9]+', texto.split('@')[0])
+    resultado = {('p', prefijo) for palabra in palabras if palabra for prefijo in _prefijos(palabra)}
+    resultado |= {('g', grama) for grama in _gramas(texto)}
+    return resultado
+
+
+def tokens_de(cita):
+    """Filas SearchToken (sin guardar) de una cita"""
+    filas = []
+    for campo in CAMPOS:
+        for tipo, fragmento in fragmentos(campo, getattr(cita, campo)):
+            filas.append(SearchToken(schedule_id=cita.pk, field=campo, token=token(campo, tipo, fragmento)))
+    return filas
+
+
+def indexar(cita):
+    """Reemplaza los tokens de una cita (se llama al confirmar su guardado)"""
+    with transaction.atomic():
+        SearchToken.objects.filter(schedule_id=cita.pk).delete()
+        SearchToken.objects.bulk_create(tokens_de(cita))
+
+
+def reindexar(citas, batch_size=500):
+    """
+    Reconstruye el índice de un iterable de citas ya desencriptadas
+    (p. ej. queryset.decrypted()). Devuelve cuántas citas procesó.
+    """
+    total = 0
+    lote = []
+
+    def volcar():
+        with transaction.atomic():
+            SearchToken.objects.filter(schedule_id__in=[cita.pk for cita in lote]).delete()
+            SearchToken.objects.bulk_create(
+                [fila for cita in lote for fila in tokens_de(cita)], batch_size=2000
+            )
+
+    for cita in citas:
+        lote.append(cita)
+        if len(lote) >= batch_size:
+            volcar()
+            total += len(lote)
+            lote = []
+    if lote:
+        volcar()
+        total += len(lote)
+    return total
+
+
+def _candidatos(campo, texto):
+    """Ids de citas cuyo índice contiene el término (puede haber falsos positivos)"""
+    if len(texto) < TAMAÑO_GRAMA:
+        buscados = {token(campo, 'p', texto)}
+    else:
+        buscados = {token(campo, 'g', grama) for grama in _gramas(texto)}
+    return (
+        SearchToken.objects.filter(token__in=buscados)
+        .values('schedule_id')
+        .annotate(coincidencias=Count('token', distinct=True))
+        .filter(coincidencias=len(buscados))
+        .values_list('schedule_id', flat=True)
+    )
+
+
+def buscar(termino, campos=CAMPOS, lote=LOTE_CANDIDATOS):
+    """
+    Ids de las citas cuyo nombre, email o teléfono contiene `termino`.
+    Solo se descifran los candidatos que devuelve el índice, de `lote` en
+    `lote`: un término poco selectivo tarda más, pero no pierde resultados.
+    """
+    encontrados = set()
+    for campo in campos:
+        texto = normalizar(campo, termino)
+        if len(texto) < MIN_PREFIJO:
+            continue
+        ids = list(_candidatos(campo, texto))
+        if not ids:
+            continue
+        if len(texto) < TAMAÑO_GRAMA:
+            # Un prefijo de palabra coincide exactamente: no hace falta verificar
+            encontrados.update(ids)
+            continue
+        for inicio in range(0, len(ids), lote):
+            citas = Schedule.objects.filter(pk__in=ids[inicio:inicio + lote])
+            for cita in citas.only('pk', *Schedule.COLUMNAS_CIFRADAS).decrypted():
+                if texto in normalizar(campo, getattr(cita, campo)):
+                    encontrados.add(cita.pk)
+    return encontrados
@@ -0,0 +1,132 @@
+# appointment/booking.py
+"""
+Reserva atómica de horarios.
+
+Check-then-insert fuera de una transacción permite que dos peticiones
+simultáneas reserven el mismo horario. Aquí la reserva se hace dentro de una
+transacción que primero escribe en la fila DayLock del día (bloqueo de fila
+en Postgres, bloqueo de escritura en SQLite), vuelve a comprobar el
+solapamiento contra la base de datos y solo entonces guarda la cita. La
+restricción única (date, time) de Schedule queda como última defensa.
+
+La cancelación masiva (cancelar) borra todas las citas en una transacción y
+envía (o encola) los avisos cuando el borrado ya está confirmado.
+"""
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .intervals import IndiceDia, intervalo_de_cita
+from .models import DayLock, Schedule
+from .utils import email_cancelacion, encolar_emails
+
+logger = logging.getLogger('appointment.booking')
+
+MENSAJE_CONFLICTO = 'Este horario ya ha sido reservado. Por favor, selecciona otro horario disponible.'
+
+
+# Resultado por cita de cancelar()
+CANCELACION_AVISADA = 'avisada'
+CANCELACION_PASADA = 'pasada'
+CANCELACION_ERROR = 'error'
+
+
+class HorarioOcupado(Exception):
+    """El horario solicitado se solapa con otra cita"""
+
+
+def bloquear_dia(fecha):
+    """
+    Toma el bloqueo del día dentro de la transacción en curso.
+    La primera sentencia es una escritura para no quedar esperando con un
+    bloqueo de lectura en SQLite.
+    """
+    actualizadas = DayLock.objects.filter(date=fecha).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    )
+    if not actualizadas:
+        try:
+            with transaction.atomic():
+                DayLock.objects.create(date=fecha, version=1)
+        except IntegrityError:
+            # Otra transacción creó la fila primero: esperar su bloqueo
+            DayLock.objects.filter(date=fecha).update(
+                version=F('version') + 1, updated_at=timezone.now()
+            )
+
+
+def reservar(cita):
+    """
+    Guarda la cita si su intervalo está libre; si no, lanza HorarioOcupado.
+    Debe llamarse dentro de transaction.atomic() o abrirá una propia.
+    """
+    with transaction.atomic():
+        bloquear_dia(cita.date)
+        # El día ya queda marcado como modificado; la señal post_save no lo repite
+        cita._dia_bloqueado = True
+
+        filas = Schedule.objects.filter(date=cita.date).values_list(
+            'pk', 'time', 'service__duration'
+        )
+        indice = IndiceDia((*intervalo_de_cita(hora, duracion), pk) for pk, hora, duracion in filas)
+        inicio, fin = intervalo_de_cita(cita.time, cita.service.duration)
+        if indice.solapa(inicio, fin, excluir=cita.pk):
+            raise HorarioOcupado(f'{cita.date} {cita.time}')
+
+        try:
+            with transaction.atomic():
+                cita.save()
+        except IntegrityError as e:
+            raise HorarioOcupado(f'{cita.date} {cita.time}') from e
+
+    return cita
+
+
+def cancelar(queryset):
+    """
+    Elimina las citas del queryset y avisa a los clientes con cita de hoy en
+    adelante. Las citas se leen (y desencriptan) en una sola consulta, se
+    borran en una transacción y los correos se encolan en bloque en su
+    on_commit: con EMAIL_OUTBOX=False se envían por SMTP, y dentro de la
+    transacción mantendrían bloqueadas las filas mientras tanto. Si la
+    transacción (o una exterior) se deshace no sale ningún correo.
+
+    Devuelve una lista de (cita, estado, detalle) con estado
+    CANCELACION_AVISADA, CANCELACION_PASADA o CANCELACION_ERROR. Dentro de
+    una transacción exterior los avisos aún no se han encolado al volver y
+    figuran como CANCELACION_AVISADA; los fallos posteriores solo se registran.
+    """
+    citas = Schedule.descifrar_lote(queryset.select_related('service').order_by('date', 'time'))
+    if not citas:
+        return []
+
+    hoy = timezone.localdate()
+    plantilla = get_template('emails/cancelacion_cita.html')
+    resultados = {}
+    mensajes, avisadas = [], []
+    for cita in citas:
+        if cita.date < hoy:
+            resultados[cita.pk] = (CANCELACION_PASADA, '')
+            continue
+        try:
+            mensajes.append(email_cancelacion(cita, plantilla))
+            avisadas.append(cita)
+        except Exception as e:
+            resultados[cita.pk] = (CANCELACION_ERROR, str(e))
+
+    def avisar():
+        for cita, (ok, error) in zip(avisadas, encolar_emails(mensajes)):
+            if not ok:
+                logger.error('[CANCEL] No se pudo avisar la cancelación de la cita %s: %s', cita.pk, error)
+            resultados[cita.pk] = (CANCELACION_AVISADA, '') if ok else (CANCELACION_ERROR, error)
+
+    for cita in avisadas:
+        resultados[cita.pk] = (CANCELACION_AVISADA, '')
+    with transaction.atomic():
+        Schedule.objects.filter(pk__in=[cita.pk for cita in citas]).delete()
+        transaction.on_commit(avisar)
+
+    return [(cita, *resultados[cita.pk]) for cita in citas]
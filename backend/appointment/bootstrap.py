@@ -0,0 +1,136 @@
+# appointment/bootstrap.py
+"""
+Datos iniciales de la página de reservas en una sola respuesta.
+
+El token de versión tiene la forma "<versión catálogo>-<marca ms>-<AAAAMM>".
+Con él el cliente puede pedir solo lo que cambió:
+  - si el token es del mismo mes y la versión del catálogo no cambió, el
+    catálogo (que incluye los festivos del mes) se omite;
+  - si el token es del mismo mes, la ocupación se limita a los días cuyo
+    DayLock se modificó después de la marca (delta).
+
+Servicios, días y horarios se serializan en la capa api: la vista pasa a
+construir() la función que los devuelve y aquí solo se decide si hace falta
+y se guarda en caché.
+"""
+import calendar
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from django.utils.duration import duration_string
+
+from .catalog import clave_catalogo, version_catalogo
+from .models import DayLock, Holiday, Schedule, Weekday, Workinghours
+
+# Margen para no perder reservas cuya transacción seguía abierta al generar el token
+MARGEN_DELTA = timedelta(seconds=30)
+CATALOGO_TIMEOUT = 60 * 60
+
+
+def generar_token(version, instante, year, month):
+    return f'{version}-{int(instante.timestamp() * 1000)}-{year:04d}{month:02d}'
+
+
+def leer_token(token):
+    """Devuelve (versión catálogo, instante, (año, mes)) o None si el token no es válido"""
+    try:
+        version, marca, periodo = token.split('-')
+        instante = datetime.fromtimestamp(int(marca) / 1000, tz=dt_timezone.utc)
+        return int(version), instante, (int(periodo[:4]), int(periodo[4:]))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _horas_semanales():
+    """{isoweekday: [['HH:MM', 'HH:MM'], ...]} solo para días activos"""
+    activos = set(Weekday.objects.filter(status=True).values_list('id', flat=True))
+    horas = defaultdict(list)
+    for dia_id, inicio, fin in Workinghours.objects.order_by('day_id', 'start_time').values_list(
+            'day_id', 'start_time', 'end_time'):
+        if dia_id in activos:
+            horas[str(dia_id)].append([inicio.strftime('%H:%M'), fin.strftime('%H:%M')])
+    return dict(horas)
+
+
+def catalogo(year, month, serializar, host=''):
+    """
+    Servicios, días, horarios y festivos del mes; cacheado por versión de catálogo.
+    `serializar()` devuelve {'services', 'weekdays', 'workinghours'} ya serializados.
+    El host forma parte de la clave porque las URLs de imágenes son absolutas.
+    """
+    clave = clave_catalogo('bootstrap', host, year, month)
+    datos = cache.get(clave)
+    if datos is not None:
+        return datos
+
+    festivos = Holiday.fechas_del_año(year)
+    datos = {
+        **serializar(),
+        'hours': _horas_semanales(),
+        'blocked_dates': [
+            {'date': fecha.isoformat(), 'name': nombre}
+            for fecha, nombre in sorted(festivos.items())
+            if fecha.month == month
+        ],
+    }
+    # Listas simples: las ReturnList de DRF no se guardan bien en caché
+    datos = {clave_: list(valor) if isinstance(valor, list) else valor for clave_, valor in datos.items()}
+    cache.set(clave, datos, CATALOGO_TIMEOUT)
+    return datos
+
+
+def ocupacion(fechas=None, desde=None, hasta=None):
+    """Citas (sin datos personales) de un conjunto de fechas o de un rango"""
+    queryset = Schedule.objects.order_by('date', 'time')
+    if fechas is not None:
+        queryset = queryset.filter(date__in=fechas)
+    else:
+        queryset = queryset.filter(date__range=(desde, hasta))
+    return [
+        {
+            'id': fila['id'],
+            'date': fila['date'].isoformat(),
+            'time': fila['time'].strftime('%H:%M:%S'),
+            'service': fila['service'],
+            'duration': duration_string(fila['duration']) if fila['duration'] is not None else None,
+        }
+        for fila in queryset.values('id', 'date', 'time', 'service').annotate(duration=F('service__duration'))
+    ]
+
+
+def construir(year, month, serializar_catalogo, since=None, host=''):
+    """Arma la respuesta completa o delta de /api/booking-bootstrap/ (ver catalogo())"""
+    ahora = timezone.now()
+    version = version_catalogo()
+    primer_dia = date(year, month, 1)
+    ultimo_dia = date(year, month, calendar.monthrange(year, month)[1])
+
+    previo = leer_token(since) if since else None
+    respuesta = {
+        'year': year,
+        'month': month,
+        'version': generar_token(version, ahora, year, month),
+    }
+
+    mismo_mes = previo is not None and previo[2] == (year, month)
+    if not mismo_mes or previo[0] != version:
+        respuesta['catalog'] = catalogo(year, month, serializar_catalogo, host)
+
+    if mismo_mes:
+        cambiados = list(
+            DayLock.objects.filter(
+                date__range=(primer_dia, ultimo_dia),
+                updated_at__gt=previo[1] - MARGEN_DELTA,
+            ).order_by('date').values_list('date', flat=True)
+        )
+        respuesta['delta'] = True
+        respuesta['changed_dates'] = [fecha.isoformat() for fecha in cambiados]
+        respuesta['occupancy'] = ocupacion(fechas=cambiados) if cambiados else []
+    else:
+        respuesta['delta'] = False
+        respuesta['occupancy'] = ocupacion(desde=primer_dia, hasta=ultimo_dia)
+
+    return respuesta
@@ -0,0 +1,214 @@
+# appointment/captcha.py
+"""
+Verificación de captcha intercambiable.
+
+El backend se elige con settings.CAPTCHA_BACKEND:
+  - RecaptchaVerifier: Google reCAPTCHA con sesión HTTP reutilizada,
+    timeouts estrictos y rechazo de tokens ya presentados (anti-replay).
+  - StubCaptchaVerifier: local, sin red, para pruebas y benchmarks.
+
+verify() es síncrono (vistas WSGI); averify() no bloquea el event loop
+(vistas ASGI): reCAPTCHA usa un cliente httpx asíncrono por event loop,
+que se cierra al terminar el loop.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger('appointment.captcha')
+
+
+class CaptchaError(Exception):
+    """El servicio de verificación no respondió o respondió algo inválido"""
+
+
+@dataclass
+class ResultadoCaptcha:
+    success: bool
+    errores: list = field(default_factory=list)
+    reutilizado: bool = False
+
+
+class CaptchaVerifier:
+    """Interfaz común de los verificadores"""
+
+    def verify(self, token, remote_ip=None):
+        raise NotImplementedError
+
+    async def averify(self, token, remote_ip=None):
+        """Por defecto, verify() en un hilo aparte"""
+        return await sync_to_async(self.verify, thread_sensitive=False)(token, remote_ip)
+
+
+async def _cerrar_con_el_loop(cliente):
+    """
+    Generador asíncrono que se queda suspendido mientras viva el loop. Antes de
+    cerrarlo, asyncio.run(), async_to_sync (una vez por petición bajo WSGI) y
+    uvicorn llaman a loop.shutdown_asyncgens(), que lo cierra y con él el
+    cliente httpx y sus conexiones.
+    """
+    try:
+        yield
+    finally:
+        await cliente.aclose()
+
+
+class RecaptchaVerifier(CaptchaVerifier):
+    URL = 'https://www.google.com/recaptcha/api/siteverify'
+    CACHE_PREFIX = 'captcha'
+
+    def __init__(self):
+        self.secret = settings.RECAPTCHA_SECRET_KEY
+        self.timeout = (
+            getattr(settings, 'CAPTCHA_CONNECT_TIMEOUT', 2.0),
+            getattr(settings, 'CAPTCHA_READ_TIMEOUT', 4.0),
+        )
+        self.pool_size = getattr(settings, 'CAPTCHA_POOL_SIZE', 4)
+        self.replay_ttl = getattr(settings, 'CAPTCHA_REPLAY_TTL', 120)
+        self.max_conexiones_async = getattr(settings, 'CAPTCHA_ASYNC_MAX_CONNECTIONS', 100)
+        self._local = threading.local()
+        self._clientes = weakref.WeakKeyDictionary()
+
+    @property
+    def session(self):
+        """Sesión HTTP por hilo: mantiene abierta la conexión TLS entre reservas"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('https://', adapter)
+            self._local.session = session
+        return session
+
+    async def cliente_async(self):
+        """
+        Cliente httpx del event loop actual: las conexiones no se comparten
+        entre loops. Se cierra cuando el loop termina (ver _cerrar_con_el_loop).
+        """
+        loop = asyncio.get_running_loop()
+        entrada = self._clientes.get(loop)
+        if entrada is None:
+            conectar, leer = self.timeout
+            cliente = httpx.AsyncClient(
+                timeout=httpx.Timeout(leer, connect=conectar),
+                limits=httpx.Limits(
+                    max_connections=self.max_conexiones_async, max_keepalive_connections=self.pool_size
+                ),
+            )
+            cierre = _cerrar_con_el_loop(cliente)
+            await cierre.asend(None)
+            # El loop solo guarda una referencia débil al generador: se conserva aquí
+            entrada = self._clientes[loop] = (cliente, cierre)
+        return entrada[0]
+
+    def _clave(self, token):
+        # Solo se guarda el hash: el token no se conserva en claro
+        return f'{self.CACHE_PREFIX}:{hashlib.sha256(token.encode()).hexdigest()}'
+
+    def _reutilizado(self):
+        logger.warning('[CAPTCHA] Token ya presentado, se rechaza')
+        return ResultadoCaptcha(success=False, errores=['timeout-or-duplicate'], reutilizado=True)
+
+    def verify(self, token, remote_ip=None):
+        # add() es atómico: de dos peticiones con el mismo token solo una llega a Google.
+        # Un token de reCAPTCHA caduca a los 2 minutos, así que basta recordarlo ese tiempo
+        clave = self._clave(token)
+        if not cache.add(clave, True, self.replay_ttl):
+            return self._reutilizado()
+
+        datos = {'secret': self.secret, 'response': token}
+        if remote_ip:
+            datos['remoteip'] = remote_ip
+
+        try:
+            r = self.session.post(self.URL, data=datos, timeout=self.timeout)
+            r.raise_for_status()
+            result = r.json()
+        except (requests.RequestException, ValueError) as e:
+            # Google no llegó a ver el token: el usuario puede reintentar con él
+            cache.delete(clave)
+            raise CaptchaError(str(e)) from e
+
+        if result.get('success'):
+            return ResultadoCaptcha(success=True)
+        return ResultadoCaptcha(success=False, errores=result.get('error-codes', []))
+
+    async def averify(self, token, remote_ip=None):
+        clave = self._clave(token)
+        if not await cache.aadd(clave, True, self.replay_ttl):
+            return self._reutilizado()
+
+        datos = {'secret': self.secret, 'response': token}
+        if remote_ip:
+            datos['remoteip'] = remote_ip
+
+        try:
+            cliente = await self.cliente_async()
+            r = await cliente.post(self.URL, data=datos)
+            r.raise_for_status()
+            result = r.json()
+        except (httpx.HTTPError, ValueError) as e:
+            await cache.adelete(clave)
+            raise CaptchaError(str(e)) from e
+
+        if result.get('success'):
+            return ResultadoCaptcha(success=True)
+        return ResultadoCaptcha(success=False, errores=result.get('error-codes', []))
+
+
+class StubCaptchaVerifier(CaptchaVerifier):
+    """
+    Verificador local: acepta cualquier token salvo los listados en
+    CAPTCHA_STUB_REJECT. CAPTCHA_STUB_LATENCY (segundos) simula el viaje de red.
+    """
+
+    def __init__(self):
+        self.rechazados = set(getattr(settings, 'CAPTCHA_STUB_REJECT', ['invalid']))
+        self.latencia = getattr(settings, 'CAPTCHA_STUB_LATENCY', 0)
+
+    def _resultado(self, token):
+        if token in self.rechazados:
+            return ResultadoCaptcha(success=False, errores=['invalid-input-response'])
+        return ResultadoCaptcha(success=True)
+
+    def verify(self, token, remote_ip=None):
+        if self.latencia:
+            time.sleep(self.latencia)
+        return self._resultado(token)
+
+    async def averify(self, token, remote_ip=None):
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+        return self._resultado(token)
+
+
+@lru_cache(maxsize=None)
+def _cargar(ruta):
+    return import_string(ruta)()
+
+
+def get_verifier():
+    """Devuelve (y reutiliza) el verificador configurado en CAPTCHA_BACKEND"""
+    return _cargar(getattr(settings, 'CAPTCHA_BACKEND', 'appointment.captcha.RecaptchaVerifier'))
+
+
+@receiver(setting_changed)
+def _reiniciar_verificador(setting, **kwargs):
+    """Permite cambiar de backend con override_settings en pruebas y benchmarks"""
+    if setting.startswith('CAPTCHA_') or setting == 'RECAPTCHA_SECRET_KEY':
+        _cargar.cache_clear()
@@ -0,0 +1,55 @@
+# appointment/catalog.py
+"""
+Versión de los datos de catálogo (servicios, días, horarios y festivos).
+
+Estas tablas cambian pocas veces al año. Las respuestas que dependen de ellas
+se guardan en caché bajo la versión actual, y las señales de los modelos
+incrementan la versión para invalidarlas todas de una vez.
+
+version()/invalidar() implementan ese contador para cualquier prefijo: lo
+usan también los códigos promocionales, los índices de ocupación y los festivos.
+"""
+from django.core.cache import cache
+
+CACHE_PREFIX = 'catalogo'
+
+
+def version(prefijo):
+    """Versión vigente de las claves de caché de un prefijo"""
+    clave = f'{prefijo}:version'
+    actual = cache.get(clave)
+    if actual is None:
+        actual = 1
+        cache.add(clave, actual, None)
+    return actual
+
+
+async def aversion(prefijo):
+    """Como version(), con la caché asíncrona"""
+    clave = f'{prefijo}:version'
+    actual = await cache.aget(clave)
+    if actual is None:
+        actual = 1
+        await cache.aadd(clave, actual, None)
+    return actual
+
+
+def invalidar(prefijo):
+    """Incrementa la versión: las claves anteriores del prefijo dejan de leerse"""
+    try:
+        cache.incr(f'{prefijo}:version')
+    except ValueError:
+        cache.set(f'{prefijo}:version', 2, None)
+
+
+def version_catalogo():
+    return version(CACHE_PREFIX)
+
+
+def invalidar_catalogo():
+    invalidar(CACHE_PREFIX)
+
+
+def clave_catalogo(*partes):
+    """Clave de caché ligada a la versión actual del catálogo"""
+    return ':'.join([CACHE_PREFIX, str(version_catalogo()), *map(str, partes)])
@@ -0,0 +1,31 @@
+# appointment/checks.py
+"""
+Comprobaciones de despliegue (`python manage.py check --deploy`).
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backends cuyo contenido no ven los demás workers
+CACHES_LOCALES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches, deploy=True)
+def cache_compartida(app_configs, **kwargs):
+    """
+    La versión del catálogo, los índices de festivos y los tokens de captcha
+    ya usados viven en la caché: con una caché por proceso, un worker sigue
+    sirviendo datos que otro ya invalidó y un token puede repetirse en otro worker.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend in CACHES_LOCALES:
+        return [
+            Error(
+                f'La caché por defecto ({backend}) no se comparte entre workers.',
+                hint='Define CACHE_URL (redis://...) o CACHE_DIR para usar una caché compartida.',
+                id='appointment.E001',
+            )
+        ]
+    return []
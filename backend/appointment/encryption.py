@@ -1,34 +1,253 @@
 # appointment/encryption.py
-from cryptography.fernet import Fernet
+"""
+Cifrado de campos con Fernet y soporte de varias claves (MultiFernet).
+
+settings.FERNET_KEYS lista las claves de la más nueva a la más antigua: se
+cifra siempre con la primera y se desencripta con cualquiera, lo que permite
+rotar la clave y re-cifrar los datos después con `manage.py rotar_claves`.
+
+Formato de sobre (opcional, settings.PII_ENVELOPE): todos los datos
+personales de una fila se sellan juntos en un único AES-256-GCM,
+    v1:<id de clave>:<base64url(nonce || cifrado || tag)>
+con una clave derivada por HKDF de cada clave Fernet. Ocupa alrededor de un
+tercio que tres tokens Fernet y exige una sola operación por fila.
+"""
+import base64
+import hashlib
+import json
+import os
+
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from django.conf import settings
 
-class FieldEncryptor:
+from . import metrics
+
+logger = logging.getLogger('appointment.encryption')
+
+# Todo token Fernet empieza por la versión 0x80 en base64
+PREFIJO_FERNET = b'gAAAAA'
+
+VERSION_SOBRE = 'v1'
+PREFIJO_SOBRE = f'{VERSION_SOBRE}:'
+_INFO_SOBRE = b'appointment:pii:' + VERSION_SOBRE.encode()
+
+
+def _clave_sobre(clave_fernet):
+    """(id, AESGCM) derivados de una clave Fernet"""
+    material = base64.urlsafe_b64decode(clave_fernet)
+    clave = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=_INFO_SOBRE).derive(material)
+    return hashlib.sha256(clave).hexdigest()[:8], AESGCM(clave)
+
+
+class ContadorCifrado:
+    """Cuenta las operaciones de cifrado hechas dentro de un contexto (p. ej. una petición)"""
+
     def __init__(self):
-        key = settings.FERNET_KEY
-        if isinstance(key, str):
-            key = key.encode()
-        self.fernet = Fernet(key)
-    
+        self.descifrados = 0
+        self.cifrados = 0
+
+
+# Contador activo en el contexto actual (None si nadie está midiendo)
+_contador_actual = contextvars.ContextVar('contador_cifrado', default=None)
+
+
+@contextmanager
+def contar_operaciones():
+    """Mide cuántas veces se cifra/desencripta dentro del bloque"""
+    contador = ContadorCifrado()
+    token = _contador_actual.set(contador)
+    try:
+        yield contador
+    finally:
+        _contador_actual.reset(token)
+
+
+def claves_configuradas():
+    """Claves Fernet de la más nueva a la más antigua"""
+    claves = getattr(settings, 'FERNET_KEYS', None) or [settings.FERNET_KEY]
+    if isinstance(claves, str):
+        claves = claves.split(',')
+    return [c.strip().encode() if isinstance(c, str) else c for c in claves if c and c.strip()]
+
+
+class FieldEncryptor:
+    def __init__(self, claves=None):
+        claves = claves or claves_configuradas()
+        self.claves = [Fernet(c) for c in claves]
+        self.primaria = self.claves[0]
+        self.fernet = MultiFernet(self.claves)
+
+        # Claves AES-GCM del formato de sobre, por id; la primera es la de escritura
+        derivadas = [_clave_sobre(c) for c in claves]
+        self.id_sobre = derivadas[0][0]
+        self.claves_sobre = dict(derivadas)
+
+        # Totales del proceso, además del contador por contexto
+        self._lock = threading.Lock()
+        self.total_descifrados = 0
+        self.total_cifrados = 0
+        self.total_fallidos = 0
+
+    def _registrar(self, descifrados=0, cifrados=0):
+        with self._lock:
+            self.total_descifrados += descifrados
+            self.total_cifrados += cifrados
+        contador = _contador_actual.get()
+        if contador is not None:
+            contador.descifrados += descifrados
+            contador.cifrados += cifrados
+
     def encrypt(self, value):
         """Encripta un valor"""
         if value is None or value == '':
             return ''
         if isinstance(value, str):
             value = value.encode()
-        encrypted = self.fernet.encrypt(value)
+        with metrics.medir('appointment_crypto_seconds', op='encrypt'):
+            encrypted = self.fernet.encrypt(value)
+        self._registrar(cifrados=1)
         return encrypted.decode()
-    
+
+    def _decrypt(self, value):
+        if value is None or value == '':
+            return ''
+        texto = value if isinstance(value, str) else value.decode(errors='replace')
+        token = value.encode() if isinstance(value, str) else value
+        if not token.startswith(PREFIJO_FERNET):
+            # Dato heredado de antes del cifrado: se devuelve tal cual
+            return texto
+        try:
+            return self.fernet.decrypt(token).decode()
+        except (InvalidToken, UnicodeDecodeError):
+            # Ninguna clave configurada lo abre: nunca se devuelve el texto cifrado
+            with self._lock:
+                self.total_fallidos += 1
+            logger.error('[CIFRADO] No se pudo desencriptar un valor con ninguna de las %d claves', len(self.claves))
+            return ''
+
     def decrypt(self, value):
         """Desencripta un valor"""
         if value is None or value == '':
             return ''
-        if isinstance(value, str):
-            value = value.encode()
+        self._registrar(descifrados=1)
+        with metrics.medir('appointment_crypto_seconds', op='decrypt'):
+            return self._decrypt(value)
+
+    def decrypt_many(self, values, workers=None):
+        """
+        Desencripta una lista de valores en una sola pasada, opcionalmente
+        repartida en un pool de hilos. Devuelve los resultados en el mismo orden.
+        """
+        values = list(values)
+        pendientes = sum(1 for v in values if v)
+        with metrics.medir('appointment_crypto_seconds', op='decrypt_many'):
+            if workers and workers > 1 and len(values) > workers:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    resultados = list(pool.map(self._decrypt, values))
+            else:
+                resultados = [self._decrypt(v) for v in values]
+        self._registrar(descifrados=pendientes)
+        return resultados
+
+    # --- Formato de sobre: varios campos en un único AES-GCM ---
+    def seal(self, datos):
+        """Sella un dict de textos en un sobre v1 con la clave primaria"""
+        plano = json.dumps(datos, separators=(',', ':'), ensure_ascii=False).encode()
+        nonce = os.urandom(12)
+        with metrics.medir('appointment_crypto_seconds', op='seal'):
+            cifrado = self.claves_sobre[self.id_sobre].encrypt(nonce, plano, _INFO_SOBRE)
+        self._registrar(cifrados=1)
+        cuerpo = base64.urlsafe_b64encode(nonce + cifrado).rstrip(b'=').decode()
+        return f'{PREFIJO_SOBRE}{self.id_sobre}:{cuerpo}'
+
+    def _abrir(self, sobre):
+        """Abre un sobre o lanza KeyError/ValueError/InvalidTag"""
+        version, id_clave, cuerpo = sobre.split(':', 2)
+        if version != VERSION_SOBRE:
+            raise ValueError(f'versión de sobre desconocida: {version}')
+        aes = self.claves_sobre[id_clave]
+        datos = base64.urlsafe_b64decode(cuerpo + '=' * (-len(cuerpo) % 4))
+        return json.loads(aes.decrypt(datos[:12], datos[12:], _INFO_SOBRE))
+
+    def _open(self, sobre):
+        if not sobre:
+            return {}
         try:
-            decrypted = self.fernet.decrypt(value)
-            return decrypted.decode()
-        except Exception as e:
-            return value if isinstance(value, str) else ''
+            return self._abrir(sobre)
+        except (KeyError, ValueError, InvalidTag) as e:
+            with self._lock:
+                self.total_fallidos += 1
+            logger.error('[CIFRADO] No se pudo abrir un sobre: %s', e.__class__.__name__)
+            return {}
+
+    def open(self, sobre):
+        """Abre un sobre v1; devuelve {} si no hay sobre o no se puede abrir"""
+        if not sobre:
+            return {}
+        self._registrar(descifrados=1)
+        with metrics.medir('appointment_crypto_seconds', op='open'):
+            return self._open(sobre)
+
+    def open_many(self, sobres, workers=None):
+        """Como decrypt_many, para sobres"""
+        sobres = list(sobres)
+        pendientes = sum(1 for v in sobres if v)
+        with metrics.medir('appointment_crypto_seconds', op='open_many'):
+            if workers and workers > 1 and len(sobres) > workers:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    resultados = list(pool.map(self._open, sobres))
+            else:
+                resultados = [self._open(v) for v in sobres]
+        self._registrar(descifrados=pendientes)
+        return resultados
+
+    def rotate(self, value):
+        """
+        Re-cifra con la clave primaria en un solo paso: devuelve el valor
+        nuevo, o None si ya estaba cifrado con la primaria (o vacío). Cada
+        clave se prueba una vez y el texto solo se desencripta una vez. Los
+        datos heredados en claro se cifran; los que ninguna clave abre se dejan
+        igual y lanzan InvalidToken.
+        """
+        if not value:
+            return None
+        if isinstance(value, str) and value.startswith(PREFIJO_SOBRE):
+            if value.split(':', 2)[1] == self.id_sobre:
+                return None
+            try:
+                datos = self._abrir(value)
+            except (KeyError, ValueError, InvalidTag) as e:
+                raise InvalidToken from e
+            self._registrar(descifrados=1)
+            return self.seal(datos)
+        token = value.encode() if isinstance(value, str) else value
+        if not token.startswith(PREFIJO_FERNET):
+            nuevo = self.primaria.encrypt(token)
+            self._registrar(cifrados=1)
+            return nuevo.decode()
+        for posicion, clave in enumerate(self.claves):
+            try:
+                plano = clave.decrypt(token)
+            except InvalidToken:
+                continue
+            if posicion == 0:
+                return None
+            # Conserva la marca de tiempo del token original, como MultiFernet.rotate
+            nuevo = self.primaria.encrypt_at_time(plano, clave.extract_timestamp(token))
+            self._registrar(descifrados=1, cifrados=1)
+            return nuevo.decode()
+        raise InvalidToken
+
 
 # Instancia global
-encryptor = FieldEncryptor()
\ No newline at end of file
+encryptor = FieldEncryptor()
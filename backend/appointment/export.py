@@ -0,0 +1,100 @@
+# appointment/export.py
+"""
+Exportación de citas con memoria constante.
+
+Las citas se leen por bloques (.iterator), con servicio y código
+promocional en la misma consulta, y cada bloque se desencripta de una vez.
+  - CSV: se genera fila a fila directamente sobre la respuesta.
+  - Excel: openpyxl en modo write-only escribe las filas a disco y el
+    archivo resultante se envía por partes.
+"""
+import csv
+import tempfile
+
+import openpyxl
+from django.http import StreamingHttpResponse
+
+ENCABEZADOS = ['Cliente', 'Teléfono', 'Fecha', 'Hora', 'Servicio', 'Código promocional']
+CHUNK_SIZE = 500
+# Tamaño de cada trozo al enviar el .xlsx ya generado
+BLOQUE_ARCHIVO = 64 * 1024
+
+
+# Excel, LibreOffice y Sheets interpretan como fórmula una celda que empieza así
+INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _neutralizar(valor):
+    """Antepone ' a los textos que una hoja de cálculo ejecutaría como fórmula"""
+    if valor and valor.startswith(INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def filas(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Filas de exportación ya desencriptadas, leídas por bloques. Los textos
+    que escribe el cliente (nombre, teléfono) y los del catálogo se
+    neutralizan para que no se abran como fórmulas ni en CSV ni en Excel.
+    """
+    citas = (
+        queryset.select_related('service', 'promo_code')
+        .order_by('date', 'time')
+        .decrypted(chunk_size=chunk_size)
+    )
+    for cita in citas:
+        yield [
+            _neutralizar(cita.name),
+            _neutralizar(cita.phone),
+            cita.date.strftime('%Y-%m-%d'),
+            cita.time.strftime('%H:%M'),
+            _neutralizar(cita.service.name),
+            _neutralizar(cita.promo_code.code) if cita.promo_code else '',
+        ]
+
+
+class _Eco:
+    """Objeto tipo archivo que devuelve lo escrito en vez de guardarlo"""
+
+    def write(self, valor):
+        return valor
+
+
+def _csv(queryset, chunk_size):
+    escritor = csv.writer(_Eco())
+    # BOM para que Excel abra el archivo como UTF-8
+    yield '\ufeff' + escritor.writerow(ENCABEZADOS)
+    for fila in filas(queryset, chunk_size):
+        yield escritor.writerow(fila)
+
+
+def respuesta_csv(queryset, nombre='citas.csv', chunk_size=CHUNK_SIZE):
+    response = StreamingHttpResponse(_csv(queryset, chunk_size), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename={nombre}'
+    return response
+
+
+def _xlsx(queryset, chunk_size):
+    with tempfile.TemporaryFile() as archivo:
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet("Citas")
+        ws.append(ENCABEZADOS)
+        for fila in filas(queryset, chunk_size):
+            ws.append(fila)
+        wb.save(archivo)
+
+        archivo.seek(0)
+        while True:
+            bloque = archivo.read(BLOQUE_ARCHIVO)
+            if not bloque:
+                break
+            yield bloque
+
+
+def respuesta_excel(queryset, nombre='citas.xlsx', chunk_size=CHUNK_SIZE):
+    response = StreamingHttpResponse(
+        _xlsx(queryset, chunk_size),
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+    response['Content-Disposition'] = f'attachment; filename={nombre}'
+    return response
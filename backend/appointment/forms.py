@@ -8,7 +8,7 @@ class ScheduleAdminForm(forms.ModelForm):
 
     class Meta:
         model = Schedule
-        exclude = ('_name', '_email', '_phone',)
+        exclude = ('_name', '_email', '_phone', '_pii',)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
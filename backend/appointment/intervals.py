@@ -0,0 +1,176 @@
+# appointment/intervals.py
+"""
+Índice de intervalos por día para detectar solapamientos de citas.
+
+Cada cita ocupa el intervalo [inicio, fin) en minutos, calculado a partir de
+su hora y de Service.duration. Los índices se guardan en la caché de Django
+y las señales de Schedule descartan el del día afectado cuando se confirma
+un cambio, de modo que la disponibilidad solo consulta el día completo la
+primera vez que se pide tras una reserva.
+"""
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import catalog
+
+CACHE_PREFIX = 'ocupacion'
+CACHE_TIMEOUT = getattr(settings, 'OCCUPANCY_INDEX_TIMEOUT', 300)
+
+
+def _minutos(valor):
+    return valor.hour * 60 + valor.minute
+
+
+def _duracion(duracion):
+    return int(duracion.total_seconds() // 60) if duracion else 0
+
+
+class IndiceDia:
+    """
+    Intervalos [inicio, fin) de las citas de un día ordenados por inicio.
+
+    Además de los inicios se mantiene el máximo acumulado de los finales, así
+    la pregunta "¿[inicio, fin) se solapa con alguna cita?" se responde con
+    una búsqueda binaria aunque existan citas antiguas solapadas entre sí.
+    """
+
+    def __init__(self, citas=()):
+        self._citas = sorted(citas)  # tuplas (inicio, fin, pk)
+        self._reconstruir()
+
+    def _reconstruir(self):
+        self._inicios = [inicio for inicio, _, _ in self._citas]
+        self._max_fin = []
+        maximo = 0
+        for _, fin, _ in self._citas:
+            maximo = max(maximo, fin)
+            self._max_fin.append(maximo)
+
+    def __len__(self):
+        return len(self._citas)
+
+    def agregar(self, inicio, fin, pk=None):
+        """Inserta una cita (si ya existía con la misma pk se reemplaza)"""
+        if pk is not None:
+            self._citas = [c for c in self._citas if c[2] != pk]
+        insort(self._citas, (inicio, fin, pk), key=lambda c: (c[0], c[1]))
+        self._reconstruir()
+
+    def quitar(self, pk):
+        """Elimina la cita con la pk indicada; devuelve True si existía"""
+        total = len(self._citas)
+        self._citas = [c for c in self._citas if c[2] != pk]
+        if len(self._citas) == total:
+            return False
+        self._reconstruir()
+        return True
+
+    def solapa(self, inicio, fin, excluir=None):
+        """
+        Indica si [inicio, fin) se solapa con alguna cita del día.
+        Con `excluir` (pk de la cita que se edita) se recorre la lista.
+        """
+        if excluir is not None:
+            return any(
+                c_inicio < fin and inicio < c_fin
+                for c_inicio, c_fin, pk in self._citas if pk != excluir
+            )
+        # Citas que empiezan antes de `fin`; se solapa si alguna termina después de `inicio`
+        limite = bisect_left(self._inicios, fin)
+        return limite > 0 and self._max_fin[limite - 1] > inicio
+
+    def intervalos(self):
+        """Lista de intervalos ocupados (inicio, fin) en orden"""
+        return [(inicio, fin) for inicio, fin, _ in self._citas]
+
+
+def _clave(fecha, version=None):
+    return f'{CACHE_PREFIX}:{version or catalog.version(CACHE_PREFIX)}:{fecha.isoformat()}'
+
+
+def _construir(fechas):
+    """Construye los índices de varias fechas con una sola consulta"""
+    from .models import Schedule
+
+    citas = defaultdict(list)
+    filas = Schedule.objects.filter(date__in=fechas).values_list(
+        'pk', 'date', 'time', 'service__duration'
+    )
+    for pk, fecha, hora, duracion in filas:
+        citas[fecha].append((*intervalo_de_cita(hora, duracion), pk))
+    return {fecha: IndiceDia(citas[fecha]) for fecha in fechas}
+
+
+def obtener_indices(fechas):
+    """Devuelve {fecha: IndiceDia} leyendo de caché y construyendo solo los que falten"""
+    fechas = list(fechas)
+    version = catalog.version(CACHE_PREFIX)
+    claves = {_clave(fecha, version): fecha for fecha in fechas}
+    encontrados = cache.get_many(claves.keys())
+
+    indices = {claves[clave]: indice for clave, indice in encontrados.items()}
+    faltantes = [fecha for fecha in fechas if fecha not in indices]
+    if faltantes:
+        nuevos = _construir(faltantes)
+        cache.set_many({_clave(f, version): i for f, i in nuevos.items()}, CACHE_TIMEOUT)
+        indices.update(nuevos)
+    return indices
+
+
+def obtener_indice(fecha):
+    """Devuelve el IndiceDia de una fecha"""
+    return obtener_indices([fecha])[fecha]
+
+
+# --- Versiones asíncronas (vistas ASGI): caché y ORM asíncronos ---
+async def _aconstruir(fechas):
+    from .models import Schedule
+
+    citas = defaultdict(list)
+    filas = Schedule.objects.filter(date__in=fechas).values_list(
+        'pk', 'date', 'time', 'service__duration'
+    )
+    async for pk, fecha, hora, duracion in filas:
+        citas[fecha].append((*intervalo_de_cita(hora, duracion), pk))
+    return {fecha: IndiceDia(citas[fecha]) for fecha in fechas}
+
+
+async def aobtener_indices(fechas):
+    """Como obtener_indices, sin bloquear el event loop"""
+    fechas = list(fechas)
+    version = await catalog.aversion(CACHE_PREFIX)
+    claves = {_clave(fecha, version): fecha for fecha in fechas}
+    encontrados = await cache.aget_many(claves.keys())
+
+    indices = {claves[clave]: indice for clave, indice in encontrados.items()}
+    faltantes = [fecha for fecha in fechas if fecha not in indices]
+    if faltantes:
+        nuevos = await _aconstruir(faltantes)
+        await cache.aset_many({_clave(f, version): i for f, i in nuevos.items()}, CACHE_TIMEOUT)
+        indices.update(nuevos)
+    return indices
+
+
+def intervalo_de_cita(hora, duracion):
+    """Intervalo [inicio, fin) en minutos para una hora y una duración"""
+    inicio = _minutos(hora)
+    return inicio, inicio + _duracion(duracion)
+
+
+def descartar_dias(*fechas):
+    """
+    Borra de la caché los índices de esas fechas tras guardar o eliminar una
+    cita; la siguiente lectura los reconstruye desde la base. Modificar el
+    índice en caché (get + set) no es atómico: dos reservas simultáneas
+    podían pisarse y dejar fuera una de las citas.
+    """
+    version = catalog.version(CACHE_PREFIX)
+    cache.delete_many([_clave(fecha, version) for fecha in fechas])
+
+
+def invalidar_indices():
+    """Descarta todos los índices (p. ej. al cambiar la duración de un servicio)"""
+    catalog.invalidar(CACHE_PREFIX)
@@ -0,0 +1,170 @@
+# appointment/log.py
+"""
+Logging sin E/S en el hilo de la petición.
+
+ManejadorCola (un QueueHandler) solo copia el registro a una cola en memoria;
+un QueueListener en segundo plano lo pasa a los destinos reales:
+  - archivo JSON (un objeto por línea) con rotación por tamaño;
+  - consola en texto plano.
+Ambos destinos llevan FiltroPII, que enmascara emails y teléfonos en el
+mensaje, en la traza y en los campos `extra` antes de escribir. Los nombres
+no tienen un formato reconocible: las instancias con columnas cifradas
+(Schedule, cuyo __str__ incluye el nombre) que se pasan como argumentos se
+escriben como <Schedule pk>, pero un nombre metido en el texto del mensaje
+o de una excepción no se detecta; el código de la app registra solo ids.
+
+Con la cola llena el registro se descarta (y se cuenta en
+appointment_log_dropped_total) en lugar de bloquear la petición.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import re
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from . import metrics
+
+EMAIL = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+# 8-13 dígitos seguidos (con prefijo internacional opcional) o en grupos 2-4-4
+TELEFONO = re.compile(r'(?<![\d-])(?:\+?\d{1,3}[\s-]?)?(?:\d{8,10}|\d{2,3}[\s-]\d{4}[\s-]\d{4})(?![\d-])')
+
+# Atributos propios de LogRecord: todo lo demás viene de `extra`
+_ATRIBUTOS_BASE = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def redactar(texto):
+    """Enmascara emails y números de teléfono de un texto"""
+    if not texto:
+        return texto
+    return TELEFONO.sub('<telefono>', EMAIL.sub('<email>', texto))
+
+
+def _sin_instancias_pii(args):
+    """Sustituye en los argumentos del registro las instancias con columnas cifradas por su pk"""
+    def sustituir(valor):
+        if hasattr(type(valor), 'COLUMNAS_CIFRADAS'):
+            return f'<{type(valor).__name__} {valor.pk}>'
+        return valor
+
+    if isinstance(args, dict):
+        return {clave: sustituir(valor) for clave, valor in args.items()}
+    return tuple(sustituir(valor) for valor in args)
+
+
+class FiltroPII(logging.Filter):
+    """Reescribe el registro sin datos personales (nunca lo descarta)"""
+
+    def filter(self, record):
+        if record.args:
+            record.args = _sin_instancias_pii(record.args)
+        record.msg = redactar(record.getMessage())
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        if record.exc_text:
+            record.exc_text = redactar(record.exc_text)
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_BASE and isinstance(valor, str):
+                setattr(record, clave, redactar(valor))
+        return True
+
+
+class FormatoJSON(logging.Formatter):
+    """Un objeto JSON por línea; los campos de `extra` se añaden tal cual"""
+
+    def format(self, record):
+        datos = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_BASE:
+                datos[clave] = valor
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            datos['exc'] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class ManejadorCola(QueueHandler):
+    """
+    Handler para settings.LOGGING. Crea sus destinos (archivo JSON rotativo y,
+    opcionalmente, consola) y el listener que los alimenta. `destinos` permite
+    pasar handlers ya construidos en su lugar (pruebas y benchmarks).
+
+    Cada proceso tiene su propio listener: con varios workers conviene un
+    archivo por worker o rotar desde fuera (max_bytes=0).
+    """
+
+    def __init__(self, filename='django.log', max_bytes=10 * 1024 * 1024, backup_count=5,
+                 consola=True, capacidad=10000, destinos=None):
+        super().__init__(queue.Queue(capacidad))
+        if destinos is None:
+            archivo = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                          encoding='utf-8', delay=True)
+            archivo.setFormatter(FormatoJSON())
+            destinos = [archivo]
+            if consola:
+                texto = logging.StreamHandler()
+                texto.setFormatter(logging.Formatter('%(levelname)s %(name)s %(message)s'))
+                destinos.append(texto)
+        filtro = FiltroPII()
+        for destino in destinos:
+            destino.addFilter(filtro)
+        self.destinos = destinos
+        self.capacidad = capacidad
+        self.listener = None
+        self._iniciar()
+        atexit.register(self.close)
+
+    def _iniciar(self):
+        self._pid = os.getpid()
+        self.listener = QueueListener(self.queue, *self.destinos, respect_handler_level=True)
+        self.listener.start()
+
+    def prepare(self, record):
+        # Solo lo imprescindible en el hilo de la petición: fijar el mensaje
+        # (los argumentos pueden cambiar después) y la traza de la excepción
+        record = copy.copy(record)
+        if record.args:
+            record.args = _sin_instancias_pii(record.args)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if os.getpid() != self._pid:
+            # Proceso hijo (fork): el hilo del listener no sobrevive a la copia
+            self.queue = queue.Queue(self.capacidad)
+            self._iniciar()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incrementar('appointment_log_dropped_total', logger=record.name)
+
+    def flush(self):
+        """Espera a que el listener escriba todo lo encolado"""
+        if self.listener is not None and os.getpid() == self._pid:
+            self.listener.stop()
+            self._iniciar()
+
+    def close(self):
+        if self.listener is not None and os.getpid() == self._pid:
+            self.listener.stop()
+            self.listener = None
+            for destino in self.destinos:
+                destino.close()
+        super().close()
@@ -0,0 +1,262 @@
+# appointment/management/commands/bench_asgi.py
+# Disponibilidad y reserva con muchos clientes a la vez: vistas WSGI (gunicorn) frente a las asíncronas (uvicorn)
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, time as dtime, timedelta
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from appointment import intervals
+from appointment.models import DayLock, Outbox, Schedule, SearchToken, Service
+
+MARCA = 'bench_asgi'
+AÑO = 2095
+HUECOS_POR_DIA = 72  # cada 10 minutos de 08:00 a 20:00
+DIAS_CONSULTA = 30
+
+# Rutas de cada servidor: (disponibilidad, reserva)
+RUTAS = {
+    'wsgi': ('/api/availability/', '/api/schedule/'),
+    'asgi': ('/api/async/availability/', '/api/async/schedule/'),
+}
+
+
+def _hueco(n, dias):
+    dia, hueco = n % dias, n // dias
+    return date(AÑO, 1, 1) + timedelta(days=dia), dtime(8 + hueco // 6, (hueco % 6) * 10)
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados)) - 1))]
+
+
+class ConexionHTTP:
+    """
+    Cliente HTTP/1.1 mínimo con keep-alive sobre asyncio. httpx con 200
+    conexiones gasta más CPU por petición que el propio servidor, y en la
+    misma máquina eso falsearía la comparación.
+    """
+
+    def __init__(self, host, puerto):
+        self.host, self.puerto = host, puerto
+        self.lector = self.escritor = None
+
+    async def pedir(self, metodo, ruta, cuerpo=b''):
+        """Devuelve el código de estado; el cuerpo se lee y se descarta"""
+        if self.escritor is None:
+            self.lector, self.escritor = await asyncio.open_connection(self.host, self.puerto)
+        self.escritor.write(
+            f'{metodo} {ruta} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {len(cuerpo)}\r\n\r\n'.encode() + cuerpo
+        )
+        try:
+            lineas = (await self.lector.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.cerrar()
+            raise ConnectionError(f'{metodo} {ruta}: el servidor cerró la conexión')
+        cabeceras = dict(
+            (nombre.strip().lower(), valor.strip())
+            for nombre, valor in (linea.split(':', 1) for linea in lineas[1:] if ':' in linea)
+        )
+        if cabeceras.get('transfer-encoding') == 'chunked':
+            while tamaño := int(await self.lector.readline(), 16):
+                await self.lector.readexactly(tamaño + 2)
+            await self.lector.readline()
+        else:
+            await self.lector.readexactly(int(cabeceras.get('content-length', 0)))
+        if cabeceras.get('connection', '').lower() == 'close':
+            self.cerrar()
+        return int(lineas[0].split()[1])
+
+    def cerrar(self):
+        if self.escritor is not None:
+            self.escritor.close()
+        self.lector = self.escritor = None
+
+
+async def generar_carga(puerto, peticion, total, concurrencia, esperado):
+    """
+    `concurrencia` clientes, cada uno con su conexión, lanzan `total`
+    peticiones en cuanto termina la anterior. `peticion(conexion, n)` hace la
+    n-ésima y devuelve el código de estado. Devuelve (duración en segundos,
+    latencias de las correctas, errores).
+    """
+    latencias, errores = [], 0
+    siguiente = iter(range(total))
+
+    async def cliente_virtual():
+        nonlocal errores
+        conexion = ConexionHTTP('127.0.0.1', puerto)
+        try:
+            for n in siguiente:
+                inicio = time.perf_counter()
+                try:
+                    estado = await peticion(conexion, n)
+                except (OSError, ValueError):
+                    errores += 1
+                    continue
+                if estado == esperado:
+                    latencias.append(time.perf_counter() - inicio)
+                else:
+                    errores += 1
+        finally:
+            conexion.cerrar()
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente_virtual() for _ in range(concurrencia)))
+    return time.perf_counter() - inicio, latencias, errores
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara peticiones/s y latencia p99 de disponibilidad y reserva: ScheduleViewSet y "
+        "AvailabilityView bajo gunicorn (WSGI) frente a las vistas asíncronas bajo uvicorn (ASGI)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrencia', type=int, default=200, help='Clientes simultáneos')
+        parser.add_argument('--peticiones', type=int, default=2000, help='Peticiones por escenario y servidor')
+        parser.add_argument('--servidores', default='wsgi,asgi', help='wsgi, asgi o ambos, separados por comas')
+        parser.add_argument('--workers', type=int, default=1, help='Procesos de cada servidor')
+        parser.add_argument('--hilos', type=int, default=8, help='Hilos por worker de gunicorn (gthread)')
+        parser.add_argument('--latencia-captcha', type=float, default=0.05,
+                            help='Segundos que tarda el captcha simulado (el viaje a Google)')
+        parser.add_argument('--puerto', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        servidores = [s.strip() for s in options['servidores'].split(',') if s.strip()]
+        if not servidores or set(servidores) - set(RUTAS):
+            raise CommandError('--servidores debe contener wsgi y/o asgi')
+        total = max(1, options['peticiones'])
+        concurrencia = max(1, options['concurrencia'])
+
+        servicio = Service.objects.create(name=MARCA, duration=timedelta(minutes=10), price=0)
+        # Huecos distintos para cada servidor: ninguna reserva choca con otra
+        dias = -(-total * len(servidores) // HUECOS_POR_DIA)
+        self.stdout.write(
+            f"{concurrencia} clientes, {total} peticiones por escenario, {options['workers']} worker(s), "
+            f"captcha simulado de {options['latencia_captcha'] * 1000:.0f}ms"
+        )
+        self.stdout.write(f"{'servidor':<8} {'escenario':<15} {'peticiones/s':>12} {'p50':>10} {'p99':>10}  errores")
+        try:
+            for indice, nombre in enumerate(servidores):
+                ruta_disponibilidad, ruta_reserva = RUTAS[nombre]
+                desplazamiento = indice * total
+
+                consulta = ruta_disponibilidad + '?' + urlencode({
+                    'service': servicio.pk,
+                    'date_from': date(AÑO, 1, 1).isoformat(),
+                    'date_to': (date(AÑO, 1, 1) + timedelta(days=DIAS_CONSULTA - 1)).isoformat(),
+                })
+
+                async def consultar(conexion, n):
+                    return await conexion.pedir('GET', consulta)
+
+                async def reservar(conexion, n):
+                    fecha, hora = _hueco(desplazamiento + n, dias)
+                    return await conexion.pedir('POST', ruta_reserva, json.dumps({
+                        'date': fecha.isoformat(), 'time': hora.isoformat(), 'service': servicio.pk,
+                        'name': f'Asgi {n}', 'email': f'asgi{n}@example.com', 'phone': f'55{n:08d}',
+                        'description': MARCA, 'captchaToken': 'bench',
+                    }).encode())
+
+                with self._servidor(nombre, options) as proceso:
+                    self._esperar(proceso, options['puerto'], consulta)
+                    for escenario, peticion, esperado in (
+                        ('disponibilidad', consultar, 200),
+                        ('reserva', reservar, 201),
+                    ):
+                        duracion, latencias, errores = asyncio.run(
+                            generar_carga(options['puerto'], peticion, total, concurrencia, esperado)
+                        )
+                        self._informar(nombre, escenario, duracion, latencias, errores)
+        finally:
+            self._limpiar(servicio)
+            servicio.delete()
+
+    @contextmanager
+    def _servidor(self, nombre, options):
+        entorno = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'barber.settings'),
+            CAPTCHA_BACKEND='appointment.captcha.StubCaptchaVerifier',
+            CAPTCHA_STUB_LATENCY=str(options['latencia_captcha']),
+            ALLOWED_HOSTS=','.join(settings.ALLOWED_HOSTS + ['127.0.0.1']),
+            DEBUG='False',
+        )
+        puerto = str(options['puerto'])
+        if nombre == 'wsgi':
+            orden = [
+                sys.executable, '-m', 'gunicorn', 'barber.wsgi:application', '--bind', f'127.0.0.1:{puerto}',
+                '--worker-class', 'gthread', '--workers', str(options['workers']),
+                '--threads', str(options['hilos']), '--log-level', 'warning',
+            ]
+        else:
+            orden = [
+                sys.executable, '-m', 'uvicorn', 'barber.asgi:application', '--host', '127.0.0.1', '--port', puerto,
+                '--workers', str(options['workers']), '--log-level', 'warning', '--no-access-log',
+            ]
+        # stderr a un archivo: una tubería llena bloquearía al servidor
+        with tempfile.TemporaryFile(mode='w+') as salida:
+            proceso = subprocess.Popen(orden, cwd=settings.BASE_DIR, env=entorno,
+                                       stdout=subprocess.DEVNULL, stderr=salida)
+            proceso.salida = salida
+            try:
+                yield proceso
+            finally:
+                proceso.terminate()
+                try:
+                    proceso.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    proceso.kill()
+                    proceso.wait()
+
+    def _esperar(self, proceso, puerto, ruta, limite=30):
+        """Hasta que el servidor responde (y ha cargado Django)"""
+        async def probar():
+            conexion = ConexionHTTP('127.0.0.1', puerto)
+            try:
+                return await conexion.pedir('GET', ruta)
+            finally:
+                conexion.cerrar()
+
+        fin = time.monotonic() + limite
+        while time.monotonic() < fin:
+            if proceso.poll() is not None:
+                proceso.salida.seek(0)
+                raise CommandError(f'El servidor terminó al arrancar:\n{proceso.salida.read()}')
+            try:
+                if asyncio.run(probar()) == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise CommandError(f'El servidor no respondió en {limite}s')
+
+    def _informar(self, nombre, escenario, duracion, latencias, errores):
+        if latencias:
+            p50 = f'{statistics.median(latencias) * 1000:.1f}ms'
+            p99 = f'{_percentil(latencias, 99) * 1000:.1f}ms'
+        else:
+            p50 = p99 = '-'
+        self.stdout.write(
+            f"{nombre:<8} {escenario:<15} {len(latencias) / duracion:>12.1f} {p50:>10} {p99:>10}  {errores}"
+        )
+
+    def _limpiar(self, servicio):
+        citas = Schedule.objects.filter(service=servicio)
+        SearchToken.objects.filter(schedule__in=citas).delete()
+        Outbox.objects.filter(schedule__in=citas).delete()
+        citas.delete()
+        DayLock.objects.filter(date__year=AÑO).delete()
+        intervals.invalidar_indices()
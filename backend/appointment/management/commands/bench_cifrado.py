@@ -0,0 +1,81 @@
+# appointment/management/commands/bench_cifrado.py
+# Compara tres tokens Fernet por fila contra un único sobre AES-GCM por fila
+import json
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from appointment.encryption import encryptor
+
+FORMATOS = ('fernet', 'sobre')
+
+
+def _fila(rng):
+    nombre = ' '.join(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))).title() for _ in range(3))
+    usuario = ''.join(rng.choices(string.ascii_lowercase + '.', k=rng.randint(6, 14))).strip('.') or 'cliente'
+    return {
+        'n': nombre,
+        'e': f'{usuario}@example.com',
+        'p': ''.join(rng.choices(string.digits, k=10)),
+    }
+
+
+class Command(BaseCommand):
+    help = "Mide cifrado/descifrado y tamaño en disco del formato Fernet por campo frente al sobre único"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=20000, help='Filas sintéticas por medición')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help='Imprimir el resultado como JSON')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['semilla'])
+        filas = [_fila(rng) for _ in range(max(1, options['filas']))]
+        resultados = {formato: self._medir(formato, filas) for formato in FORMATOS}
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultados, indent=2))
+            return
+
+        self.stdout.write(f"{len(filas)} filas (name, email, phone)")
+        for formato, r in resultados.items():
+            self.stdout.write(
+                f"{formato:>7}: cifrar {r['cifrar_filas_s']:>9.0f} filas/s | "
+                f"descifrar {r['descifrar_filas_s']:>9.0f} filas/s | "
+                f"{r['bytes_fila']:>6.1f} B/fila | {r['mb_por_millon']:>7.1f} MB por millón de filas"
+            )
+        fernet, sobre = resultados['fernet'], resultados['sobre']
+        self.stdout.write(
+            f"Sobre vs Fernet: {sobre['cifrar_filas_s'] / fernet['cifrar_filas_s']:.2f}x cifrar, "
+            f"{sobre['descifrar_filas_s'] / fernet['descifrar_filas_s']:.2f}x descifrar, "
+            f"{sobre['bytes_fila'] / fernet['bytes_fila']:.0%} del tamaño"
+        )
+
+    def _medir(self, formato, filas):
+        inicio = time.perf_counter()
+        if formato == 'fernet':
+            cifradas = [[encryptor.encrypt(v) for v in fila.values()] for fila in filas]
+        else:
+            cifradas = [encryptor.seal(fila) for fila in filas]
+        t_cifrar = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        if formato == 'fernet':
+            for valores in cifradas:
+                [encryptor.decrypt(v) for v in valores]
+            tamaño = sum(len(v) for valores in cifradas for v in valores)
+        else:
+            for sobre in cifradas:
+                encryptor.open(sobre)
+            tamaño = sum(len(sobre) for sobre in cifradas)
+        t_descifrar = time.perf_counter() - inicio
+
+        bytes_fila = tamaño / len(filas)
+        return {
+            'cifrar_filas_s': len(filas) / t_cifrar,
+            'descifrar_filas_s': len(filas) / t_descifrar,
+            'bytes_fila': bytes_fila,
+            'mb_por_millon': bytes_fila * 1_000_000 / (1024 * 1024),
+        }
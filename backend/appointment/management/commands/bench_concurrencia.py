@@ -0,0 +1,155 @@
+# appointment/management/commands/bench_concurrencia.py
+# Prueba de estrés: N reservas simultáneas al mismo horario; solo una debe ganar
+import statistics
+import threading
+import time
+from datetime import date, time as dtime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from appointment import procesos as procesos_hijos
+from appointment.api.serializers import ScheduleSerializer
+from appointment.models import DayLock, Schedule, Service
+
+
+def _intentar_reserva(service_id, fecha, hora, indice):
+    """Intenta una reserva por la misma ruta que ScheduleViewSet.create"""
+    inicio = time.perf_counter()
+    try:
+        serializer = ScheduleSerializer(data={
+            'date': fecha.isoformat(),
+            'time': hora.strftime('%H:%M:%S'),
+            'name': f'Cliente {indice}',
+            'email': f'cliente{indice}@example.com',
+            'phone': '5500000000',
+            'description': 'bench_concurrencia',
+            'service': service_id,
+        })
+        if serializer.is_valid():
+            serializer.save()
+            resultado = 'ganada'
+        elif 'appointment_conflict' in serializer.errors:
+            resultado = 'conflicto'
+        else:
+            resultado = f'invalida: {serializer.errors}'
+    except Exception as e:
+        if 'appointment_conflict' in str(e):
+            resultado = 'conflicto'
+        else:
+            resultado = f'error: {e.__class__.__name__}: {e}'
+    finally:
+        connections.close_all()
+    return resultado, time.perf_counter() - inicio
+
+
+def _proceso(service_id, fecha, hora, indice, barrera, cola):
+    barrera.wait()
+    cola.put(_intentar_reserva(service_id, fecha, hora, indice))
+
+
+class Command(BaseCommand):
+    help = "Lanza N reservas en paralelo contra el mismo horario y verifica que exactamente una gane"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reservas', type=int, default=20, help='Reservas simultáneas por ronda')
+        parser.add_argument('--rondas', type=int, default=5, help='Número de rondas')
+        parser.add_argument('--modo', choices=['hilos', 'procesos'], default='hilos')
+        parser.add_argument('--conservar', action='store_true', help='No borrar los datos de prueba al terminar')
+
+    def handle(self, *args, **options):
+        n = options['reservas']
+        rondas = options['rondas']
+        modo = options['modo']
+
+        # Fuerza la notificación por correo a no salir del proceso
+        settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+        servicio = Service.objects.create(
+            name='bench_concurrencia', duration=timedelta(minutes=30), price=0
+        )
+        # Fechas lejanas para no interferir con citas reales
+        fecha_base = date(2099, 1, 1)
+        fechas = []
+        latencias = []
+        fallos = []
+
+        try:
+            for ronda in range(rondas):
+                fecha = fecha_base + timedelta(days=ronda)
+                fechas.append(fecha)
+                # Horas distintas pero solapadas: la duración también debe bloquear
+                horas = [dtime(10, (i % 3) * 10) for i in range(n)]
+
+                inicio = time.perf_counter()
+                resultados = self._lanzar(modo, servicio.id, fecha, horas)
+                total = time.perf_counter() - inicio
+
+                ganadas = sum(1 for r, _ in resultados if r == 'ganada')
+                conflictos = sum(1 for r, _ in resultados if r == 'conflicto')
+                errores = [r for r, _ in resultados if r not in ('ganada', 'conflicto')]
+                en_bd = Schedule.objects.filter(date=fecha).count()
+                latencias.extend(lat for _, lat in resultados)
+
+                self.stdout.write(
+                    f"Ronda {ronda + 1}: {ganadas} ganada(s), {conflictos} conflicto(s), "
+                    f"{len(errores)} error(es), {en_bd} cita(s) en BD, {total:.3f}s"
+                )
+                for error in errores[:3]:
+                    self.stdout.write(f"   {error}")
+
+                if ganadas != 1 or en_bd != 1:
+                    fallos.append(ronda + 1)
+
+            latencias.sort()
+            self.stdout.write(
+                f"Latencia p50={statistics.median(latencias) * 1000:.1f}ms "
+                f"p99={latencias[int(len(latencias) * 0.99) - 1] * 1000:.1f}ms "
+                f"max={latencias[-1] * 1000:.1f}ms ({modo}, {n} por ronda)"
+            )
+        finally:
+            if not options['conservar']:
+                Schedule.objects.filter(service=servicio).delete()
+                DayLock.objects.filter(date__in=fechas).delete()
+                servicio.delete()
+
+        if fallos:
+            raise CommandError(f"Doble reserva o ninguna ganadora en las rondas {fallos}")
+        self.stdout.write(self.style.SUCCESS("OK: exactamente una reserva ganó en cada ronda"))
+
+    def _lanzar(self, modo, service_id, fecha, horas):
+        n = len(horas)
+        if modo == 'hilos':
+            barrera = threading.Barrier(n)
+            resultados = [None] * n
+
+            def trabajador(i):
+                barrera.wait()
+                resultados[i] = _intentar_reserva(service_id, fecha, horas[i], i)
+
+            hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(n)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            return resultados
+
+        # Procesos con spawn: cada uno configura Django y abre su propia conexión
+        # antes de la barrera
+        ctx = procesos_hijos.contexto()
+        barrera = ctx.Barrier(n)
+        cola = ctx.Queue()
+        procesos = [
+            ctx.Process(
+                target=procesos_hijos.ejecutar,
+                args=(f'{__name__}._proceso', service_id, fecha, horas[i], i, barrera, cola),
+            )
+            for i in range(n)
+        ]
+        for proceso in procesos:
+            proceso.start()
+        resultados = [cola.get() for _ in procesos]
+        for proceso in procesos:
+            proceso.join()
+        return resultados
@@ -0,0 +1,133 @@
+# appointment/management/commands/bench_escrituras.py
+# Reservas concurrentes desde varios procesos, para dimensionar los workers de gunicorn
+import statistics
+import time
+from datetime import date, time as dtime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from appointment import intervals, procesos as procesos_hijos
+from appointment.booking import HorarioOcupado, reservar
+from appointment.models import DayLock, Outbox, Schedule, SearchToken, Service
+
+MARCA = 'bench_escrituras'
+AÑO = 2096
+HUECOS_POR_DIA = 72  # cada 10 minutos de 08:00 a 20:00
+
+
+def _hueco(n, dias):
+    dia, hueco = n % dias, n // dias
+    return date(AÑO, 1, 1) + timedelta(days=dia), dtime(8 + hueco // 6, (hueco % 6) * 10)
+
+
+def reservar_lote(indice, reservas, dias, servicio_id):
+    """
+    Trabajo de cada proceso: `reservas` reservas seguidas por la misma ruta
+    que la API (bloqueo del día, comprobación de solapes, inserción y
+    señales). Devuelve (latencias en segundos, bloqueos, ocupados, inicio,
+    fin), con inicio y fin en hora de reloj para comparar entre procesos.
+    """
+    servicio = Service.objects.get(pk=servicio_id)
+    latencias, bloqueos, ocupados = [], 0, 0
+    comienzo = time.time()
+    try:
+        for i in range(reservas):
+            n = indice * reservas + i
+            fecha, hora = _hueco(n, dias)
+            cita = Schedule(date=fecha, time=hora, service=servicio, description=MARCA)
+            cita.name = f'Escritura {n}'
+            cita.email = f'escritura{n}@example.com'
+            cita.phone = f'55{n:08d}'
+            inicio = time.perf_counter()
+            try:
+                reservar(cita)
+            except HorarioOcupado:
+                ocupados += 1
+            except OperationalError:
+                # "database is locked": se agotó la espera del bloqueo de escritura
+                bloqueos += 1
+            else:
+                latencias.append(time.perf_counter() - inicio)
+    finally:
+        connection.close()
+    return latencias, bloqueos, ocupados, comienzo, time.time()
+
+
+class Command(BaseCommand):
+    help = "Mide reservas por segundo y latencia con 1..N procesos escribiendo a la vez"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', default='1,2,4,8',
+                            help='Número de procesos concurrentes a probar, separados por comas')
+        parser.add_argument('--reservas', type=int, default=200, help='Reservas por proceso')
+        parser.add_argument('--dias', type=int, default=0,
+                            help='Días entre los que se reparten (menos días = más contención por el bloqueo del día); '
+                                 'por defecto los mínimos para que quepan todas')
+
+    def handle(self, *args, **options):
+        try:
+            niveles = [int(p) for p in options['procesos'].split(',') if p.strip()]
+        except ValueError:
+            raise CommandError('--procesos debe ser una lista de enteros, p. ej. 1,2,4')
+        reservas = max(1, options['reservas'])
+
+        self._describir_conexion()
+        servicio = Service.objects.create(name=MARCA, duration=timedelta(minutes=10), price=0)
+        try:
+            for procesos in niveles:
+                total = procesos * reservas
+                minimo = -(-total // HUECOS_POR_DIA)
+                dias = max(minimo, options['dias'] or minimo)
+                self._limpiar(servicio)
+
+                # Los procesos arrancan y configuran Django antes de empezar todos a la
+                # vez: el arranque no cuenta en la duración
+                with procesos_hijos.pool(procesos, sincronizar=True) as pool:
+                    futuros = [
+                        pool.submit(reservar_lote, indice, reservas, dias, servicio.pk)
+                        for indice in range(procesos)
+                    ]
+                    resultados = [futuro.result() for futuro in futuros]
+                duracion = max(r[4] for r in resultados) - min(r[3] for r in resultados)
+
+                latencias = sorted(l for lat, *_ in resultados for l in lat)
+                bloqueos = sum(r[1] for r in resultados)
+                ocupados = sum(r[2] for r in resultados)
+                if latencias:
+                    p50 = statistics.median(latencias) * 1000
+                    p95 = latencias[max(0, round(0.95 * len(latencias)) - 1)] * 1000
+                else:
+                    p50 = p95 = 0
+                self.stdout.write(
+                    f"{procesos:>3} procesos  {len(latencias) / duracion:>8.1f} reservas/s  "
+                    f"p50 {p50:>8.2f}ms  p95 {p95:>8.2f}ms  {bloqueos} bloqueos  {ocupados} ocupados  "
+                    f"({dias} días)"
+                )
+        finally:
+            self._limpiar(servicio)
+            servicio.delete()
+
+    def _describir_conexion(self):
+        ajustes = connection.settings_dict
+        linea = f"Base de datos: {connection.vendor}, CONN_MAX_AGE={ajustes['CONN_MAX_AGE']}"
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                journal = cursor.fetchone()[0]
+                cursor.execute('PRAGMA synchronous')
+                synchronous = cursor.fetchone()[0]
+            opciones = ajustes.get('OPTIONS', {})
+            linea += (
+                f", journal_mode={journal}, synchronous={synchronous}, "
+                f"timeout={opciones.get('timeout', 5)}s, transaction_mode={opciones.get('transaction_mode') or 'DEFERRED'}"
+            )
+        self.stdout.write(linea)
+
+    def _limpiar(self, servicio):
+        citas = Schedule.objects.filter(service=servicio)
+        SearchToken.objects.filter(schedule__in=citas).delete()
+        Outbox.objects.filter(schedule__in=citas).delete()
+        citas.delete()
+        DayLock.objects.filter(date__year=AÑO).delete()
+        intervals.invalidar_indices()
@@ -0,0 +1,144 @@
+# appointment/management/commands/bench_logging.py
+# Coste del logging por reserva: FileHandler síncrono con f-strings frente a la cola
+import logging
+import re
+import statistics
+import tempfile
+import time
+from datetime import date, time as dtime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from appointment.log import EMAIL, FormatoJSON, ManejadorCola
+
+
+class _Archivo(RotatingFileHandler):
+    """Archivo con latencia artificial por escritura (disco lento o red)"""
+
+    def __init__(self, ruta, latencia):
+        super().__init__(ruta, maxBytes=50 * 1024 * 1024, backupCount=1, encoding='utf-8')
+        self.latencia = latencia
+
+    def emit(self, record):
+        if self.latencia:
+            time.sleep(self.latencia)
+        super().emit(record)
+
+
+def _cita(i):
+    return {
+        'id': i, 'name': f'Cliente {i}', 'email': f'cliente{i}@example.com', 'phone': '5512345678',
+        'date': date(2030, 1, 1), 'time': dtime(10), 'service': 1, 'description': 'Corte',
+        'promo_code': 'HOT10',
+    }
+
+
+def reserva_antes(logger, cita):
+    """Las líneas que escribía una reserva con f-strings y todo en INFO"""
+    logger.info(f'[OK] Codigo promocional valido: {cita["promo_code"]} (10% descuento)')
+    logger.info(f'[CREATE] Creando nueva cita para {cita["name"]}')
+    logger.info(f'[PROMO] Codigo {cita["promo_code"]} usado. Total usos: {cita["id"]}')
+    logger.info(f'[OK] Cita {cita["id"]} creada exitosamente para {cita["date"]} a las {cita["time"]}')
+    logger.info(f'[EMAIL] Intentando enviar email de confirmacion...')
+    logger.info(f'[EMAIL] Intentando enviar email a {cita["email"]}')
+    logger.info(f'[EMAIL] Renderizando template para {cita["email"]}')
+    logger.info(f'[EMAIL] Encolando email desde reservas@example.com a {cita["email"]}')
+    logger.info(f'[OK] Email para {cita["email"]} listo para envio')
+    logger.info(f'[OK] Email de confirmacion enviado a {cita["email"]} para cita {cita["id"]}')
+    logger.info(f'[ADMIN] Intentando enviar notificacion al administrador...')
+    logger.info(f'[ADMIN] Encolando notificacion desde reservas@example.com a admin@example.com')
+    logger.info(f'[OK] Notificacion al administrador lista para envio')
+    logger.info(f'Schedule creado: {cita}')
+
+
+def reserva_despues(logger, cita):
+    """Las mismas líneas tras pasar a %-style, sin PII y con el detalle en DEBUG"""
+    logger.info('[OK] Codigo promocional valido: %s (%s%% descuento)', cita['promo_code'], 10)
+    logger.info('[CREATE] Creando nueva cita para %s a las %s', cita['date'], cita['time'])
+    logger.info('[PROMO] Codigo %s usado. Total usos: %s', cita['promo_code'], cita['id'])
+    logger.info('[OK] Cita %s creada exitosamente para %s a las %s', cita['id'], cita['date'], cita['time'])
+    logger.info('[EMAIL] Intentando enviar email de confirmacion...')
+    logger.info('[EMAIL] Intentando enviar email de la cita %s', cita['id'])
+    logger.debug('[EMAIL] Renderizando template de la cita %s', cita['id'])
+    logger.debug('[EMAIL] Encolando email de la cita %s', cita['id'])
+    logger.info('[OK] Email de la cita %s listo para envio', cita['id'])
+    logger.info('[OK] Email de confirmacion encolado para cita %s', cita['id'])
+    logger.info('[ADMIN] Intentando enviar notificacion al administrador...')
+    logger.debug('[ADMIN] Encolando notificacion de la cita %s', cita['id'])
+    logger.info('[OK] Notificacion al administrador lista para envio')
+    logger.info('Schedule creado: %s (%s %s)', cita['id'], cita['date'], cita['time'])
+
+
+class Command(BaseCommand):
+    help = "Mide el coste del logging por reserva antes (FileHandler síncrono) y después (cola + JSON)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=2000)
+        parser.add_argument('--latencia-disco', type=float, default=0,
+                            help='Milisegundos añadidos a cada escritura para simular un disco lento')
+        parser.add_argument('--directorio', help='Dónde escribir los logs (por defecto, uno temporal)')
+
+    def handle(self, *args, **options):
+        peticiones = max(1, options['peticiones'])
+        latencia = max(0, options['latencia_disco']) / 1000
+        with tempfile.TemporaryDirectory() as temporal:
+            directorio = Path(options['directorio'] or temporal)
+            directorio.mkdir(parents=True, exist_ok=True)
+
+            ruta_antes = directorio / 'bench_antes.log'
+            archivo = _Archivo(ruta_antes, latencia)
+            archivo.setLevel(logging.INFO)
+            antes = self._medir('antes', [archivo], reserva_antes, peticiones)
+            archivo.close()
+
+            ruta_despues = directorio / 'bench_despues.log'
+            archivo = _Archivo(ruta_despues, latencia)
+            archivo.setFormatter(FormatoJSON())
+            cola = ManejadorCola(destinos=[archivo], capacidad=peticiones * 20)
+            cola.setLevel(logging.INFO)
+            despues = self._medir('después', [cola], reserva_despues, peticiones)
+            inicio = time.perf_counter()
+            cola.close()
+            vaciado = time.perf_counter() - inicio
+
+            self.stdout.write(f"{peticiones} reservas simuladas, latencia de disco {latencia * 1000:g} ms")
+            for nombre, resultado in (('antes', antes), ('después', despues)):
+                self.stdout.write(
+                    f"  {nombre:<8} media {resultado['media']:>9.1f}µs  p50 {resultado['p50']:>9.1f}µs  "
+                    f"p95 {resultado['p95']:>9.1f}µs"
+                )
+            self.stdout.write(f"  El listener terminó de escribir la cola {vaciado * 1000:.0f} ms después")
+            for nombre, ruta in (('antes', ruta_antes), ('después', ruta_despues)):
+                texto = ruta.read_text(encoding='utf-8')
+                self.stdout.write(
+                    f"  {nombre:<8} {len(texto.splitlines())} líneas, {len(texto) / 1024:.0f} KB, "
+                    f"{len(EMAIL.findall(texto))} emails en claro, "
+                    f"{len(re.findall(r'5512345678', texto))} teléfonos en claro"
+                )
+            if antes['media']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Coste por reserva: {despues['media'] / antes['media']:.0%} del anterior"
+                ))
+
+    def _medir(self, nombre, handlers, reserva, peticiones):
+        logger = logging.getLogger(f'appointment.bench_logging.{nombre}')
+        logger.handlers = handlers
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        tiempos = []
+        try:
+            for i in range(peticiones):
+                cita = _cita(i)
+                inicio = time.perf_counter()
+                reserva(logger, cita)
+                tiempos.append(time.perf_counter() - inicio)
+        finally:
+            logger.handlers = []
+        tiempos.sort()
+        return {
+            'media': statistics.fmean(tiempos) * 1e6,
+            'p50': statistics.median(tiempos) * 1e6,
+            'p95': tiempos[max(0, round(0.95 * len(tiempos)) - 1)] * 1e6,
+        }
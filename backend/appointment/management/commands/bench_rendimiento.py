@@ -0,0 +1,276 @@
+# appointment/management/commands/bench_rendimiento.py
+# Benchmark de las rutas críticas a varios tamaños de datos, con línea base en JSON.
+# Trabaja sobre una base de datos de pruebas creada para la ocasión (como
+# manage.py test, según DATABASES['default']['TEST']) y la elimina al terminar.
+import io
+import json
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import date, datetime, time as dtime, timedelta
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from appointment.admin import exportar_excel
+from appointment import catalog, intervals
+from appointment.models import DayLock, Holiday, Outbox, Schedule, SearchToken, Service
+
+# Años lejanos: el rango de fechas de los datos no depende del día de hoy
+AÑO_DATOS = 2098
+AÑO_RESERVAS = 2097
+CITAS_POR_DIA = 60  # cada 10 minutos desde las 08:00
+ESCENARIOS = ('crear', 'listar', 'recordatorios', 'exportar', 'festivos')
+# Métricas comparadas contra la línea base (más alto = peor)
+METRICAS = ('p95_ms', 'consultas', 'pico_kb')
+
+AJUSTES_BENCH = {
+    'CAPTCHA_BACKEND': 'appointment.captcha.StubCaptchaVerifier',
+    'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+    'DEBUG': False,
+    # El Client de pruebas usa el host 'testserver'
+    'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+}
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+def medir(funcion, repeticiones):
+    """
+    Ejecuta `funcion(i)` `repeticiones` veces y devuelve percentiles de
+    latencia, consultas por llamada y pico de memoria (una pasada aparte con
+    tracemalloc para no distorsionar los tiempos).
+    """
+    tiempos, consultas = [], []
+    for i in range(repeticiones):
+        with CaptureQueriesContext(connection) as capturadas:
+            inicio = time.perf_counter()
+            funcion(i)
+            tiempos.append(time.perf_counter() - inicio)
+        consultas.append(len(capturadas.captured_queries))
+
+    tracemalloc.start()
+    try:
+        funcion(repeticiones)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    reset_queries()
+
+    return {
+        'repeticiones': repeticiones,
+        'p50_ms': round(statistics.median(tiempos) * 1000, 3),
+        'p95_ms': round(_percentil(tiempos, 95) * 1000, 3),
+        'p99_ms': round(_percentil(tiempos, 99) * 1000, 3),
+        'consultas': max(consultas),
+        'pico_kb': round(pico / 1024, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide reserva, listado, recordatorios, exportación y festivos a varios tamaños; "
+        "guarda una línea base JSON o compara contra ella"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamaños', default='100,1000,5000',
+                            help='Número de citas del conjunto de datos, separados por comas')
+        parser.add_argument('--repeticiones', type=int, default=30)
+        parser.add_argument('--escenario', choices=ESCENARIOS, action='append',
+                            help='Escenario a medir (repetible); por defecto todos')
+        parser.add_argument('--baseline', default='bench_baseline.json',
+                            help='Archivo JSON de la línea base')
+        parser.add_argument('--guardar', action='store_true', help='Escribir el resultado como nueva línea base')
+        parser.add_argument('--comparar', action='store_true', help='Comparar contra la línea base')
+        parser.add_argument('--tolerancia', type=float, default=0.25,
+                            help='Empeoramiento relativo admitido antes de marcar regresión (0.25 = 25%%)')
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help='Si la base de pruebas ya existe, borrarla sin preguntar')
+
+    def handle(self, *args, **options):
+        try:
+            tamaños = [int(t) for t in options['tamaños'].split(',') if t.strip()]
+        except ValueError:
+            raise CommandError('--tamaños debe ser una lista de enteros, p. ej. 100,1000')
+        escenarios = options['escenario'] or list(ESCENARIOS)
+        repeticiones = max(1, options['repeticiones'])
+        self.rng = random.Random(options['semilla'])
+
+        # Nunca sobre la base configurada: los datos de prueba no deben mezclarse con los reales
+        nombre_real = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=not options['interactive'], serialize=False)
+        self.stdout.write(f"Base de datos de pruebas: {connection.settings_dict['NAME']}")
+        try:
+            resultados = self._medir(tamaños, escenarios, repeticiones)
+        finally:
+            connection.creation.destroy_test_db(nombre_real, verbosity=0)
+
+        informe = {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'base_de_datos': connection.vendor,
+            'repeticiones': repeticiones,
+            'resultados': resultados,
+        }
+
+        ruta = Path(options['baseline'])
+        if options['comparar']:
+            self._comparar(ruta, informe, options['tolerancia'])
+        if options['guardar']:
+            ruta.write_text(json.dumps(informe, indent=2, ensure_ascii=False))
+            self.stdout.write(self.style.SUCCESS(f"Línea base guardada en {ruta}"))
+
+    def _medir(self, tamaños, escenarios, repeticiones):
+        resultados = {}
+        with override_settings(**AJUSTES_BENCH):
+            self.servicio = Service.objects.create(
+                name='bench_rendimiento', duration=timedelta(minutes=10), price=0
+            )
+            try:
+                for tamaño in tamaños:
+                    self.stdout.write(f"== {tamaño} citas ==")
+                    self._preparar(tamaño)
+                    resultados[str(tamaño)] = {}
+                    for escenario in escenarios:
+                        medicion = medir(getattr(self, f'_{escenario}'), repeticiones)
+                        resultados[str(tamaño)][escenario] = medicion
+                        self.stdout.write(
+                            f"  {escenario:<14} p50 {medicion['p50_ms']:>9.2f}ms  p95 {medicion['p95_ms']:>9.2f}ms  "
+                            f"p99 {medicion['p99_ms']:>9.2f}ms  {medicion['consultas']:>4} consultas  "
+                            f"{medicion['pico_kb']:>9.1f} KB"
+                        )
+                    self._limpiar()
+            finally:
+                self._limpiar()
+                self.servicio.delete()
+        return resultados
+
+    # --- Datos ---
+    def _preparar(self, tamaño):
+        """Citas repartidas en días consecutivos de AÑO_DATOS y festivos en ese año"""
+        citas = []
+        inicio = date(AÑO_DATOS, 1, 1)
+        for i in range(tamaño):
+            dia, slot = divmod(i, CITAS_POR_DIA)
+            cita = Schedule(
+                date=inicio + timedelta(days=dia),
+                time=dtime(8 + slot // 6, (slot % 6) * 10),
+                service=self.servicio,
+                description='bench_rendimiento',
+            )
+            cita.name = f'Cliente {i}'
+            cita.email = f'cliente{i}@example.com'
+            cita.phone = f'55{i:08d}'
+            citas.append(cita)
+        Schedule.objects.bulk_create(citas, batch_size=500)
+
+        festivos = max(1, tamaño // 50)
+        Holiday.objects.bulk_create([
+            Holiday(name=f'bench {i}', date=inicio + timedelta(days=i * 3), active=True)
+            for i in range(festivos)
+        ])
+        # bulk_create no dispara las señales: se invalidan a mano el índice de
+        # festivos, el catálogo y la ocupación por día que pudiera quedar en caché
+        Holiday.invalidar_indice()
+        catalog.invalidar_catalogo()
+        catalog.invalidar(intervals.CACHE_PREFIX)
+        self.dias_datos = max(1, (tamaño + CITAS_POR_DIA - 1) // CITAS_POR_DIA)
+        self.reservas = 0
+
+    def _limpiar(self):
+        citas = Schedule.objects.filter(service=self.servicio)
+        SearchToken.objects.filter(schedule__in=citas).delete()
+        Outbox.objects.filter(schedule__in=citas).delete()
+        citas.delete()
+        DayLock.objects.filter(date__year__in=[AÑO_DATOS, AÑO_RESERVAS]).delete()
+        Holiday.objects.filter(name__startswith='bench ').delete()
+        Holiday.invalidar_indice()
+        mail.outbox = []
+
+    # --- Escenarios ---
+    def _crear(self, i):
+        """POST /api/schedule/ con captcha local y correo en memoria"""
+        dia, slot = divmod(self.reservas, CITAS_POR_DIA)
+        self.reservas += 1
+        fecha = date(AÑO_RESERVAS, 1, 1) + timedelta(days=dia)
+        hora = dtime(8 + slot // 6, (slot % 6) * 10)
+        respuesta = Client().post('/api/schedule/', {
+            'date': fecha.isoformat(),
+            'time': hora.strftime('%H:%M:%S'),
+            'name': f'Reserva {i}',
+            'email': f'reserva{i}@example.com',
+            'phone': '5500000000',
+            'description': 'bench_rendimiento',
+            'service': self.servicio.id,
+            'captchaToken': 'bench',
+        }, content_type='application/json')
+        if respuesta.status_code != 201:
+            raise CommandError(f'La reserva de prueba falló ({respuesta.status_code}): {respuesta.content[:200]}')
+
+    def _listar(self, i):
+        respuesta = Client().get('/api/schedule/', {'date_from': f'{AÑO_DATOS}-01-01', 'page_size': 100})
+        if respuesta.status_code != 200:
+            raise CommandError(f'El listado falló ({respuesta.status_code})')
+
+    def _recordatorios(self, i):
+        fecha = date(AÑO_DATOS, 1, 1) + timedelta(days=i % self.dias_datos)
+        call_command('enviar_recordatorios', fecha=fecha.isoformat(), stdout=io.StringIO())
+        mail.outbox = []
+
+    def _exportar(self, i):
+        queryset = Schedule.objects.filter(date__year=AÑO_DATOS, service=self.servicio)
+        respuesta = exportar_excel(None, None, queryset)
+        for _ in respuesta.streaming_content:
+            pass
+
+    def _festivos(self, i):
+        # Primera consulta del año tras invalidar y 364 consultas ya en caché
+        Holiday.invalidar_indice()
+        inicio = date(AÑO_DATOS, 1, 1)
+        for dia in range(365):
+            Holiday.is_holiday(inicio + timedelta(days=dia))
+
+    # --- Línea base ---
+    def _comparar(self, ruta, informe, tolerancia):
+        if not ruta.exists():
+            raise CommandError(f'No existe la línea base {ruta}; ejecute antes con --guardar')
+        base = json.loads(ruta.read_text())['resultados']
+
+        regresiones = []
+        self.stdout.write(f"Comparación contra {ruta} (tolerancia {tolerancia:.0%}):")
+        for tamaño, escenarios in informe['resultados'].items():
+            for escenario, actual in escenarios.items():
+                anterior = base.get(tamaño, {}).get(escenario)
+                if not anterior:
+                    continue
+                for metrica in METRICAS:
+                    antes, ahora = anterior[metrica], actual[metrica]
+                    cambio = (ahora - antes) / antes if antes else 0
+                    marca = ''
+                    if cambio > tolerancia:
+                        marca = '  <-- REGRESIÓN'
+                        regresiones.append(f'{tamaño}/{escenario}/{metrica}')
+                    self.stdout.write(
+                        f"  {tamaño:>6} {escenario:<14} {metrica:<10} {antes:>10} -> {ahora:>10} "
+                        f"({cambio:+.0%}){marca}"
+                    )
+
+        if regresiones:
+            raise CommandError(f"Regresiones: {', '.join(regresiones)}")
+        self.stdout.write(self.style.SUCCESS('Sin regresiones respecto a la línea base'))
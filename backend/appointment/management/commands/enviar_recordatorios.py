@@ -2,34 +2,118 @@
 # -*- coding: utf-8 -*-
 # Envía un resumen diario de citas al administrador
 # appointment/management/commands/enviar_recordatorios.py
-from django.core.management.base import BaseCommand
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template, render_to_string
 from django.conf import settings
 
 from appointment.models import Schedule
 
+
 class Command(BaseCommand):
     help = "Enviar recordatorios a clientes y notificación diaria al admin"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Conexiones SMTP reutilizadas en paralelo')
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Citas leídas, desencriptadas y enviadas por lote')
+        parser.add_argument('--fecha', help='Fecha a procesar (YYYY-MM-DD); por defecto hoy')
+
     def handle(self, *args, **options):
-        today = timezone.localdate()
-        citas_hoy = Schedule.objects.filter(date=today).order_by('time')
+        if options['fecha']:
+            try:
+                today = datetime.strptime(options['fecha'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--fecha debe tener el formato YYYY-MM-DD')
+        else:
+            today = timezone.localdate()
+        workers = max(1, options['workers'])
+        batch_size = max(1, options['batch_size'])
+
+        citas_hoy = Schedule.objects.filter(date=today).select_related('service').order_by('time')
+
+        # Plantilla compilada una sola vez para todos los lotes
+        plantilla_cliente = get_template('emails/recordatorio_cliente.html')
+
+        # Una conexión SMTP por hilo, reutilizada en todos sus lotes
+        local = threading.local()
+        abiertas = []
+        abiertas_lock = threading.Lock()
+
+        def enviar_lote(numero, mensajes):
+            inicio = time.perf_counter()
+            connection = getattr(local, 'connection', None)
+            if connection is None:
+                connection = local.connection = get_connection(fail_silently=True)
+                # Abierta aquí para que send_messages no la cierre al terminar cada lote
+                connection.open()
+                with abiertas_lock:
+                    abiertas.append(connection)
+            enviados = connection.send_messages(mensajes) or 0
+            return numero, len(mensajes), enviados, time.perf_counter() - inicio
+
+        citas_list = []
+        total_enviados = total_fallidos = 0
+        inicio_total = time.perf_counter()
 
-        if not citas_hoy.exists():
+        # --- Enviar recordatorio a cada cliente (una sola pasada por lotes) ---
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futuros = []
+            lote = []
+            for cita in citas_hoy.decrypted(chunk_size=batch_size):
+                citas_list.append({
+                    'hora': cita.time.strftime("%H:%M"),
+                    'nombre': cita.name,
+                    'email': cita.email,
+                    'telefono': cita.phone,
+                    'servicio': cita.service.name
+                })
+
+                html_cliente = plantilla_cliente.render({
+                    'nombre': cita.name,
+                    'fecha': cita.date.strftime('%d/%m/%Y'),
+                    'hora': cita.time.strftime('%H:%M'),
+                    'servicio': cita.service.name,
+                    'descripcion': cita.description
+                })
+                email_cliente = EmailMultiAlternatives(
+                    f"Recordatorio de tu cita con {cita.service.name}", '',
+                    settings.DEFAULT_FROM_EMAIL, [cita.email]
+                )
+                email_cliente.attach_alternative(html_cliente, "text/html")
+                lote.append(email_cliente)
+
+                if len(lote) >= batch_size:
+                    futuros.append(pool.submit(enviar_lote, len(futuros) + 1, lote))
+                    lote = []
+            if lote:
+                futuros.append(pool.submit(enviar_lote, len(futuros) + 1, lote))
+
+            for futuro in futuros:
+                numero, total, enviados, duracion = futuro.result()
+                fallidos = total - enviados
+                total_enviados += enviados
+                total_fallidos += fallidos
+                self.stdout.write(
+                    f"Lote {numero}: {enviados}/{total} enviados, {fallidos} fallidos, "
+                    f"{total / duracion if duracion else 0:.1f} correos/s"
+                )
+
+        for connection in abiertas:
+            connection.close()
+
+        if not citas_list:
             self.stdout.write("No hay citas programadas para hoy.")
             return
 
         # --- Enviar correo al admin ---
-        citas_list = [{
-            'hora': cita.time.strftime("%H:%M"),
-            'nombre': cita.name,
-            'email': cita.email,
-            'telefono': cita.phone,
-            'servicio': cita.service.name
-        } for cita in citas_hoy]
-
         html_admin = render_to_string('emails/recordatorio_admin.html', {
             'fecha': today.strftime("%d/%m/%Y"),
             'citas': citas_list
@@ -43,21 +127,8 @@ class Command(BaseCommand):
         email_admin.send()
         self.stdout.write(f"Correo enviado al admin con {len(citas_list)} citas.")
 
-        # --- Enviar recordatorio a cada cliente ---
-        for cita in citas_hoy:
-            subject_cliente = f"Recordatorio de tu cita con {cita.service.name}"
-            html_cliente = render_to_string('emails/recordatorio_cliente.html', {
-                'nombre': cita.name,
-                'fecha': cita.date.strftime('%d/%m/%Y'),
-                'hora': cita.time.strftime('%H:%M'),
-                'servicio': cita.service.name,
-                'descripcion': cita.description
-            })
-
-            email_cliente = EmailMultiAlternatives(
-                subject_cliente, '', settings.DEFAULT_FROM_EMAIL, [cita.email]
-            )
-            email_cliente.attach_alternative(html_cliente, "text/html")
-            email_cliente.send()
-
-        self.stdout.write("Recordatorios enviados a todos los clientes.")
+        duracion_total = time.perf_counter() - inicio_total
+        self.stdout.write(
+            f"Recordatorios: {total_enviados} enviados, {total_fallidos} fallidos "
+            f"en {duracion_total:.2f}s ({total_enviados / duracion_total if duracion_total else 0:.1f} correos/s)."
+        )
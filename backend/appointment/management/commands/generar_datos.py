@@ -0,0 +1,263 @@
+# appointment/management/commands/generar_datos.py
+# Genera datos sintéticos reproducibles (catálogo + citas cifradas) para pruebas de carga
+import multiprocessing
+import random
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import date, datetime, time as dtime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from appointment import intervals, procesos, promos as promociones
+from appointment.availability import a_minutos
+from appointment.encryption import encryptor
+from appointment.models import Holiday, PromoCode, Schedule, Service, Weekday, Workinghours
+
+MARCA = 'generar_datos'
+
+NOMBRES = [
+    'José', 'María', 'Juan', 'Guadalupe', 'Luis', 'Ana', 'Carlos', 'Fernanda', 'Miguel', 'Sofía',
+    'Jorge', 'Valeria', 'Pedro', 'Camila', 'Ricardo', 'Daniela', 'Alejandro', 'Lucía', 'Diego', 'Paola',
+]
+APELLIDOS = [
+    'Hernández', 'García', 'Martínez', 'López', 'González', 'Pérez', 'Rodríguez', 'Sánchez', 'Ramírez',
+    'Cruz', 'Flores', 'Gómez', 'Morales', 'Vázquez', 'Reyes', 'Jiménez', 'Torres', 'Díaz', 'Ruiz', 'Mendoza',
+]
+DOMINIOS = ['gmail.com', 'hotmail.com', 'outlook.com', 'yahoo.com.mx', 'example.com']
+SERVICIOS = [
+    ('Corte clásico', 30, 150), ('Corte y barba', 60, 250), ('Arreglo de barba', 30, 120),
+    ('Afeitado tradicional', 45, 180), ('Corte infantil', 30, 100),
+]
+DIAS = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+FESTIVOS = [
+    ('Año Nuevo', 1, 1), ('Día de la Constitución', 2, 5), ('Natalicio de Benito Juárez', 3, 21),
+    ('Día del Trabajo', 5, 1), ('Día de la Independencia', 9, 16), ('Revolución Mexicana', 11, 20),
+    ('Navidad', 12, 25),
+]
+
+
+def cifrar_bloque(filas, sobre):
+    """
+    Trabajo de cada proceso: cifra y calcula los hashes de un bloque de
+    (name, email, phone). Devuelve (name, email, phone, pii, name_hash, email_hash).
+    """
+    resultado = []
+    for nombre, email, telefono in filas:
+        if sobre:
+            cifrados = ('', '', '', encryptor.seal({'n': nombre, 'e': email, 'p': telefono}))
+        else:
+            cifrados = (encryptor.encrypt(nombre), encryptor.encrypt(email), encryptor.encrypt(telefono), None)
+        resultado.append((*cifrados, Schedule.hash_value(nombre), Schedule.hash_value(email)))
+    return resultado
+
+
+class Command(BaseCommand):
+    help = "Genera catálogo y citas cifradas sintéticas, reproducibles con --semilla"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--citas', type=int, default=10000, help='Número de citas a generar')
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                            help='Procesos para cifrado y hashing')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Filas por bloque y por INSERT')
+        parser.add_argument('--desde', help='Primer día (YYYY-MM-DD); por defecto el día siguiente a la última cita')
+        parser.add_argument('--ocupacion', type=float, default=0.8,
+                            help='Probabilidad de ocupar cada hueco de la agenda (0-1)')
+        parser.add_argument('--limpiar', action='store_true',
+                            help='Borrar antes las citas generadas por este comando')
+
+    def handle(self, *args, **options):
+        total = options['citas']
+        batch_size = max(1, options['batch_size'])
+        workers = max(1, options['workers'])
+        ocupacion = min(1.0, max(0.05, options['ocupacion']))
+        rng = random.Random(options['semilla'])
+
+        if options['limpiar']:
+            generadas = Schedule.objects.filter(description=MARCA)
+            usos = Counter(dict(
+                generadas.exclude(promo_code=None).values_list('promo_code').annotate(n=Count('pk'))
+            ))
+            borradas, _ = generadas.delete()
+            self._sumar_usos(usos, signo=-1)
+            self.stdout.write(f"{borradas} filas generadas anteriormente eliminadas")
+
+        servicios, abiertos, festivos = self._catalogo(rng)
+        promos = self._promos(rng)
+
+        if options['desde']:
+            try:
+                desde = datetime.strptime(options['desde'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--desde debe tener el formato YYYY-MM-DD')
+        else:
+            ultima = Schedule.objects.aggregate(ultima=Max('date'))['ultima']
+            desde = max(timezone.localdate(), ultima + timedelta(days=1) if ultima else date.min)
+
+        plan = self._plan(rng, total, desde, servicios, abiertos, festivos, promos, ocupacion)
+        sobre = Schedule.usa_sobre()
+
+        inicio = time.perf_counter()
+        insertadas = 0
+        usos = Counter()
+        with procesos.pool(workers) as pool:
+            pendientes = {}
+            bloques = self._bloques(plan, batch_size)
+            agotado = False
+            while pendientes or not agotado:
+                # Ventana acotada de bloques en vuelo: memoria constante
+                while not agotado and len(pendientes) < workers * 2:
+                    bloque = next(bloques, None)
+                    if bloque is None:
+                        agotado = True
+                        break
+                    datos = [(f[3], f[4], f[5]) for f in bloque]
+                    pendientes[pool.submit(cifrar_bloque, datos, sobre)] = bloque
+                if not pendientes:
+                    break
+                hechos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+                for futuro in hechos:
+                    bloque = pendientes.pop(futuro)
+                    insertadas += self._insertar(bloque, futuro.result(), batch_size)
+                    usos.update(fila[6].pk for fila in bloque if fila[6] is not None)
+                    duracion = time.perf_counter() - inicio
+                    self.stdout.write(
+                        f"{insertadas}/{total} citas, {insertadas / duracion if duracion else 0:.0f} citas/s"
+                    )
+
+        self._sumar_usos(usos)
+        intervals.invalidar_indices()
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"{insertadas} citas generadas en {duracion:.1f}s desde {desde} "
+            f"({workers} procesos). Ejecute reindexar_busqueda para la búsqueda parcial."
+        ))
+
+    # --- Catálogo ---
+    def _catalogo(self, rng):
+        servicios = list(Service.objects.exclude(name__startswith='bench_'))
+        if not servicios:
+            servicios = [
+                Service.objects.create(
+                    name=nombre, duration=timedelta(minutes=minutos), price=precio,
+                    description=f'{nombre} ({MARCA})',
+                )
+                for nombre, minutos, precio in SERVICIOS
+            ]
+
+        if not Weekday.objects.exists():
+            # El id coincide con date.isoweekday(): 1 = lunes ... 7 = domingo
+            for numero, dia in enumerate(DIAS, start=1):
+                Weekday.objects.create(id=numero, day=dia, status=numero != 7)
+        if not Workinghours.objects.exists():
+            for dia in Weekday.objects.filter(status=True):
+                Workinghours.objects.create(day=dia, start_time=dtime(9), end_time=dtime(14))
+                Workinghours.objects.create(day=dia, start_time=dtime(15), end_time=dtime(20))
+
+        if not Holiday.objects.exists():
+            for nombre, mes, dia in FESTIVOS:
+                Holiday.objects.create(name=nombre, date=date(2000, mes, dia), recurring=True)
+
+        abiertos = {}
+        for dia_id, inicio, fin in Workinghours.objects.filter(day__status=True).values_list(
+                'day_id', 'start_time', 'end_time'):
+            abiertos.setdefault(dia_id, []).append((a_minutos(inicio), a_minutos(fin)))
+        if not abiertos:
+            raise CommandError('No hay días activos con horario de trabajo')
+
+        festivos = list(Holiday.objects.filter(active=True))
+        return servicios, abiertos, festivos
+
+    def _promos(self, rng):
+        ahora = timezone.now()
+        existentes = list(PromoCode.objects.all())
+        if existentes:
+            return existentes
+        return [
+            PromoCode.objects.create(
+                code=f'GEN{numero:02d}', discount_percentage=rng.choice([5, 10, 15, 20]),
+                valid_from=ahora - timedelta(days=30), valid_to=ahora + timedelta(days=365 * 3),
+            )
+            for numero in range(10)
+        ]
+
+    # --- Agenda ---
+    def _plan(self, rng, total, desde, servicios, abiertos, festivos, promos, ocupacion):
+        """
+        Genera (fecha, hora, servicio, nombre, email, teléfono, promo) día a día
+        dentro del horario, sin solapamientos y saltando festivos.
+        """
+        duraciones = [(s, int(s.duration.total_seconds() // 60)) for s in servicios]
+        usos = Counter()
+        generadas = 0
+        fecha = desde
+        while generadas < total:
+            es_festivo = any(f.is_holiday_for_date(fecha) for f in festivos)
+            for inicio, fin in sorted(abiertos.get(fecha.isoweekday(), [])) if not es_festivo else []:
+                minuto = inicio
+                while generadas < total:
+                    servicio, duracion = rng.choice(duraciones)
+                    if minuto + duracion > fin:
+                        break
+                    if rng.random() < ocupacion:
+                        nombre = f'{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}'
+                        usuario = nombre.lower().replace(' ', '.').translate(str.maketrans('áéíóú', 'aeiou'))
+                        email = f'{usuario}{rng.randint(1, 999)}@{rng.choice(DOMINIOS)}'
+                        telefono = f'55{rng.randint(0, 99999999):08d}'
+                        promo = rng.choice(promos) if rng.random() < 0.05 else None
+                        if promo is not None and promo.max_uses is not None:
+                            # Sin superar max_uses: current_uses se actualiza al terminar
+                            if promo.current_uses + usos[promo.pk] >= promo.max_uses:
+                                promo = None
+                            else:
+                                usos[promo.pk] += 1
+                        yield (fecha, dtime(minuto // 60, minuto % 60), servicio, nombre, email, telefono, promo)
+                        generadas += 1
+                        minuto += duracion
+                    else:
+                        minuto += 15
+            fecha += timedelta(days=1)
+
+    @staticmethod
+    def _sumar_usos(usos, signo=1):
+        """
+        Ajusta PromoCode.current_uses con las citas insertadas (o borradas):
+        bulk_create no pasa por promos.canjear()
+        """
+        for promo_id, n in usos.items():
+            PromoCode.objects.filter(pk=promo_id).update(
+                current_uses=Greatest(F('current_uses') + signo * n, 0)
+            )
+        if usos:
+            # update() no dispara las señales que invalidan la caché de códigos
+            promociones.invalidar_cache()
+
+    @staticmethod
+    def _bloques(plan, tamaño):
+        bloque = []
+        for fila in plan:
+            bloque.append(fila)
+            if len(bloque) >= tamaño:
+                yield bloque
+                bloque = []
+        if bloque:
+            yield bloque
+
+    def _insertar(self, bloque, cifrados, batch_size):
+        citas = []
+        for (fecha, hora, servicio, _, _, _, promo), (nombre, email, telefono, pii, h_nombre, h_email) in zip(
+                bloque, cifrados):
+            citas.append(Schedule(
+                date=fecha, time=hora, service=servicio, description=MARCA,
+                _name=nombre, _email=email, _phone=telefono, _pii=pii,
+                name_hash=h_nombre, email_hash=h_email,
+                promo_code=promo, promo_code_allowed=promo is not None,
+            ))
+        with transaction.atomic():
+            Schedule.objects.bulk_create(citas, batch_size=batch_size)
+        return len(citas)
@@ -0,0 +1,43 @@
+# appointment/management/commands/procesar_outbox.py
+# Envía en segundo plano los correos encolados en la bandeja de salida
+import time
+
+from django.core.management.base import BaseCommand
+
+from appointment.outbox import procesar_lote
+
+
+class Command(BaseCommand):
+    help = "Envía los correos pendientes de la bandeja de salida (Outbox) con reintentos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=50, help='Correos reservados por iteración')
+        parser.add_argument('--workers', type=int, default=2, help='Conexiones SMTP simultáneas')
+        parser.add_argument('--loop', action='store_true', help='Seguir procesando indefinidamente')
+        parser.add_argument('--intervalo', type=float, default=5.0,
+                            help='Segundos de espera cuando no hay correos pendientes (con --loop)')
+
+    def handle(self, *args, **options):
+        total_enviados = total_fallidos = 0
+
+        while True:
+            inicio = time.perf_counter()
+            reservados, enviados, reintentos, fallidos = procesar_lote(
+                limite=options['lote'], workers=options['workers']
+            )
+            total_enviados += enviados
+            total_fallidos += fallidos
+
+            if reservados:
+                duracion = time.perf_counter() - inicio
+                self.stdout.write(
+                    f"Lote de {reservados}: {enviados} enviados, {reintentos} para reintento, "
+                    f"{fallidos} fallidos ({duracion:.2f}s)"
+                )
+                continue
+
+            if not options['loop']:
+                break
+            time.sleep(options['intervalo'])
+
+        self.stdout.write(f"Bandeja procesada: {total_enviados} enviados, {total_fallidos} fallidos.")
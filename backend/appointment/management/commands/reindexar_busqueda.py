@@ -0,0 +1,29 @@
+# appointment/management/commands/reindexar_busqueda.py
+# Reconstruye el índice ciego de búsqueda (SearchToken) de las citas existentes
+import time
+
+from django.core.management.base import BaseCommand
+
+from appointment import blind_index
+from appointment.models import Schedule
+
+
+class Command(BaseCommand):
+    help = "Regenera los tokens de búsqueda parcial de nombre, email y teléfono"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Citas desencriptadas e indexadas por lote')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        inicio = time.perf_counter()
+
+        citas = Schedule.objects.order_by('pk').only('pk', *Schedule.COLUMNAS_CIFRADAS)
+        total = blind_index.reindexar(citas.decrypted(chunk_size=batch_size), batch_size=batch_size)
+
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} citas indexadas en {duracion:.2f}s "
+            f"({total / duracion if duracion else 0:.1f} citas/s)."
+        ))
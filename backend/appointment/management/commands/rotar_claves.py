@@ -0,0 +1,141 @@
+# appointment/management/commands/rotar_claves.py
+# Re-cifra los datos personales con la clave primaria de FERNET_KEYS, por bloques
+import json
+import time
+from pathlib import Path
+
+from cryptography.fernet import InvalidToken
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from appointment.encryption import encryptor
+from appointment.models import Outbox, Schedule
+
+# Modelo -> columnas cifradas que se rotan
+OBJETIVOS = {
+    'schedule': (Schedule, Schedule.COLUMNAS_CIFRADAS),
+    'outbox': (Outbox, ('_payload',)),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-cifra name/email/phone de las citas (y los correos de la bandeja de salida) "
+        "con la clave primaria de FERNET_KEYS. Se puede interrumpir y reanudar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modelo', choices=list(OBJETIVOS), action='append',
+                            help='Tabla a rotar (repetible); por defecto todas')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Filas leídas y actualizadas por transacción')
+        parser.add_argument('--desde-id', type=int, default=0,
+                            help='Reanudar a partir de este id (excluido)')
+        parser.add_argument('--checkpoint',
+                            help='Archivo JSON donde se guarda el último id procesado para reanudar')
+        parser.add_argument('--sellar', action='store_true',
+                            help='Pasar además las citas al formato de sobre único (PII_ENVELOPE)')
+        parser.add_argument('--pausa', type=float, default=0,
+                            help='Segundos de espera entre lotes para no saturar la base de datos')
+
+    def handle(self, *args, **options):
+        if len(encryptor.claves) < 2 and not options['sellar']:
+            self.stdout.write("Solo hay una clave configurada: se cifrarán únicamente los datos heredados en claro.")
+
+        batch_size = max(1, options['batch_size'])
+        self.ilegibles = 0
+        checkpoint = Path(options['checkpoint']) if options['checkpoint'] else None
+        progreso = json.loads(checkpoint.read_text()) if checkpoint and checkpoint.exists() else {}
+
+        for nombre in options['modelo'] or list(OBJETIVOS):
+            desde = max(options['desde_id'], progreso.get(nombre, 0))
+            modelo, campos = OBJETIVOS[nombre]
+
+            def guardar(ultimo, nombre=nombre):
+                progreso[nombre] = ultimo
+                if checkpoint:
+                    checkpoint.write_text(json.dumps(progreso))
+
+            self._rotar(nombre, modelo, campos, desde, batch_size, options['pausa'], guardar,
+                        sellar=options['sellar'] and modelo is Schedule)
+
+        if checkpoint:
+            self.stdout.write(f"Progreso guardado en {checkpoint}")
+        if self.ilegibles:
+            raise CommandError(
+                f"{self.ilegibles} valores no se pudieron abrir con ninguna clave; se dejaron sin cambios."
+            )
+
+    def _sellar(self, cita):
+        """Pasa una cita al sobre único si todos sus campos se pudieron leer"""
+        if not any(getattr(cita, campo) for campo in Schedule.CAMPOS_CIFRADOS):
+            return False
+        fallidos = encryptor.total_fallidos
+        for campo in Schedule.CAMPOS_CIFRADOS:
+            cita._descifrar(campo)
+        if encryptor.total_fallidos != fallidos:
+            self.stderr.write(f"[schedule] id {cita.pk}: no se sella, hay campos ilegibles")
+            return False
+        cita.sellar()
+        return True
+
+    def _rotar(self, nombre, modelo, campos, desde, batch_size, pausa, guardar, sellar=False):
+        total = modelo.objects.filter(pk__gt=desde).count()
+        self.stdout.write(f"[{nombre}] {total} filas por revisar desde id {desde}")
+
+        revisadas = rotadas = ilegibles = 0
+        ultimo = desde
+        inicio = time.perf_counter()
+
+        while True:
+            with transaction.atomic():
+                # Bloquea solo el lote en curso: las reservas siguen funcionando
+                lote = list(
+                    modelo.objects.select_for_update()
+                    .filter(pk__gt=ultimo).order_by('pk')
+                    .only('pk', *campos)[:batch_size]
+                )
+                if not lote:
+                    break
+
+                cambiadas = []
+                for fila in lote:
+                    if sellar and self._sellar(fila):
+                        cambiadas.append(fila)
+                        continue
+                    cambio = False
+                    for campo in campos:
+                        try:
+                            nuevo = encryptor.rotate(getattr(fila, campo))
+                        except InvalidToken:
+                            ilegibles += 1
+                            self.stderr.write(f"[{nombre}] id {fila.pk}: {campo} no se pudo abrir con ninguna clave")
+                            continue
+                        if nuevo is not None:
+                            setattr(fila, campo, nuevo)
+                            cambio = True
+                    if cambio:
+                        cambiadas.append(fila)
+
+                if cambiadas:
+                    modelo.objects.bulk_update(cambiadas, campos)
+
+            revisadas += len(lote)
+            rotadas += len(cambiadas)
+            ultimo = lote[-1].pk
+            guardar(ultimo)
+
+            duracion = time.perf_counter() - inicio
+            self.stdout.write(
+                f"[{nombre}] {revisadas}/{total} revisadas, {rotadas} re-cifradas, "
+                f"último id {ultimo}, {revisadas / duracion if duracion else 0:.0f} filas/s"
+            )
+            if pausa:
+                time.sleep(pausa)
+
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"[{nombre}] Terminado: {rotadas} de {revisadas} filas re-cifradas, "
+            f"{ilegibles} valores ilegibles, {duracion:.2f}s"
+        ))
+        self.ilegibles += ilegibles
@@ -0,0 +1,150 @@
+# appointment/metrics.py
+"""
+Métricas de rendimiento en memoria con exportación en formato de texto de
+Prometheus (GET /metrics).
+
+Sin dependencias externas: cada proceso mantiene sus propios histogramas y
+contadores; con varios workers de gunicorn cada uno expone los suyos.
+
+Uso:
+    with metrics.medir('appointment_email_seconds', stage='render'):
+        ...
+    metrics.observar('appointment_http_request_queries', 12, route='api/schedule/')
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Límites de los histogramas (le = "menor o igual que")
+SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CANTIDADES = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histograma:
+    def __init__(self, nombre, ayuda, limites=SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.limites = tuple(limites)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        posicion = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * len(self.limites), 0.0, 0]
+            if posicion < len(self.limites):
+                serie[0][posicion] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exportar(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} histogram']
+        with self._lock:
+            series = [(clave, list(cubos), suma, total) for clave, (cubos, suma, total) in self._series.items()]
+        for clave, cubos, suma, total in sorted(series):
+            acumulado = 0
+            for limite, cantidad in zip(self.limites, cubos):
+                acumulado += cantidad
+                lineas.append(f'{self.nombre}_bucket{_etiquetas(clave, le=_numero(limite))} {acumulado}')
+            lineas.append(f'{self.nombre}_bucket{_etiquetas(clave, le="+Inf")} {total}')
+            lineas.append(f'{self.nombre}_sum{_etiquetas(clave)} {_numero(suma)}')
+            lineas.append(f'{self.nombre}_count{_etiquetas(clave)} {total}')
+        return lineas
+
+    def reiniciar(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Contador:
+    def __init__(self, nombre, ayuda):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, valor=1, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            self._series[clave] = self._series.get(clave, 0) + valor
+
+    def exportar(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} counter']
+        with self._lock:
+            series = sorted(self._series.items())
+        lineas.extend(f'{self.nombre}{_etiquetas(clave)} {_numero(valor)}' for clave, valor in series)
+        return lineas
+
+    def reiniciar(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(clave, **extra):
+    pares = list(clave) + list(extra.items())
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{k}="{_escapar(v)}"' for k, v in pares) + '}'
+
+
+REGISTRO = {}
+
+
+def _registrar(metrica):
+    REGISTRO[metrica.nombre] = metrica
+    return metrica
+
+
+_registrar(Histograma('appointment_http_request_duration_seconds', 'Duración de cada petición HTTP'))
+_registrar(Histograma('appointment_http_request_queries', 'Consultas SQL por petición', CANTIDADES))
+_registrar(Histograma('appointment_http_request_decrypts', 'Valores desencriptados por petición', CANTIDADES))
+_registrar(Histograma('appointment_crypto_seconds', 'Duración de las operaciones de cifrado'))
+_registrar(Histograma('appointment_email_seconds', 'Duración de render, encolado y envío de correos'))
+_registrar(Histograma('appointment_captcha_seconds', 'Latencia de la verificación de captcha'))
+_registrar(Histograma('appointment_booking_seconds', 'Duración de cada paso de una reserva'))
+_registrar(Contador('appointment_http_requests_total', 'Peticiones HTTP atendidas'))
+_registrar(Contador('appointment_errors_total', 'Errores en llamadas externas'))
+_registrar(Contador('appointment_log_dropped_total', 'Registros de log descartados con la cola llena'))
+
+
+def observar(nombre, valor, **etiquetas):
+    REGISTRO[nombre].observar(valor, **etiquetas)
+
+
+def incrementar(nombre, valor=1, **etiquetas):
+    REGISTRO[nombre].incrementar(valor, **etiquetas)
+
+
+@contextmanager
+def medir(nombre, **etiquetas):
+    """Observa en el histograma `nombre` los segundos que tarda el bloque"""
+    inicio = time.perf_counter()
+    try:
+        yield etiquetas
+    finally:
+        REGISTRO[nombre].observar(time.perf_counter() - inicio, **etiquetas)
+
+
+def exportar():
+    """Todas las métricas en formato de texto de Prometheus 0.0.4"""
+    lineas = []
+    for metrica in REGISTRO.values():
+        lineas.extend(metrica.exportar())
+    return '\n'.join(lineas) + '\n'
+
+
+def reiniciar():
+    for metrica in REGISTRO.values():
+        metrica.reiniciar()
@@ -0,0 +1,128 @@
+# appointment/middleware.py
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics
+from .encryption import contar_operaciones
+
+logger = logging.getLogger('appointment.middleware')
+
+_consultas_actuales = contextvars.ContextVar('consultas_sql', default=None)
+
+
+class _ContadorSQL:
+    def __init__(self):
+        self.consultas = 0
+
+
+def _contar_sql(execute, sql, params, many, context):
+    contador = _consultas_actuales.get()
+    if contador is not None:
+        contador.consultas += 1
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def _instalar_contador_sql(sender, connection, **kwargs):
+    # En cada conexión (de cualquier hilo): las vistas asíncronas consultan
+    # desde los hilos de sync_to_async, que heredan el contexto de la petición
+    if _contar_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_contar_sql)
+
+
+@contextmanager
+def contar_consultas():
+    """Cuenta las consultas SQL del bloque (también sin DEBUG)"""
+    contador = _ContadorSQL()
+    token = _consultas_actuales.set(contador)
+    try:
+        yield contador
+    finally:
+        _consultas_actuales.reset(token)
+
+
+class ContadorCifradoMiddleware:
+    """
+    Cuenta cuántas veces se desencripta/cifra durante cada petición y lo
+    expone en las cabeceras X-Decrypt-Count / X-Encrypt-Count.
+
+    También registra en appointment.metrics la duración, las consultas SQL
+    y los valores desencriptados de cada petición, por vista y método.
+    Funciona igual bajo WSGI y ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with contar_operaciones() as contador, contar_consultas() as sql:
+            inicio = time.perf_counter()
+            response = self.get_response(request)
+        return self._registrar(request, response, contador, sql, time.perf_counter() - inicio)
+
+    async def __acall__(self, request):
+        with contar_operaciones() as contador, contar_consultas() as sql:
+            inicio = time.perf_counter()
+            response = await self.get_response(request)
+        return self._registrar(request, response, contador, sql, time.perf_counter() - inicio)
+
+    def _registrar(self, request, response, contador, sql, duracion):
+        # Nombre de la vista y no la URL: las etiquetas no crecen con los ids
+        match = request.resolver_match
+        vista = (match.view_name or match.route) if match else 'sin_ruta'
+        metrics.observar('appointment_http_request_duration_seconds', duracion,
+                         view=vista, method=request.method)
+        metrics.observar('appointment_http_request_queries', sql.consultas, view=vista, method=request.method)
+        metrics.observar('appointment_http_request_decrypts', contador.descifrados,
+                         view=vista, method=request.method)
+        metrics.incrementar('appointment_http_requests_total', view=vista, method=request.method,
+                            status=response.status_code)
+
+        response['X-Decrypt-Count'] = str(contador.descifrados)
+        response['X-Encrypt-Count'] = str(contador.cifrados)
+        if contador.descifrados:
+            logger.debug('[CRYPTO] %s %s: %d descifrados, %d cifrados',
+                         request.method, request.path, contador.descifrados, contador.cifrados)
+        return response
+
+
+class EstaticosMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise también bajo ASGI. El de WhiteNoise solo es síncrono, y con él
+    en la cadena Django ejecutaría las vistas asíncronas a través de un hilo
+    por petición. Aquí solo el archivo estático se sirve en un hilo.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,114 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Holiday',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Nombre del día festivo')),
+                ('date', models.DateField(unique=True, verbose_name='Fecha')),
+                ('recurring', models.BooleanField(default=False, help_text='Si está marcado, se aplicará cada año (ej: 25 de diciembre)', verbose_name='Recurrente cada año')),
+                ('active', models.BooleanField(default=True, verbose_name='Activo')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Descripción')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Día Festivo',
+                'verbose_name_plural': 'Días Festivos',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PromoCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20, unique=True)),
+                ('discount_percentage', models.PositiveIntegerField()),
+                ('valid_from', models.DateTimeField()),
+                ('valid_to', models.DateTimeField()),
+                ('active', models.BooleanField(default=True)),
+                ('current_uses', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Promo Code',
+                'verbose_name_plural': 'Códigos promocionales',
+                'ordering': ['-valid_to'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Service',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('duration', models.DurationField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('description', models.TextField(default='Sin descripción')),
+                ('image', models.ImageField(blank=True, null=True, upload_to='services/')),
+            ],
+            options={
+                'verbose_name': 'Service',
+                'verbose_name_plural': 'Servicios',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Weekday',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.CharField(max_length=10)),
+                ('status', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name': 'Weekday',
+                'verbose_name_plural': 'Dias de la semana',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Schedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('_name', models.TextField(blank=True, db_column='name', null=True)),
+                ('_email', models.TextField(blank=True, db_column='email', null=True)),
+                ('_phone', models.TextField(blank=True, db_column='phone', null=True)),
+                ('name_hash', models.CharField(blank=True, db_index=True, editable=False, max_length=64, null=True)),
+                ('email_hash', models.CharField(blank=True, db_index=True, editable=False, max_length=64, null=True)),
+                ('description', models.TextField()),
+                ('promo_code_allowed', models.BooleanField(default=False)),
+                ('promo_code', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='appointment.promocode')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to='appointment.service')),
+            ],
+            options={
+                'verbose_name': 'Schedule',
+                'verbose_name_plural': 'Citas',
+                'ordering': ['-date', '-time'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Workinghours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('day', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='appointment.weekday')),
+            ],
+            options={
+                'verbose_name': 'Working Hour',
+                'verbose_name_plural': 'Horas de trabajo',
+                'ordering': ['day__id', 'start_time'],
+            },
+        ),
+    ]
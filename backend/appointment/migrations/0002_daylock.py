@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:51
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DayLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Day Lock',
+                'verbose_name_plural': 'Bloqueos por día',
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+"""
+Antes no había restricción única (date, time): las citas repetidas se separan
+para que 0004 pueda crearla.
+"""
+from datetime import datetime, timedelta
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def separar_citas_duplicadas(apps, schema_editor):
+    """
+    Se conserva la cita más antigua de cada (fecha, hora) y las demás se
+    desplazan 1, 2, ... segundos: no se pierde ninguna y la hora que se muestra
+    (HH:MM) no cambia. Quedan en el admin para resolverlas a mano.
+    """
+    Schedule = apps.get_model('appointment', 'Schedule')
+    duplicados = (
+        Schedule.objects.values('date', 'time').annotate(citas=Count('id')).filter(citas__gt=1)
+        .order_by('date', 'time')
+    )
+    for grupo in duplicados:
+        fecha = grupo['date']
+        ocupadas = set(Schedule.objects.filter(date=fecha).values_list('time', flat=True))
+        repetidas = Schedule.objects.filter(date=fecha, time=grupo['time']).order_by('pk')
+        for pk in list(repetidas.values_list('pk', flat=True))[1:]:
+            hora = grupo['time']
+            while hora in ocupadas:
+                hora = (datetime.combine(fecha, hora) + timedelta(seconds=1)).time()
+            ocupadas.add(hora)
+            Schedule.objects.filter(pk=pk).update(time=hora)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0002_daylock'),
+    ]
+
+    operations = [
+        migrations.RunPython(separar_citas_duplicadas, migrations.RunPython.noop),
+    ]
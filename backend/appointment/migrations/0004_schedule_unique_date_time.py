@@ -0,0 +1,17 @@
+# Separada de 0003: en PostgreSQL no se altera una tabla en la misma transacción que actualizó sus filas
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0003_separar_citas_duplicadas'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='schedule',
+            constraint=models.UniqueConstraint(fields=('date', 'time'), name='unique_schedule_date_time'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0005_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('name', 'Nombre'), ('email', 'Email'), ('phone', 'Teléfono')], max_length=10)),
+                ('token', models.CharField(max_length=32)),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='appointment.schedule')),
+            ],
+            options={
+                'verbose_name': 'Search Token',
+                'verbose_name_plural': 'Índice de búsqueda',
+                'indexes': [models.Index(fields=['token', 'schedule'], name='searchtoken_token_idx')],
+            },
+        ),
+    ]
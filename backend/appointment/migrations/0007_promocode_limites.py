@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0006_searchtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='code_normalized',
+            field=models.CharField(editable=False, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='max_uses',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='max_uses_per_customer',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
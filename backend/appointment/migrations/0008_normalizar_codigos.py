@@ -0,0 +1,32 @@
+"""
+Rellena PromoCode.code_normalized en los códigos existentes (como PromoCode.normalizar)
+antes de que 0009 la haga única y obligatoria.
+"""
+from django.db import migrations
+
+LARGO_CODIGO = 20
+
+
+def normalizar_codigos(apps, schema_editor):
+    PromoCode = apps.get_model('appointment', 'PromoCode')
+    usados = set()
+    for pk, code in PromoCode.objects.order_by('pk').values_list('pk', 'code'):
+        normalizado = ''.join((code or '').split()).upper()
+        if normalizado in usados:
+            # 'hot10' y 'HOT10' convivían: el más antiguo se queda el código
+            # normalizado y los demás reciben uno que no coincide con ninguna búsqueda
+            sufijo = f'~{pk}'
+            normalizado = normalizado[:LARGO_CODIGO - len(sufijo)] + sufijo
+        usados.add(normalizado)
+        PromoCode.objects.filter(pk=pk).update(code_normalized=normalizado)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0007_promocode_limites'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalizar_codigos, migrations.RunPython.noop),
+    ]
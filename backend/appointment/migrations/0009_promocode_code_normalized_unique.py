@@ -0,0 +1,18 @@
+# Separada de 0008: en PostgreSQL no se altera una tabla en la misma transacción que actualizó sus filas
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0008_normalizar_codigos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='promocode',
+            name='code_normalized',
+            field=models.CharField(editable=False, max_length=20, unique=True),
+        ),
+    ]
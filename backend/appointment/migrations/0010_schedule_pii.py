@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0009_promocode_code_normalized_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedule',
+            name='_pii',
+            field=models.TextField(blank=True, db_column='pii', null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:57
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0010_schedule_pii'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='holiday',
+            index=models.Index(condition=models.Q(('active', True)), fields=['recurring', 'date'], name='holiday_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promocode',
+            index=models.Index(django.db.models.functions.text.Upper('code'), name='promocode_code_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['service', 'date'], name='schedule_service_date_idx'),
+        ),
+    ]
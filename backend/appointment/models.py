@@ -1,7 +1,12 @@
 # barber/appointment/models.py
 import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.db.models.functions import Upper
 from django.utils import timezone
+from . import catalog
 from .encryption import encryptor
 
 class Service(models.Model):
@@ -22,11 +27,27 @@ class Service(models.Model):
 
 class PromoCode(models.Model):
     code = models.CharField(max_length=20, unique=True)
+    # Código en mayúsculas y sin espacios: búsqueda exacta por índice único
+    code_normalized = models.CharField(max_length=20, unique=True, editable=False)
     discount_percentage = models.PositiveIntegerField()
     valid_from = models.DateTimeField()
     valid_to = models.DateTimeField()
     active = models.BooleanField(default=True)
     current_uses = models.PositiveIntegerField(default=0)
+    # Límites opcionales (vacío = sin límite)
+    max_uses = models.PositiveIntegerField(null=True, blank=True)
+    max_uses_per_customer = models.PositiveIntegerField(null=True, blank=True)
+
+    @staticmethod
+    def normalizar(code):
+        return ''.join((code or '').split()).upper()
+
+    def save(self, *args, **kwargs):
+        self.code_normalized = self.normalizar(self.code)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'code' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'code_normalized'}
+        super().save(*args, **kwargs)
 
     def is_valid(self):
         now = timezone.now()
@@ -45,6 +66,27 @@ class PromoCode(models.Model):
         verbose_name = "Promo Code"
         verbose_name_plural = "Códigos promocionales"
         ordering = ['-valid_to']
+        indexes = [
+            # Búsquedas sin distinguir mayúsculas (code__iexact en PostgreSQL, Upper('code'))
+            models.Index(Upper('code'), name='promocode_code_upper_idx'),
+        ]
+
+
+class ScheduleQuerySet(models.QuerySet):
+    def decrypted(self, chunk_size=500, workers=None):
+        """
+        Itera el queryset por bloques y desencripta cada bloque completo en una
+        sola pasada (opcionalmente en un pool de hilos). Las instancias salen
+        con name/email/phone ya memorizados.
+        """
+        bloque = []
+        for cita in self.iterator(chunk_size=chunk_size):
+            bloque.append(cita)
+            if len(bloque) >= chunk_size:
+                yield from Schedule.descifrar_lote(bloque, workers=workers)
+                bloque = []
+        if bloque:
+            yield from Schedule.descifrar_lote(bloque, workers=workers)
 
 
 class Schedule(models.Model):
@@ -55,6 +97,8 @@ class Schedule(models.Model):
     _name = models.TextField(db_column='name', null=True, blank=True)
     _email = models.TextField(db_column='email', null=True, blank=True)
     _phone = models.TextField(db_column='phone', null=True, blank=True)
+    # Formato compacto opcional (PII_ENVELOPE): los tres campos en un único sobre AES-GCM
+    _pii = models.TextField(db_column='pii', null=True, blank=True)
 
     # Campos hash para búsqueda
     name_hash = models.CharField(max_length=64, editable=False, db_index=True, blank=True, null=True)
@@ -65,6 +109,21 @@ class Schedule(models.Model):
     service = models.ForeignKey('Service', on_delete=models.CASCADE, related_name='schedules')
     promo_code = models.ForeignKey('PromoCode', null=True, blank=True, on_delete=models.SET_NULL)
 
+    objects = ScheduleQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Fecha cargada, para poder mover la cita en el índice de intervalos si cambia
+        instance._fecha_original = instance.__dict__.get('date')
+        # Columnas cifradas cargadas: si no cambian, el índice de búsqueda sigue valiendo
+        instance._cifrado_original = instance.columnas_cifradas()
+        return instance
+
+    def columnas_cifradas(self):
+        """Texto cifrado actual (sin desencriptar ni cargar columnas diferidas)"""
+        return tuple(self.__dict__.get(campo) for campo in self.COLUMNAS_CIFRADAS)
+
     @staticmethod
     def hash_value(value):
         """Crea un hash SHA256 hexadecimal (en minúsculas)."""
@@ -72,32 +131,121 @@ class Schedule(models.Model):
             return ''
         return hashlib.sha256(value.strip().lower().encode()).hexdigest()
 
+    # --- Desencriptado perezoso y memorizado por instancia ---
+    # Columnas por campo (formato Fernet) y clave de cada campo dentro del sobre
+    CAMPOS_CIFRADOS = ('_name', '_email', '_phone')
+    COLUMNAS_CIFRADAS = CAMPOS_CIFRADOS + ('_pii',)
+    CLAVES_SOBRE = {'_name': 'n', '_email': 'e', '_phone': 'p'}
+
+    @staticmethod
+    def usa_sobre():
+        return getattr(settings, 'PII_ENVELOPE', False)
+
+    def _abrir_sobre(self):
+        """Contenido del sobre _pii, memorizado mientras el sobre no cambie"""
+        cache = self.__dict__.setdefault('_descifrados', {})
+        guardado = cache.get('_pii')
+        if guardado is not None and guardado[0] == self._pii:
+            return guardado[1]
+        datos = encryptor.open(self._pii)
+        cache['_pii'] = (self._pii, datos)
+        return datos
+
+    def _descifrar(self, campo):
+        """
+        Desencripta `campo` ('_name', '_email', '_phone') la primera vez y
+        memoriza el resultado. La caché va ligada al texto cifrado, así que se
+        invalida sola si el campo cambia (setter, refresh_from_db, etc.).
+        Orden: valor asignado aún sin guardar, columna Fernet, sobre _pii.
+        """
+        pendientes = self.__dict__.get('_pii_pendiente')
+        if pendientes and campo in pendientes:
+            return pendientes[campo]
+        cifrado = getattr(self, campo)
+        if not cifrado:
+            if self._pii:
+                return self._abrir_sobre().get(self.CLAVES_SOBRE[campo], '')
+            return ''
+        cache = self.__dict__.setdefault('_descifrados', {})
+        guardado = cache.get(campo)
+        if guardado is not None and guardado[0] == cifrado:
+            return guardado[1]
+        plano = encryptor.decrypt(cifrado)
+        cache[campo] = (cifrado, plano)
+        return plano
+
+    def _asignar(self, campo, value):
+        if self.usa_sobre():
+            # Se sella junto con los demás campos en save()
+            self.__dict__.setdefault('_pii_pendiente', {})[campo] = value or ''
+            setattr(self, campo, '')
+            return
+        self.__dict__.get('_pii_pendiente', {}).pop(campo, None)
+        setattr(self, campo, encryptor.encrypt(value) if value else '')
+        self.__dict__.setdefault('_descifrados', {})[campo] = (getattr(self, campo), value or '')
+
+    def sellar(self):
+        """Pasa los tres campos al sobre _pii y vacía las columnas Fernet"""
+        datos = {clave: self._descifrar(campo) for campo, clave in self.CLAVES_SOBRE.items()}
+        self._pii = encryptor.seal(datos)
+        for campo in self.CAMPOS_CIFRADOS:
+            setattr(self, campo, '')
+        self.__dict__.pop('_pii_pendiente', None)
+        self.__dict__.setdefault('_descifrados', {})['_pii'] = (self._pii, datos)
+
+    def save(self, *args, **kwargs):
+        if self.__dict__.get('_pii_pendiente') or (
+            self.usa_sobre() and any(getattr(self, campo) for campo in self.CAMPOS_CIFRADOS)
+        ):
+            self.sellar()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, *self.COLUMNAS_CIFRADAS}
+        super().save(*args, **kwargs)
+
     # --- properties existentes ---
     @property
     def name(self):
-        return encryptor.decrypt(self._name) if self._name else ''
+        return self._descifrar('_name')
 
     @name.setter
     def name(self, value):
-        self._name = encryptor.encrypt(value) if value else ''
+        self._asignar('_name', value)
         self.name_hash = self.hash_value(value)
 
     @property
     def email(self):
-        return encryptor.decrypt(self._email) if self._email else ''
+        return self._descifrar('_email')
 
     @email.setter
     def email(self, value):
-        self._email = encryptor.encrypt(value) if value else ''
+        self._asignar('_email', value)
         self.email_hash = self.hash_value(value)
 
     @property
     def phone(self):
-        return encryptor.decrypt(self._phone) if self._phone else ''
+        return self._descifrar('_phone')
 
     @phone.setter
     def phone(self, value):
-        self._phone = encryptor.encrypt(value) if value else ''
+        self._asignar('_phone', value)
+
+    @classmethod
+    def descifrar_lote(cls, citas, workers=None):
+        """
+        Desencripta en una sola pasada los campos cifrados de una lista de
+        citas ya cargadas y deja el resultado memorizado en cada instancia.
+        """
+        citas = list(citas)
+        cifrados = [getattr(cita, campo) for cita in citas for campo in cls.CAMPOS_CIFRADOS]
+        planos = iter(encryptor.decrypt_many(cifrados, workers=workers))
+        sobres = iter(encryptor.open_many((cita._pii for cita in citas), workers=workers))
+        for cita in citas:
+            cache = cita.__dict__.setdefault('_descifrados', {})
+            for campo in cls.CAMPOS_CIFRADOS:
+                cache[campo] = (getattr(cita, campo), next(planos))
+            cache['_pii'] = (cita._pii, next(sobres))
+        return citas
 
     def __str__(self):
         return f"Cita {self.date} {self.time} - {self.name}"
@@ -106,6 +254,60 @@ class Schedule(models.Model):
         verbose_name = "Schedule"
         verbose_name_plural = "Citas"
         ordering = ['-date', '-time']
+        constraints = [
+            # Respaldo en base de datos: nunca dos citas que empiecen a la misma hora
+            models.UniqueConstraint(fields=['date', 'time'], name='unique_schedule_date_time'),
+        ]
+        # (date, time) ya está indexado por la restricción única: sirve también
+        # para filtrar por día y para el orden -date, -time
+        indexes = [
+            # Listado y disponibilidad de un servicio por rango de fechas
+            models.Index(fields=['service', 'date'], name='schedule_service_date_idx'),
+        ]
+
+
+class DayLock(models.Model):
+    """
+    Fila de bloqueo por día. Reservar una cita actualiza primero esta fila
+    dentro de la transacción, de modo que las reservas concurrentes del mismo
+    día se serializan y la comprobación de solapamiento es atómica.
+    """
+    date = models.DateField(unique=True)
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.date} (v{self.version})"
+
+    class Meta:
+        verbose_name = "Day Lock"
+        verbose_name_plural = "Bloqueos por día"
+
+
+class SearchToken(models.Model):
+    """
+    Índice ciego para búsquedas parciales sobre campos cifrados: cada fila es
+    un HMAC con clave de un prefijo o trigrama normalizado de name/email/phone.
+    Lo mantiene appointment.blind_index al guardar la cita.
+    """
+    NAME = 'name'
+    EMAIL = 'email'
+    PHONE = 'phone'
+    CAMPOS = [(NAME, 'Nombre'), (EMAIL, 'Email'), (PHONE, 'Teléfono')]
+
+    schedule = models.ForeignKey(Schedule, on_delete=models.CASCADE, related_name='search_tokens')
+    field = models.CharField(max_length=10, choices=CAMPOS)
+    token = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"{self.field}:{self.token[:8]}… (cita {self.schedule_id})"
+
+    class Meta:
+        verbose_name = "Search Token"
+        verbose_name_plural = "Índice de búsqueda"
+        indexes = [
+            models.Index(fields=['token', 'schedule'], name='searchtoken_token_idx'),
+        ]
 
 
 class Weekday(models.Model):
@@ -164,16 +366,126 @@ class Holiday(models.Model):
             # Para festivos específicos, comparamos la fecha exacta
             return self.date == check_date
 
+    # --- Índice de festivos por año (en caché, invalidado por señales) ---
+    CACHE_PREFIX = 'festivos'
+    CACHE_TIMEOUT = 60 * 60 * 24
+
+    @classmethod
+    def fechas_del_año(cls, year):
+        """
+        Devuelve {fecha: nombre} con todos los festivos activos de un año,
+        expandiendo los recurrentes (día, mes) al año pedido.
+        """
+        clave = f'{cls.CACHE_PREFIX}:{catalog.version(cls.CACHE_PREFIX)}:{year}'
+        fechas = cache.get(clave)
+        if fechas is not None:
+            return fechas
+
+        fechas = cls._expandir(cls._festivos_activos(year), year)
+        cache.set(clave, fechas, cls.CACHE_TIMEOUT)
+        return fechas
+
+    @classmethod
+    async def afechas_del_año(cls, year):
+        """Como fechas_del_año, con caché y ORM asíncronos"""
+        clave = f'{cls.CACHE_PREFIX}:{await catalog.aversion(cls.CACHE_PREFIX)}:{year}'
+        fechas = await cache.aget(clave)
+        if fechas is not None:
+            return fechas
+
+        fechas = cls._expandir([fila async for fila in cls._festivos_activos(year)], year)
+        await cache.aset(clave, fechas, cls.CACHE_TIMEOUT)
+        return fechas
+
+    @classmethod
+    def _festivos_activos(cls, year):
+        # Orden del índice parcial holiday_active_idx: no recorre los inactivos
+        return cls.objects.filter(active=True).filter(
+            models.Q(recurring=True) | models.Q(date__year=year)
+        ).order_by('recurring', 'date').values_list('name', 'date', 'recurring')
+
+    @staticmethod
+    def _expandir(festivos, year):
+        fechas = {}
+        for nombre, fecha, recurrente in festivos:
+            if recurrente:
+                try:
+                    fecha = fecha.replace(year=year)
+                except ValueError:
+                    # 29 de febrero en un año no bisiesto
+                    continue
+            fechas.setdefault(fecha, nombre)
+        return fechas
+
+    @classmethod
+    def invalidar_indice(cls):
+        """Descarta los índices de todos los años (al guardar o borrar un festivo)"""
+        catalog.invalidar(cls.CACHE_PREFIX)
+
     @classmethod
     def is_holiday(cls, check_date):
         """Método de clase para verificar si una fecha es festivo"""
-        holidays = cls.objects.filter(active=True)
-        for holiday in holidays:
-            if holiday.is_holiday_for_date(check_date):
-                return True
-        return False
+        return check_date in cls.fechas_del_año(check_date.year)
 
     class Meta:
         verbose_name = "Día Festivo"
         verbose_name_plural = "Días Festivos"
         ordering = ['date']
+        indexes = [
+            # Índice de festivos por año: solo los activos, recurrentes o por fecha
+            models.Index(fields=['recurring', 'date'], condition=models.Q(active=True),
+                         name='holiday_active_idx'),
+        ]
+
+
+class Outbox(models.Model):
+    """
+    Cola persistente de correos. Las funciones de utils.py encolan aquí y el
+    comando procesar_outbox los envía en segundo plano con reintentos.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pendiente'),
+        (SENDING, 'Enviando'),
+        (SENT, 'Enviado'),
+        (FAILED, 'Fallido'),
+    ]
+
+    kind = models.CharField(max_length=30)
+    subject = models.CharField(max_length=255)
+    # Destinatarios y cuerpo (contienen datos personales): JSON encriptado
+    _payload = models.TextField(db_column='payload')
+    schedule = models.ForeignKey('Schedule', null=True, blank=True, on_delete=models.SET_NULL,
+                                 related_name='emails')
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # Próximo intento; mientras se envía, hace de plazo de la reserva del worker
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True, default='')
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def payload(self):
+        return json.loads(encryptor.decrypt(self._payload) or '{}')
+
+    @payload.setter
+    def payload(self, value):
+        self._payload = encryptor.encrypt(json.dumps(value))
+
+    def __str__(self):
+        return f"{self.kind} - {self.subject} ({self.status})"
+
+    class Meta:
+        verbose_name = "Email"
+        verbose_name_plural = "Bandeja de salida"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
@@ -0,0 +1,150 @@
+# appointment/outbox.py
+"""
+Despacho de la bandeja de salida (Outbox).
+
+El worker reserva lotes de correos pendientes con una sola sentencia UPDATE
+(claim_token + plazo en next_attempt_at), los reparte entre un número
+limitado de hilos que reutilizan su conexión SMTP y registra el resultado de
+cada uno con reintentos y espera exponencial.
+"""
+import logging
+import random
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics
+from .models import Outbox
+from .utils import construir_email
+
+logger = logging.getLogger('appointment.outbox')
+
+# Tiempo que un worker tiene reservado un correo antes de que otro pueda retomarlo
+PLAZO_RESERVA = timedelta(minutes=10)
+# Espera base entre reintentos (se duplica en cada intento)
+ESPERA_BASE = timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_BACKOFF', 30))
+
+
+def reclamar_lote(limite):
+    """
+    Reserva hasta `limite` correos listos para enviar y los devuelve.
+    Incluye los que quedaron 'enviando' de un worker caído cuyo plazo venció.
+    """
+    ahora = timezone.now()
+    listos = (
+        Q(status=Outbox.PENDING, next_attempt_at__lte=ahora)
+        | Q(status=Outbox.SENDING, next_attempt_at__lte=ahora)
+    )
+    ids = list(
+        Outbox.objects.filter(listos).order_by('next_attempt_at').values_list('id', flat=True)[:limite]
+    )
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    Outbox.objects.filter(listos, id__in=ids).update(
+        status=Outbox.SENDING,
+        claim_token=token,
+        attempts=F('attempts') + 1,
+        next_attempt_at=ahora + PLAZO_RESERVA,
+    )
+    return list(Outbox.objects.filter(claim_token=token, status=Outbox.SENDING))
+
+
+def _marcar_enviado(mensaje):
+    Outbox.objects.filter(id=mensaje.id, claim_token=mensaje.claim_token).update(
+        status=Outbox.SENT, sent_at=timezone.now(), last_error='', claim_token=''
+    )
+
+
+def _marcar_fallido(mensaje, error):
+    if mensaje.attempts >= mensaje.max_attempts:
+        estado, siguiente = Outbox.FAILED, timezone.now()
+    else:
+        espera = ESPERA_BASE * (2 ** (mensaje.attempts - 1))
+        espera += timedelta(seconds=random.uniform(0, ESPERA_BASE.total_seconds()))
+        estado, siguiente = Outbox.PENDING, timezone.now() + espera
+    Outbox.objects.filter(id=mensaje.id, claim_token=mensaje.claim_token).update(
+        status=estado, next_attempt_at=siguiente, last_error=str(error)[:2000], claim_token=''
+    )
+    return estado
+
+
+def enviar_mensajes(mensajes):
+    """
+    Envía una parte del lote por una única conexión SMTP.
+    Devuelve (enviados, reintentos, fallidos).
+    """
+    enviados = reintentos = fallidos = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        try:
+            connection.open()
+        except Exception as e:
+            error_conexion = e
+        else:
+            error_conexion = None
+
+        for mensaje in mensajes:
+            try:
+                if error_conexion is not None:
+                    raise error_conexion
+                datos = mensaje.payload
+                email = construir_email(
+                    mensaje.subject, datos['to'], datos.get('body', ''), datos.get('html'),
+                    connection=connection,
+                )
+                with metrics.medir('appointment_email_seconds', stage='smtp', kind=mensaje.kind):
+                    connection.send_messages([email])
+                _marcar_enviado(mensaje)
+                enviados += 1
+            except Exception as e:
+                metrics.incrementar('appointment_errors_total', target='smtp')
+                logger.warning('[OUTBOX] Error al enviar email %s (intento %s): %s', mensaje.id, mensaje.attempts, e)
+                if _marcar_fallido(mensaje, e) == Outbox.FAILED:
+                    fallidos += 1
+                else:
+                    reintentos += 1
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+    return enviados, reintentos, fallidos
+
+
+def _enviar_en_hilo(mensajes):
+    try:
+        return enviar_mensajes(mensajes)
+    finally:
+        # Cada hilo del pool abre su propia conexión a la base de datos
+        connections.close_all()
+
+
+def procesar_lote(limite=50, workers=2):
+    """
+    Reserva un lote y lo envía repartido en `workers` hilos (cada uno con su
+    conexión SMTP). Devuelve (reservados, enviados, reintentos, fallidos).
+    """
+    mensajes = reclamar_lote(limite)
+    if not mensajes:
+        return 0, 0, 0, 0
+
+    workers = max(1, min(workers, len(mensajes)))
+    partes = [mensajes[i::workers] for i in range(workers)]
+    if workers == 1:
+        resultados = [enviar_mensajes(partes[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            resultados = list(pool.map(_enviar_en_hilo, partes))
+
+    enviados = sum(r[0] for r in resultados)
+    reintentos = sum(r[1] for r in resultados)
+    fallidos = sum(r[2] for r in resultados)
+    return len(mensajes), enviados, reintentos, fallidos
@@ -0,0 +1,50 @@
+# appointment/procesos.py
+"""
+Procesos hijos para los comandos de carga y benchmark.
+
+Se arrancan con 'spawn' y no con 'fork': fork copia al hijo las conexiones
+abiertas, los hilos y los locks del padre (cliente de caché, logging en cola,
+clientes httpx) en el estado en que estén, y no existe en todas las
+plataformas. Con spawn cada hijo es un intérprete limpio que configura Django
+antes de recibir trabajo; por eso este módulo no importa nada de Django a
+nivel de módulo y las funciones de trabajo se resuelven después de
+django.setup().
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def contexto():
+    return multiprocessing.get_context('spawn')
+
+
+def iniciar_django(barrera=None):
+    """
+    Inicializador de cada hijo (hereda DJANGO_SETTINGS_MODULE del padre).
+    Con `barrera`, espera a que todos los hijos estén listos.
+    """
+    import django
+    django.setup()
+    if barrera is not None:
+        barrera.wait()
+
+
+def pool(procesos, sincronizar=False):
+    """
+    ProcessPoolExecutor con Django configurado en cada proceso. Con
+    `sincronizar`, los procesos esperan en el inicializador a que arranquen
+    todos: hay que enviar al menos `procesos` tareas de golpe.
+    """
+    ctx = contexto()
+    barrera = ctx.Barrier(procesos) if sincronizar else None
+    return ProcessPoolExecutor(
+        max_workers=procesos, mp_context=ctx, initializer=iniciar_django, initargs=(barrera,)
+    )
+
+
+
+def ejecutar(ruta, *args):
+    """Destino de Process: configura Django y llama a la función `ruta` (módulo.función)"""
+    iniciar_django()
+    from django.utils.module_loading import import_string
+    return import_string(ruta)(*args)
@@ -0,0 +1,86 @@
+# appointment/promos.py
+"""
+Canje de códigos promocionales.
+
+La búsqueda usa la columna code_normalized (índice único) y guarda en caché
+los códigos consultados, versionados igual que los festivos: cualquier cambio
+en PromoCode invalida la caché completa.
+
+El canje se hace con un único UPDATE condicional (current_uses + 1 solo si el
+código sigue activo, vigente y sin agotar). Ese UPDATE bloquea la fila del
+código hasta el final de la transacción, así que el límite por cliente se
+comprueba después sin carreras entre reservas simultáneas.
+"""
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import catalog
+from .models import PromoCode, Schedule
+
+CACHE_PREFIX = 'promos'
+CACHE_TIMEOUT = 60 * 5
+# Marca de "no existe" en caché, para no consultar la base con códigos inventados
+_NO_EXISTE = 0
+
+
+class PromoInvalida(Exception):
+    """El código no puede aplicarse; el mensaje es apto para el cliente"""
+
+
+def invalidar_cache():
+    catalog.invalidar(CACHE_PREFIX)
+
+
+def obtener(codigo):
+    """PromoCode del código (sin distinguir mayúsculas ni espacios) o None"""
+    normalizado = PromoCode.normalizar(codigo)
+    if not normalizado:
+        return None
+    clave = f'{CACHE_PREFIX}:{catalog.version(CACHE_PREFIX)}:{normalizado}'
+    promo = cache.get(clave)
+    if promo is None:
+        promo = PromoCode.objects.filter(code_normalized=normalizado).first() or _NO_EXISTE
+        cache.set(clave, promo, CACHE_TIMEOUT)
+    return promo or None
+
+
+def validar(codigo):
+    """Devuelve el PromoCode aplicable o lanza PromoInvalida con el motivo"""
+    promo = obtener(codigo)
+    if promo is None:
+        raise PromoInvalida('El código promocional no existe.')
+    if not promo.active:
+        raise PromoInvalida('El código promocional no está activo.')
+    now = timezone.now()
+    if now < promo.valid_from:
+        raise PromoInvalida('El código promocional aún no es válido.')
+    if now > promo.valid_to:
+        raise PromoInvalida('El código promocional ha expirado.')
+    if promo.max_uses is not None and promo.current_uses >= promo.max_uses:
+        raise PromoInvalida('El código promocional ya alcanzó su límite de usos.')
+    return promo
+
+
+def canjear(cita):
+    """
+    Suma un uso al código de la cita ya guardada, respetando max_uses y
+    max_uses_per_customer. Debe llamarse dentro de la transacción de la reserva
+    para que un PromoInvalida la deshaga por completo.
+    """
+    promo = cita.promo_code
+    now = timezone.now()
+    actualizados = PromoCode.objects.filter(
+        Q(max_uses__isnull=True) | Q(max_uses__gt=F('current_uses')),
+        pk=promo.pk, active=True, valid_from__lte=now, valid_to__gte=now,
+    ).update(current_uses=F('current_uses') + 1)
+    if not actualizados:
+        raise PromoInvalida('El código promocional ya no está disponible.')
+
+    if promo.max_uses_per_customer is not None and cita.email_hash:
+        usos = Schedule.objects.filter(promo_code=promo, email_hash=cita.email_hash).count()
+        if usos > promo.max_uses_per_customer:
+            raise PromoInvalida('Ya usaste este código promocional el máximo de veces permitido.')
+
+    promo.refresh_from_db(fields=['current_uses'])
+    return promo
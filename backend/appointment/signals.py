@@ -0,0 +1,86 @@
+# appointment/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import blind_index, intervals, promos
+from .booking import bloquear_dia
+from .catalog import invalidar_catalogo
+from .models import Holiday, PromoCode, Schedule, Service, Weekday, Workinghours
+
+
+@receiver(post_save, sender=Schedule)
+def actualizar_indice_al_guardar(sender, instance, **kwargs):
+    """Mantiene al día el índice de intervalos de la fecha de la cita"""
+    fecha_original = getattr(instance, '_fecha_original', None)
+    instance._fecha_original = instance.date
+
+    # Marca los días afectados para los deltas de /api/booking-bootstrap/
+    if not instance.__dict__.pop('_dia_bloqueado', False):
+        bloquear_dia(instance.date)
+    if fecha_original and fecha_original != instance.date:
+        bloquear_dia(fecha_original)
+
+    fechas = {instance.date, fecha_original} - {None}
+    # Solo cuando la transacción se confirma, para no dejar citas fantasma en caché
+    transaction.on_commit(lambda: intervals.descartar_dias(*fechas))
+
+
+@receiver(post_save, sender=Schedule)
+def actualizar_indice_busqueda(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Regenera los tokens de búsqueda si cambió algún campo cifrado. Se hace al
+    confirmar la transacción: fuera del bloqueo del día que toma reservar()
+    """
+    if update_fields is not None and not set(update_fields) & set(Schedule.COLUMNAS_CIFRADAS):
+        return
+    cifrado = instance.columnas_cifradas()
+    if not created and cifrado == getattr(instance, '_cifrado_original', None):
+        return
+    instance._cifrado_original = cifrado
+    # robust: la cita ya está guardada; un fallo del índice solo se registra
+    transaction.on_commit(lambda: _indexar(instance), robust=True)
+
+
+def _indexar(cita):
+    # Pudo borrarse en la misma transacción
+    if Schedule.objects.filter(pk=cita.pk).exists():
+        blind_index.indexar(cita)
+
+
+@receiver(post_delete, sender=Schedule)
+def actualizar_indice_al_eliminar(sender, instance, **kwargs):
+    bloquear_dia(instance.date)
+    transaction.on_commit(lambda: intervals.descartar_dias(instance.date))
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalidar_indices_por_servicio(sender, instance, **kwargs):
+    """Si cambia la duración de un servicio, los intervalos guardados ya no son válidos"""
+    intervals.invalidar_indices()
+
+
+@receiver(post_save, sender=Holiday)
+@receiver(post_delete, sender=Holiday)
+def invalidar_indice_festivos(sender, instance, **kwargs):
+    Holiday.invalidar_indice()
+
+
+@receiver(post_save, sender=PromoCode)
+@receiver(post_delete, sender=PromoCode)
+def invalidar_cache_promos(sender, instance, **kwargs):
+    promos.invalidar_cache()
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=Weekday)
+@receiver(post_delete, sender=Weekday)
+@receiver(post_save, sender=Workinghours)
+@receiver(post_delete, sender=Workinghours)
+@receiver(post_save, sender=Holiday)
+@receiver(post_delete, sender=Holiday)
+def invalidar_cache_catalogo(sender, instance, **kwargs):
+    """Cualquier cambio de catálogo invalida las respuestas cacheadas"""
+    invalidar_catalogo()
@@ -1,3 +1,887 @@
-from django.test import TestCase
+import csv
+import io
+import logging
+import re
+import threading
+from datetime import date, datetime, time, timedelta
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from asgiref.sync import async_to_sync
+from cryptography.fernet import Fernet, InvalidToken
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Q
+from django.db.models.functions import Upper
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import blind_index, export, outbox
+from .availability import (
+    calcular_disponibilidad, espacios_libres, fusionar_intervalos, generar_horarios,
+)
+from .booking import CANCELACION_AVISADA, CANCELACION_PASADA, HorarioOcupado, cancelar, reservar
+from .captcha import RecaptchaVerifier
+from .encryption import FieldEncryptor, contar_operaciones
+from .intervals import IndiceDia, obtener_indice
+from .log import FiltroPII, ManejadorCola
+from .models import DayLock, Holiday, Outbox, PromoCode, Schedule, Service, Weekday, Workinghours
+
+FECHA = date(2030, 1, 7)
+
+
+class PlanConsultasTests(TestCase):
+    """
+    Las consultas calientes deben resolverse por índice. Con tablas casi vacías
+    PostgreSQL prefiere recorrerlas enteras, así que allí se desactiva Seq Scan
+    para ver si existe un índice utilizable.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.servicio = Service.objects.create(name='Corte', duration=timedelta(minutes=30), price=100)
+        cls.promo = PromoCode.objects.create(
+            code='HOT10', discount_percentage=10,
+            valid_from=timezone.now(), valid_to=timezone.now() + timedelta(days=30),
+        )
+        Holiday.objects.create(name='Navidad', date=date(2000, 12, 25), recurring=True)
+
+    def plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def assertSinRecorridoCompleto(self, queryset):
+        opciones = queryset.model._meta
+        tabla = opciones.db_table
+        plan = self.plan(queryset)
+        if connection.vendor == 'postgresql':
+            completo = re.search(rf'Seq Scan on {tabla}\b', plan)
+        elif connection.vendor == 'sqlite':
+            # SEARCH usa el índice; "SCAN tabla" recorre todas las filas, salvo
+            # que recorra un índice parcial (solo contiene las filas que cumplen la condición)
+            parciales = {indice.name for indice in opciones.indexes if indice.condition is not None}
+            completo = next((
+                linea for linea in re.finditer(
+                    rf'\bSCAN (?:TABLE )?{tabla}\b(?: USING (?:COVERING )?INDEX (\w+))?', plan)
+                if linea.group(1) not in parciales
+            ), None)
+        else:
+            self.skipTest(f'Sin comprobación de planes para {connection.vendor}')
+        self.assertIsNone(completo, f'Recorrido completo de {tabla}:\n{plan}')
+
+    def test_cita_por_fecha_y_hora(self):
+        self.assertSinRecorridoCompleto(Schedule.objects.filter(date=date(2030, 1, 1), time=time(10)))
+
+    def test_citas_del_dia(self):
+        # reservar(), obtener_indice() y enviar_recordatorios
+        self.assertSinRecorridoCompleto(Schedule.objects.filter(date=date(2030, 1, 1)).order_by('time'))
+
+    def test_ocupacion_por_rango(self):
+        self.assertSinRecorridoCompleto(
+            Schedule.objects.filter(date__range=(date(2030, 1, 1), date(2030, 1, 31))).order_by('date', 'time')
+        )
+
+    def test_citas_de_un_servicio(self):
+        self.assertSinRecorridoCompleto(
+            Schedule.objects.filter(service=self.servicio, date__gte=date(2030, 1, 1)).values('id', 'date', 'time')
+        )
+
+    def test_usos_de_promo_por_cliente(self):
+        self.assertSinRecorridoCompleto(Schedule.objects.filter(promo_code=self.promo, email_hash='x'))
+
+    def test_festivos_del_año(self):
+        self.assertSinRecorridoCompleto(
+            Holiday.objects.filter(active=True).filter(Q(recurring=True) | Q(date__year=2030))
+            .order_by('recurring', 'date')
+        )
+
+    def test_codigo_promocional(self):
+        self.assertSinRecorridoCompleto(PromoCode.objects.filter(code_normalized='HOT10'))
+        self.assertSinRecorridoCompleto(
+            PromoCode.objects.annotate(codigo=Upper('code')).filter(codigo='HOT10')
+        )
+
+    def test_outbox_pendientes(self):
+        self.assertSinRecorridoCompleto(
+            Outbox.objects.filter(status=Outbox.PENDING, next_attempt_at__lte=timezone.now())
+        )
+
+
+class DisponibilidadTests(TestCase):
+    """Motor de disponibilidad: intervalos en minutos y horarios por servicio"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.corte = Service.objects.create(name='Corte', duration=timedelta(minutes=30), price=100)
+        cls.tinte = Service.objects.create(name='Tinte', duration=timedelta(minutes=60), price=300)
+        lunes = Weekday.objects.create(id=FECHA.isoweekday(), day='Lunes')
+        # El descanso de 13:00 a 15:00 es el hueco entre los dos horarios del día
+        Workinghours.objects.create(day=lunes, start_time=time(9), end_time=time(13))
+        Workinghours.objects.create(day=lunes, start_time=time(15), end_time=time(17))
+
+    def setUp(self):
+        # Índices de ocupación y festivos en caché
+        cache.clear()
+
+    def horarios(self, servicio, fecha=FECHA):
+        dias = calcular_disponibilidad(servicio, fecha, fecha)
+        return dias[0]['slots'] if dias else []
+
+    def test_fusionar_intervalos(self):
+        # Solapados y contenidos se fusionan; los contiguos no
+        self.assertEqual(
+            fusionar_intervalos([(60, 90), (0, 30), (20, 40), (40, 50), (65, 70)]),
+            [[0, 40], [40, 50], [60, 90]],
+        )
+
+    def test_espacios_libres(self):
+        self.assertEqual(espacios_libres([(600, 630), (615, 660), (780, 840)], 540, 720), [(540, 600), (660, 720)])
+        # Citas que empiezan antes del horario laboral o lo cubren entero
+        self.assertEqual(espacios_libres([(500, 560)], 540, 720), [(560, 720)])
+        self.assertEqual(espacios_libres([(500, 800)], 540, 720), [])
+
+    def test_generar_horarios(self):
+        self.assertEqual(generar_horarios([(540, 600), (660, 710)], 30), [540, 570, 660])
+
+    def test_la_duracion_bloquea_el_intervalo(self):
+        Schedule.objects.create(date=FECHA, time=time(10), service=self.tinte, description='')
+        corte = self.horarios(self.corte)
+        self.assertIn('09:30', corte)
+        self.assertNotIn('10:30', corte)
+        self.assertIn('11:00', corte)
+        # 60 minutos no caben a las 09:30: terminarían dentro de la cita de las 10:00
+        self.assertEqual(self.horarios(self.tinte), ['09:00', '11:00', '12:00', '15:00', '16:00'])
+
+    def test_descanso_entre_horarios(self):
+        self.assertEqual(self.horarios(self.tinte), ['09:00', '10:00', '11:00', '12:00', '15:00', '16:00'])
+        self.assertFalse({'13:00', '13:30', '14:00', '14:30'} & set(self.horarios(self.corte)))
+
+    def test_festivos(self):
+        Holiday.objects.create(name='Puente', date=FECHA)
+        Holiday.objects.create(name='Aniversario', date=date(2001, 1, 14), recurring=True)
+        dias = calcular_disponibilidad(self.corte, FECHA, FECHA + timedelta(days=14))
+        self.assertEqual([dia['date'] for dia in dias], [date(2030, 1, 21)])
+
+    def test_hoy_descarta_horarios_pasados(self):
+        reloj = mock.Mock(localdate=lambda: FECHA, localtime=lambda: datetime.combine(FECHA, time(11, 10)))
+        with mock.patch('appointment.availability.timezone', reloj):
+            self.assertEqual(
+                self.horarios(self.corte),
+                ['11:30', '12:00', '12:30', '15:00', '15:30', '16:00', '16:30'],
+            )
+            # Los días anteriores a hoy no se consultan
+            dias = calcular_disponibilidad(self.corte, FECHA - timedelta(days=7), FECHA)
+            self.assertEqual([dia['date'] for dia in dias], [FECHA])
+
+
+class IndiceDiaTests(TestCase):
+    """Intervalos [inicio, fin) en minutos"""
+
+    def setUp(self):
+        # 10:00-10:30 y 11:00-12:00
+        self.indice = IndiceDia([(600, 630, 1), (660, 720, 2)])
+
+    def test_solapamientos(self):
+        self.assertTrue(self.indice.solapa(615, 645))
+        self.assertTrue(self.indice.solapa(540, 700))
+        self.assertTrue(self.indice.solapa(670, 680))
+
+    def test_citas_contiguas_no_se_solapan(self):
+        self.assertFalse(self.indice.solapa(630, 660))
+        self.assertFalse(self.indice.solapa(570, 600))
+        self.assertFalse(self.indice.solapa(720, 750))
+
+    def test_cita_larga_anterior(self):
+        # 09:00-12:00 cubre 10:40 aunque la cita que empieza justo antes termine a las 10:30
+        indice = IndiceDia([(540, 720, 1), (600, 630, 2)])
+        self.assertTrue(indice.solapa(640, 650))
+
+    def test_excluir_la_cita_que_se_edita(self):
+        self.assertFalse(self.indice.solapa(600, 630, excluir=1))
+        self.assertTrue(self.indice.solapa(600, 630, excluir=2))
+
+    def test_agregar_y_quitar(self):
+        self.indice.agregar(630, 660, 3)
+        self.assertTrue(self.indice.solapa(640, 650))
+        self.assertTrue(self.indice.quitar(3))
+        self.assertFalse(self.indice.quitar(3))
+        self.assertFalse(self.indice.solapa(640, 650))
+
+
+@override_settings(CAPTCHA_BACKEND='appointment.captcha.StubCaptchaVerifier')
+class ReservaApiTests(TestCase):
+    """POST /api/schedule/: solapamientos y límites de códigos promocionales"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.servicio = Service.objects.create(name='Corte', duration=timedelta(minutes=30), price=100)
+
+    def setUp(self):
+        # Los índices de ocupación y los códigos viven en la caché, que no se deshace con la transacción
+        cache.clear()
+
+    def reservar(self, hora, email='ana@example.com', **extra):
+        # Ejecuta los on_commit (índice en caché, correos) como tras una transacción real
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/schedule/', {
+                'date': FECHA.isoformat(),
+                'time': hora,
+                'name': 'Ana López',
+                'email': email,
+                'phone': '5512345678',
+                'description': 'Corte de pelo',
+                'service': self.servicio.id,
+                'captchaToken': 'prueba',
+                **extra,
+            }, content_type='application/json')
+
+    def crear_promo(self, **campos):
+        ahora = timezone.now()
+        return PromoCode.objects.create(
+            code='HOT10', discount_percentage=10,
+            valid_from=ahora - timedelta(days=1), valid_to=ahora + timedelta(days=30), **campos
+        )
+
+    def test_rechaza_horario_solapado(self):
+        self.assertEqual(self.reservar('10:00:00').status_code, 201)
+        respuesta = self.reservar('10:15:00', email='bea@example.com')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('appointment_conflict', respuesta.json())
+        self.assertEqual(self.reservar('10:30:00', email='bea@example.com').status_code, 201)
+        self.assertEqual(Schedule.objects.count(), 2)
+
+    def test_reservar_comprueba_la_base_y_no_la_cache(self):
+        # Cita que el índice en caché aún no conoce (p. ej. de otro worker)
+        self.assertEqual(self.reservar('09:00:00').status_code, 201)
+        Schedule.objects.bulk_create([
+            Schedule(date=FECHA, time=time(11), service=self.servicio, description=''),
+        ])
+        cita = Schedule(date=FECHA, time=time(11, 10), service=self.servicio, description='')
+        with self.assertRaises(HorarioOcupado):
+            reservar(cita)
+        self.assertIsNone(cita.pk)
+        self.assertEqual(Schedule.objects.filter(date=FECHA).count(), 2)
+
+    def test_modificar_pasa_por_reservar(self):
+        self.assertEqual(self.reservar('10:00:00').status_code, 201)
+        cita_id = self.reservar('11:00:00', email='bea@example.com').json()['id']
+
+        def modificar(**datos):
+            with self.captureOnCommitCallbacks(execute=True):
+                return self.client.patch(f'/api/schedule/{cita_id}/', datos, content_type='application/json')
+
+        respuesta = modificar(time='10:15:00')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('appointment_conflict', respuesta.json())
+        # Su propio horario no cuenta como solapamiento
+        self.assertEqual(modificar(time='11:15:00').status_code, 200)
+        self.assertEqual(modificar(description='Barba').status_code, 200)
+
+        antes = DayLock.objects.get(date=FECHA).version
+        self.assertEqual(modificar(time='10:30:00').status_code, 200)
+        self.assertEqual(Schedule.objects.get(pk=cita_id).time, time(10, 30))
+        self.assertEqual(DayLock.objects.get(date=FECHA).version, antes + 1)
+
+        # Cita que el índice en caché no conoce: solo la comprobación en la base la detecta
+        Schedule.objects.bulk_create([
+            Schedule(date=FECHA, time=time(12), service=self.servicio, description=''),
+        ])
+        respuesta = modificar(time='12:10:00')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('appointment_conflict', respuesta.json())
+
+        with mock.patch('appointment.api.serializers.reservar', side_effect=IntegrityError):
+            respuesta = modificar(time='13:00:00')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('appointment_conflict', respuesta.json())
+
+    def test_reservas_intercaladas_no_se_pisan_en_cache(self):
+        obtener_indice(FECHA)  # índice del día ya en caché
+        with self.captureOnCommitCallbacks() as primera:
+            reservar(Schedule(date=FECHA, time=time(10), service=self.servicio, description=''))
+        with self.captureOnCommitCallbacks() as segunda:
+            reservar(Schedule(date=FECHA, time=time(11), service=self.servicio, description=''))
+
+        # La segunda se confirma mientras la primera todavía está leyendo la caché
+        def get_intercalado(*args, **kwargs):
+            valor = cache.get(*args, **kwargs)
+            while segunda:
+                segunda.pop(0)()
+            return valor
+
+        with mock.patch('appointment.intervals.cache', mock.Mock(wraps=cache, get=get_intercalado)):
+            for callback in primera:
+                callback()
+        for callback in segunda:
+            callback()
+
+        libres = espacios_libres(obtener_indice(FECHA).intervalos(), 9 * 60, 12 * 60)
+        self.assertEqual(libres, [(540, 600), (630, 660), (690, 720)])
+
+    def test_max_uses(self):
+        promo = self.crear_promo(max_uses=1)
+        self.assertEqual(self.reservar('10:00:00', promo_code_text='hot10').status_code, 201)
+        respuesta = self.reservar('11:00:00', email='bea@example.com', promo_code_text='HOT10')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('promo_code', respuesta.json())
+        # El canje rechazado deshace también la cita
+        self.assertEqual(Schedule.objects.count(), 1)
+        promo.refresh_from_db()
+        self.assertEqual(promo.current_uses, 1)
+
+    def test_max_uses_per_customer(self):
+        promo = self.crear_promo(max_uses_per_customer=1)
+        self.assertEqual(self.reservar('10:00:00', promo_code_text='HOT10').status_code, 201)
+        respuesta = self.reservar('11:00:00', email='ANA@example.com', promo_code_text='HOT10')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('promo_code', respuesta.json())
+        self.assertEqual(
+            self.reservar('12:00:00', email='bea@example.com', promo_code_text='HOT10').status_code, 201
+        )
+        promo.refresh_from_db()
+        self.assertEqual(promo.current_uses, 2)
+
+
+class CarreraReservaTests(TransactionTestCase):
+    """Dos reservas simultáneas del mismo horario: el bloqueo del día deja pasar solo una"""
+
+    def test_bloqueo_del_dia(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('La base de pruebas en memoria no admite conexiones simultáneas')
+        servicio = Service.objects.create(name='Corte', duration=timedelta(minutes=30), price=100)
+        barrera = threading.Barrier(2)
+        resultados = []
+
+        def intentar(hora):
+            try:
+                barrera.wait()
+                with transaction.atomic():
+                    reservar(Schedule(date=FECHA, time=hora, service=servicio, description=''))
+                resultados.append('ok')
+            except HorarioOcupado:
+                resultados.append('ocupado')
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=intentar, args=(hora,)) for hora in (time(10), time(10, 15))]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(sorted(resultados), ['ocupado', 'ok'])
+        self.assertEqual(Schedule.objects.filter(date=FECHA).count(), 1)
+
+
+class CatalogoApiTests(TestCase):
+    """ETag y 304 de los endpoints de catálogo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.servicio = Service.objects.create(name='Corte', duration=timedelta(minutes=30), price=100)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_304_con_el_mismo_etag(self):
+        respuesta = self.client.get('/api/service/')
+        self.assertEqual(respuesta.status_code, 200)
+        etag = respuesta['ETag']
+        respuesta = self.client.get('/api/service/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta['ETag'], etag)
+
+    def test_cambiar_un_servicio_cambia_el_etag(self):
+        etag = self.client.get('/api/service/')['ETag']
+        self.servicio.price = 120
+        self.servicio.save()
+        respuesta = self.client.get('/api/service/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertEqual(float(respuesta.json()[0]['price']), 120)
+
+    def test_cambiar_un_festivo_cambia_el_etag(self):
+        url = '/api/blocked-dates/?year=2030'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Holiday.objects.create(name='Puente', date=FECHA)
+        respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertEqual(respuesta.json()['blocked_dates'], [{'date': '2030-01-07', 'name': 'Puente'}])
+
+
+class BootstrapApiTests(TestCase):
+    """/api/booking-bootstrap/: respuesta completa y deltas con `since`"""
+
+    url = '/api/booking-bootstrap/?year=2030&month=1'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.servicio = Service.objects.create(name='Corte', duration=timedelta(minutes=30), price=100)
+        Schedule.objects.create(date=FECHA, time=time(10), service=cls.servicio, description='')
+        Schedule.objects.create(date=FECHA + timedelta(days=1), time=time(10), service=cls.servicio, description='')
+        # Cambios anteriores al margen de los deltas
+        DayLock.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+    def setUp(self):
+        cache.clear()
+
+    def pedir(self, since=None):
+        respuesta = self.client.get(self.url + (f'&since={since}' if since else ''))
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def test_respuesta_completa(self):
+        datos = self.pedir()
+        self.assertFalse(datos['delta'])
+        self.assertEqual([s['name'] for s in datos['catalog']['services']], ['Corte'])
+        self.assertEqual([c['date'] for c in datos['occupancy']], ['2030-01-07', '2030-01-08'])
+
+    def test_delta_sin_cambios(self):
+        datos = self.pedir(self.pedir()['version'])
+        self.assertTrue(datos['delta'])
+        self.assertNotIn('catalog', datos)
+        self.assertEqual((datos['changed_dates'], datos['occupancy']), ([], []))
+
+    def test_delta_con_una_reserva(self):
+        version = self.pedir()['version']
+        reservar(Schedule(date=FECHA, time=time(11), service=self.servicio, description=''))
+
+        datos = self.pedir(version)
+        self.assertNotIn('catalog', datos)
+        self.assertEqual(datos['changed_dates'], ['2030-01-07'])
+        self.assertEqual([c['time'] for c in datos['occupancy']], ['10:00:00', '11:00:00'])
+
+    def test_cambio_de_catalogo_o_de_mes(self):
+        version = self.pedir()['version']
+        Holiday.objects.create(name='Puente', date=date(2030, 1, 14))
+        datos = self.pedir(version)
+        self.assertTrue(datos['delta'])
+        self.assertEqual(datos['catalog']['blocked_dates'], [{'date': '2030-01-14', 'name': 'Puente'}])
+
+        # Un token de otro mes no sirve para deltas
+        otro_mes = self.client.get(f'/api/booking-bootstrap/?year=2030&month=2&since={datos["version"]}').json()
+        self.assertFalse(otro_mes['delta'])
+        self.assertIn('catalog', otro_mes)
+
+    def test_token_invalido(self):
+        datos = self.pedir('no-es-un-token')
+        self.assertFalse(datos['delta'])
+        self.assertIn('catalog', datos)
+
+
+class ExportacionTests(TestCase):
+    def setUp(self):
+        servicio = Service.objects.create(name='@Corte', duration=timedelta(minutes=30), price=100)
+        Schedule.objects.create(
+            date=FECHA, time=time(10), service=servicio, description='',
+            name='=HYPERLINK("http://example.com","Ana")', email='ana@example.com', phone='+5512345678',
+        )
+
+    def test_neutraliza_formulas(self):
+        fila = next(export.filas(Schedule.objects.all()))
+        self.assertEqual(fila[0], '\'=HYPERLINK("http://example.com","Ana")')
+        self.assertEqual(fila[1], "'+5512345678")
+        self.assertEqual(fila[4], "'@Corte")
+        self.assertEqual(fila[2:4], ['2030-01-07', '10:00'])
+
+    def test_excel_guarda_texto_y_no_formulas(self):
+        contenido = b''.join(export.respuesta_excel(Schedule.objects.all()).streaming_content)
+        hoja = openpyxl.load_workbook(io.BytesIO(contenido)).active
+        celda = hoja['A2']
+        self.assertEqual(celda.data_type, 's')
+        self.assertTrue(celda.value.startswith("'="))
+
+    def test_csv(self):
+        contenido = b''.join(export.respuesta_csv(Schedule.objects.all()).streaming_content).decode()
+        fila = next(csv.reader(io.StringIO(contenido.splitlines()[1])))
+        self.assertEqual([fila[0][:2], fila[1]], ["'=", "'+5512345678"])
+
+
+class CancelacionTests(TestCase):
+    """cancelar(): avisos solo cuando el borrado se confirma"""
+
+    @classmethod
+    def setUpTestData(cls):
+        servicio = Service.objects.create(name='Corte', duration=timedelta(minutes=30), price=100)
+        cls.pasada = date(2020, 1, 6)
+        for fecha in (FECHA, cls.pasada):
+            Schedule.objects.create(
+                date=fecha, time=time(10), service=servicio, description='',
+                name='Ana López', email='ana@example.com', phone='5512345678',
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def version(self, fecha):
+        return DayLock.objects.filter(date=fecha).values_list('version', flat=True).first() or 0
+
+    @override_settings(EMAIL_OUTBOX=False)
+    def test_un_correo_tras_confirmar(self):
+        antes = self.version(FECHA)
+        with self.captureOnCommitCallbacks(execute=True):
+            resultados = cancelar(Schedule.objects.all())
+            self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['ana@example.com'])
+        self.assertEqual(
+            {cita.date: estado for cita, estado, _ in resultados},
+            {FECHA: CANCELACION_AVISADA, self.pasada: CANCELACION_PASADA},
+        )
+        self.assertFalse(Schedule.objects.exists())
+        # El día cambia de versión para los deltas de /api/booking-bootstrap/
+        self.assertEqual(self.version(FECHA), antes + 1)
+
+    @override_settings(EMAIL_OUTBOX=False)
+    def test_sin_correos_si_se_deshace(self):
+        antes = self.version(FECHA)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                cancelar(Schedule.objects.all())
+                raise RuntimeError('fallo después de cancelar')
+
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(Schedule.objects.count(), 2)
+        self.assertEqual(self.version(FECHA), antes)
+
+    def test_outbox_encola_tras_confirmar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cancelar(Schedule.objects.all())
+            self.assertFalse(Outbox.objects.exists())
+        self.assertEqual(list(Outbox.objects.values_list('kind', flat=True)), ['cancelacion'])
+
+
+class AdminCitasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        servicio = Service.objects.create(name='Corte', duration=timedelta(minutes=30), price=100)
+        hoy = timezone.localdate()
+        cls.citas = [
+            Schedule.objects.create(
+                date=fecha, time=time(10), service=servicio, description='',
+                name='Ana López', email='ana@example.com', phone='5512345678',
+            )
+            for fecha in (hoy, hoy + timedelta(days=60))
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def test_filtro_por_rango_de_fechas(self):
+        url = reverse('admin:appointment_schedule_changelist')
+        self.assertEqual(list(self.client.get(url, {'rango': 'hoy'}).context['cl'].result_list), self.citas[:1])
+        self.assertEqual(len(self.client.get(url).context['cl'].result_list), 2)
+
+    def test_errores_de_borrado_sin_datos_personales(self):
+        with mock.patch('appointment.booking.email_cancelacion', side_effect=ValueError('sin plantilla')):
+            respuesta = self.client.post(reverse('admin:appointment_schedule_changelist'), {
+                'action': 'delete_selected', 'post': 'yes',
+                '_selected_action': [cita.pk for cita in self.citas],
+            }, follow=True)
+
+        mensajes = [str(m) for m in get_messages(respuesta.wsgi_request)]
+        self.assertTrue(any(f'#{self.citas[0].pk}' in m for m in mensajes), mensajes)
+        self.assertFalse(any('ana@example.com' in m for m in mensajes), mensajes)
+        self.assertFalse(Schedule.objects.exists())
+
+
+class RotacionClavesTests(TestCase):
+    def setUp(self):
+        self.vieja, self.nueva = Fernet.generate_key(), Fernet.generate_key()
+
+    def test_rotar_valor(self):
+        cifrado = FieldEncryptor([self.vieja]).encrypt('ana@example.com')
+        rotador = FieldEncryptor([self.nueva, self.vieja])
+        with contar_operaciones() as operaciones:
+            rotado = rotador.rotate(cifrado)
+        self.assertEqual((operaciones.descifrados, operaciones.cifrados), (1, 1))
+        # Ya cifrado con la clave primaria: no hay nada que hacer
+        self.assertIsNone(rotador.rotate(rotado))
+        self.assertIsNone(rotador.rotate(''))
+        self.assertEqual(FieldEncryptor([self.nueva]).decrypt(rotado), 'ana@example.com')
+        # Con solo la clave retirada ya no se puede leer (y nunca se devuelve el texto cifrado)
+        self.assertEqual(FieldEncryptor([self.vieja]).decrypt(rotado), '')
+
+    def test_rotar_sobre(self):
+        datos = {'name': 'Ana', 'email': 'ana@example.com', 'phone': '5512345678'}
+        sobre = FieldEncryptor([self.vieja]).seal(datos)
+        rotador = FieldEncryptor([self.nueva, self.vieja])
+        rotado = rotador.rotate(sobre)
+        self.assertEqual(FieldEncryptor([self.nueva]).open(rotado), datos)
+        self.assertIsNone(rotador.rotate(rotado))
+
+    def test_rotar_valor_ilegible_o_en_claro(self):
+        rotador = FieldEncryptor([self.nueva])
+        with self.assertRaises(InvalidToken):
+            rotador.rotate(FieldEncryptor([self.vieja]).encrypt('ana@example.com'))
+        self.assertEqual(rotador.decrypt(rotador.rotate('dato heredado')), 'dato heredado')
+
+    def test_comando_rotar_claves(self):
+        servicio = Service.objects.create(name='Corte', duration=timedelta(minutes=30), price=100)
+        with mock.patch('appointment.models.encryptor', FieldEncryptor([self.vieja])):
+            cita = Schedule.objects.create(
+                date=FECHA, time=time(10), service=servicio, description='',
+                name='Ana López', email='ana@example.com', phone='5512345678',
+            )
+
+        rotador = FieldEncryptor([self.nueva, self.vieja])
+        with mock.patch('appointment.models.encryptor', rotador), \
+                mock.patch('appointment.management.commands.rotar_claves.encryptor', rotador):
+            call_command('rotar_claves', modelo=['schedule'], stdout=io.StringIO())
+
+        with mock.patch('appointment.models.encryptor', FieldEncryptor([self.nueva])):
+            cita = Schedule.objects.get(pk=cita.pk)
+            self.assertEqual((cita.name, cita.email, cita.phone), ('Ana López', 'ana@example.com', '5512345678'))
+
+
+class SobreTests(TestCase):
+    """Schedule con PII_ENVELOPE: guardar, leer y convivir con filas Fernet"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.servicio = Service.objects.create(name='Corte', duration=timedelta(minutes=30), price=100)
+
+    def crear(self):
+        return Schedule.objects.create(
+            date=FECHA, time=time(10), service=self.servicio, description='',
+            name='Ana López', email='ana@example.com', phone='5512345678',
+        )
+
+    def columnas(self, cita):
+        return Schedule.objects.filter(pk=cita.pk).values('_name', '_email', '_phone', '_pii').get()
+
+    def assertDatos(self, cita):
+        self.assertEqual((cita.name, cita.email, cita.phone), ('Ana López', 'ana@example.com', '5512345678'))
+
+    @override_settings(PII_ENVELOPE=True)
+    def test_guardar_y_leer(self):
+        cita = self.crear()
+        columnas = self.columnas(cita)
+        self.assertEqual([columnas['_name'], columnas['_email'], columnas['_phone']], ['', '', ''])
+        self.assertTrue(columnas['_pii'])
+
+        self.assertDatos(Schedule.objects.get(pk=cita.pk))
+        self.assertDatos(Schedule.descifrar_lote(Schedule.objects.filter(pk=cita.pk))[0])
+        self.assertTrue(Schedule.objects.filter(email_hash=Schedule.hash_value('ana@example.com')).exists())
+
+        # Cambiar un campo vuelve a sellar el sobre sin perder los demás
+        cita = Schedule.objects.get(pk=cita.pk)
+        cita.phone = '5587654321'
+        cita.save()
+        cita = Schedule.objects.get(pk=cita.pk)
+        self.assertEqual((cita.name, cita.phone), ('Ana López', '5587654321'))
+
+    def test_lee_filas_fernet_anteriores(self):
+        cita = self.crear()
+        self.assertIsNone(self.columnas(cita)['_pii'])
+
+        with override_settings(PII_ENVELOPE=True):
+            cita = Schedule.objects.get(pk=cita.pk)
+            self.assertDatos(cita)
+            # Al guardarla de nuevo pasa al formato de sobre
+            cita.description = 'Barba'
+            cita.save()
+            columnas = self.columnas(cita)
+            self.assertEqual(columnas['_email'], '')
+            self.assertTrue(columnas['_pii'])
+            self.assertDatos(Schedule.objects.get(pk=cita.pk))
+
+
+class BusquedaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        servicio = Service.objects.create(name='Corte', duration=timedelta(minutes=30), price=100)
+        # El índice se escribe en on_commit
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.citas = [
+                Schedule.objects.create(
+                    date=FECHA, time=time(9 + i), service=servicio, description='',
+                    name=nombre, email=email, phone=telefono,
+                )
+                for i, (nombre, email, telefono) in enumerate([
+                    ('Ana García', 'ana.garcia@example.com', '5512345678'),
+                    ('José Martínez', 'jose@example.org', '5598765432'),
+                    ('Mariana Gómez', 'mgomez@example.com', '5512340000'),
+                ])
+            ]
+
+    def ids(self, *indices):
+        return {self.citas[i].pk for i in indices}
+
+    def test_busqueda_parcial(self):
+        self.assertEqual(blind_index.buscar('garc'), self.ids(0))
+        self.assertEqual(blind_index.buscar('ana'), self.ids(0, 2))
+        self.assertEqual(blind_index.buscar('MARTINEZ'), self.ids(1))
+        self.assertEqual(blind_index.buscar('example.org'), self.ids(1))
+        self.assertEqual(blind_index.buscar('1234'), self.ids(0, 2))
+
+    def test_busqueda_por_campo(self):
+        self.assertEqual(blind_index.buscar('ana', campos=('email',)), self.ids(0))
+        self.assertEqual(blind_index.buscar('zzz'), set())
+
+    def test_verifica_todos_los_candidatos(self):
+        # Con lotes de uno también se descifran y comprueban todos los candidatos
+        self.assertEqual(blind_index.buscar('example', lote=1), self.ids(0, 1, 2))
+
+    def test_indexa_al_confirmar_y_solo_si_cambian_los_datos(self):
+        cita = Schedule.objects.get(pk=self.citas[0].pk)
+        with mock.patch.object(blind_index, 'indexar') as indexar:
+            with self.captureOnCommitCallbacks(execute=True):
+                cita.description = 'Sin cambios en los datos personales'
+                cita.save()
+            indexar.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                cita.name = 'Ana Ruiz'
+                cita.save()
+                # Nada dentro de la transacción (ni con el día bloqueado)
+                indexar.assert_not_called()
+            indexar.assert_called_once_with(cita)
+
+
+class BackendQueFalla(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException('servidor caído')
+
+
+class OutboxTests(TestCase):
+    def encolar(self, **campos):
+        mensaje = Outbox(kind='confirmacion', subject='Cita confirmada', **campos)
+        mensaje.payload = {'to': ['ana@example.com'], 'body': 'Hola', 'html': None}
+        mensaje.save()
+        return mensaje
+
+    def test_envio(self):
+        mensaje = self.encolar()
+        self.assertEqual(outbox.procesar_lote(workers=1), (1, 1, 0, 0))
+        mensaje.refresh_from_db()
+        self.assertEqual((mensaje.status, mensaje.attempts), (Outbox.SENT, 1))
+        self.assertEqual(mail.outbox[0].to, ['ana@example.com'])
+
+    @override_settings(EMAIL_BACKEND='appointment.tests.BackendQueFalla')
+    def test_reintento_con_espera_exponencial(self):
+        mensaje = self.encolar()
+        for intento in (1, 2):
+            antes = timezone.now()
+            self.assertEqual(outbox.procesar_lote(workers=1), (1, 0, 1, 0))
+            mensaje.refresh_from_db()
+            self.assertEqual((mensaje.status, mensaje.attempts), (Outbox.PENDING, intento))
+            self.assertIn('servidor caído', mensaje.last_error)
+            espera = outbox.ESPERA_BASE * 2 ** (intento - 1)
+            self.assertGreaterEqual(mensaje.next_attempt_at, antes + espera)
+            self.assertLessEqual(mensaje.next_attempt_at, timezone.now() + espera + outbox.ESPERA_BASE)
+            # Todavía no toca reintentar
+            self.assertEqual(outbox.procesar_lote(workers=1), (0, 0, 0, 0))
+            Outbox.objects.filter(pk=mensaje.pk).update(next_attempt_at=timezone.now())
+
+    @override_settings(EMAIL_BACKEND='appointment.tests.BackendQueFalla')
+    def test_fallido_al_agotar_intentos(self):
+        mensaje = self.encolar(max_attempts=1)
+        self.assertEqual(outbox.procesar_lote(workers=1), (1, 0, 0, 1))
+        mensaje.refresh_from_db()
+        self.assertEqual(mensaje.status, Outbox.FAILED)
+        self.assertEqual(outbox.procesar_lote(workers=1), (0, 0, 0, 0))
+
+
+class RegistrosEnLista(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lineas = []
+
+    def emit(self, record):
+        self.lineas.append(self.format(record))
+
+
+class FiltroPIITests(TestCase):
+    """Los registros llegan a los destinos sin emails, teléfonos ni nombres de clientes"""
+
+    def setUp(self):
+        self.destino = RegistrosEnLista()
+        self.manejador = ManejadorCola(destinos=[self.destino])
+        self.logger = logging.getLogger('appointment.tests.pii')
+        self.logger.addHandler(self.manejador)
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.addCleanup(self.manejador.close)
+        self.addCleanup(self.logger.removeHandler, self.manejador)
+
+    def escrito(self):
+        self.manejador.flush()
+        return '\n'.join(self.destino.lineas)
+
+    def test_mensaje_y_argumentos(self):
+        self.logger.info('Aviso para ana@example.com al +52 5512345678')
+        self.logger.info('Aviso para %s al %s', 'bea.ruiz@example.org', '55 1234 5678')
+        escrito = self.escrito()
+        for dato in ('ana@example.com', '5512345678', 'bea.ruiz@example.org', '1234 5678'):
+            self.assertNotIn(dato, escrito)
+        self.assertEqual(escrito.count('<email>'), 2)
+        self.assertEqual(escrito.count('<telefono>'), 2)
+
+    def test_extra_y_traza(self):
+        try:
+            raise ValueError('rechazado: ana@example.com')
+        except ValueError:
+            self.logger.exception('Error', extra={'cliente': 'ana@example.com'})
+        escrito = self.escrito()
+        self.assertNotIn('ana@example.com', escrito)
+        self.assertIn('rechazado: <email>', escrito)
+
+    def test_cita_como_argumento(self):
+        servicio = Service.objects.create(name='Corte', duration=timedelta(minutes=30), price=100)
+        cita = Schedule.objects.create(
+            date=FECHA, time=time(10), service=servicio, description='',
+            name='Ana López', email='ana@example.com', phone='5512345678',
+        )
+        self.logger.info('Cita guardada: %s', cita)
+        self.logger.info('Cita guardada: %(cita)s', {'cita': cita})
+        escrito = self.escrito()
+        self.assertNotIn('Ana López', escrito)
+        self.assertEqual(escrito.count(f'<Schedule {cita.pk}>'), 2)
+
+    def test_filtro_sin_cola(self):
+        registro = logging.LogRecord('x', logging.INFO, __file__, 1, 'Cita de %s: %s', ('ana@example.com', '5512345678'), None)
+        FiltroPII().filter(registro)
+        self.assertEqual(registro.getMessage(), 'Cita de <email>: <telefono>')
+
+
+class CaptchaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_token_reutilizado(self):
+        verificador = RecaptchaVerifier()
+        respuesta = mock.Mock(**{'json.return_value': {'success': True}})
+        with mock.patch.object(RecaptchaVerifier, 'session', mock.PropertyMock()) as session:
+            session.return_value.post.return_value = respuesta
+            self.assertTrue(verificador.verify('token').success)
+            repetido = verificador.verify('token')
+        self.assertFalse(repetido.success)
+        self.assertTrue(repetido.reutilizado)
+        self.assertEqual(session.return_value.post.call_count, 1)
+
+    def test_cliente_async_se_cierra_con_el_loop(self):
+        verificador = RecaptchaVerifier()
+
+        async def pedir_dos_veces():
+            return await verificador.cliente_async(), await verificador.cliente_async()
+
+        # async_to_sync crea y cierra un loop, como cada petición asíncrona bajo WSGI
+        cliente, otra_vez = async_to_sync(pedir_dos_veces)()
+        self.assertIs(cliente, otra_vez)
+        self.assertTrue(cliente.is_closed)
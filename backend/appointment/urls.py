@@ -6,4 +6,5 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('api/', include('appointment.api.urls')),
+    path('metrics', views.metricas, name='metrics'),
 ]
\ No newline at end of file
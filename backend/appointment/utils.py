@@ -1,13 +1,96 @@
 # appointment/utils.py
-from django.core.mail import EmailMultiAlternatives, send_mail
-from django.template.loader import render_to_string
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template, render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
 from decimal import Decimal
 import logging
 
+from . import metrics
+
 logger = logging.getLogger('appointment.utils')
 
+
+def construir_email(subject, to, body='', html=None, connection=None):
+    """Construye el EmailMultiAlternatives de un correo de la app"""
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=to,
+        connection=connection,
+    )
+    if html:
+        email.attach_alternative(html, "text/html")
+    return email
+
+
+def encolar_email(kind, subject, to, body='', html=None, cita=None):
+    """
+    Guarda el correo en la bandeja de salida (Outbox) para que lo envíe el
+    worker procesar_outbox. Con EMAIL_OUTBOX desactivado se envía en el acto.
+    """
+    if not getattr(settings, 'EMAIL_OUTBOX', True):
+        with metrics.medir('appointment_email_seconds', stage='send', kind=kind):
+            construir_email(subject, to, body, html).send(fail_silently=False)
+        return True
+
+    from .models import Outbox
+
+    with metrics.medir('appointment_email_seconds', stage='enqueue', kind=kind):
+        mensaje = Outbox(kind=kind, subject=subject, schedule=cita)
+        mensaje.payload = {'to': to, 'body': body, 'html': html}
+        mensaje.save()
+    logger.info('[OUTBOX] Email %s encolado (id %s)', kind, mensaje.id)
+    return True
+
+
+def encolar_emails(mensajes):
+    """
+    Versión por lotes de encolar_email. `mensajes` es una lista de dicts con
+    kind, subject, to, body, html y cita. Los guarda con un solo INSERT (o,
+    sin EMAIL_OUTBOX, los envía por una única conexión SMTP) y devuelve una
+    lista de (ok, error) en el mismo orden.
+    """
+    if not mensajes:
+        return []
+
+    if not getattr(settings, 'EMAIL_OUTBOX', True):
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as e:
+            logger.error('[EMAIL] No se pudo abrir la conexión SMTP: %s', e)
+            return [(False, str(e))] * len(mensajes)
+        resultados = []
+        try:
+            for datos in mensajes:
+                try:
+                    with metrics.medir('appointment_email_seconds', stage='send', kind=datos['kind']):
+                        construir_email(
+                            datos['subject'], datos['to'], datos.get('body', ''), datos.get('html'),
+                            connection=connection,
+                        ).send()
+                    resultados.append((True, ''))
+                except Exception as e:
+                    metrics.incrementar('appointment_errors_total', target='smtp')
+                    resultados.append((False, str(e)))
+        finally:
+            connection.close()
+        return resultados
+
+    from .models import Outbox
+
+    with metrics.medir('appointment_email_seconds', stage='enqueue_batch', kind=mensajes[0]['kind']):
+        filas = []
+        for datos in mensajes:
+            fila = Outbox(kind=datos['kind'], subject=datos['subject'], schedule=datos.get('cita'))
+            fila.payload = {'to': datos['to'], 'body': datos.get('body', ''), 'html': datos.get('html')}
+            filas.append(fila)
+        Outbox.objects.bulk_create(filas, batch_size=500)
+    logger.info('[OUTBOX] %d emails encolados', len(filas))
+    return [(True, '')] * len(filas)
+
 def calcular_precio_final(servicio, promo_code):
     """
     Calcula el precio final aplicando el descuento si existe
@@ -38,7 +121,7 @@ def enviar_email_confirmacion(cita):
     Envía un email de confirmación al cliente cuando se crea una cita
     """
     try:
-        logger.info(f'[EMAIL] Intentando enviar email a {cita.email}')
+        logger.info('[EMAIL] Intentando enviar email de la cita %s', cita.id)
         
         servicio = cita.service
         precio_info = calcular_precio_final(servicio, cita.promo_code)
@@ -56,29 +139,27 @@ def enviar_email_confirmacion(cita):
         if cita.promo_code:
             context['codigo_promocional'] = cita.promo_code.code
         
-        logger.info(f'[EMAIL] Renderizando template para {cita.email}')
+        logger.debug('[EMAIL] Renderizando template de la cita %s', cita.id)
         
-        html_message = render_to_string('emails/confirmacion_cita.html', context)
+        with metrics.medir('appointment_email_seconds', stage='render', kind='confirmacion'):
+            html_message = render_to_string('emails/confirmacion_cita.html', context)
         plain_message = strip_tags(html_message)
         
-        email = EmailMultiAlternatives(
+        logger.debug('[EMAIL] Encolando email de la cita %s', cita.id)
+        encolar_email(
+            'confirmacion',
             subject=f'Confirmacion de cita - {servicio.name}',
+            to=[cita.email],
             body=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[cita.email]
+            html=html_message,
+            cita=cita,
         )
-        email.attach_alternative(html_message, "text/html")
         
-        logger.info(f'[EMAIL] Enviando email desde {settings.DEFAULT_FROM_EMAIL} a {cita.email}')
-        email.send(fail_silently=False)
-        
-        logger.info(f'[OK] Email enviado exitosamente a {cita.email}')
+        logger.info('[OK] Email de la cita %s listo para envio', cita.id)
         return True
         
     except Exception as e:
-        logger.error(f'[ERROR] Error al enviar email a {cita.email}: {str(e)}')
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.exception('[ERROR] Error al enviar email de la cita %s: %s', cita.id, e)
         return False
 
 
@@ -90,7 +171,7 @@ def enviar_email_notificacion_admin(cita):
         servicio = cita.service
         admin_email = settings.ADMIN_EMAIL
         
-        logger.info(f'[ADMIN] Intentando enviar notificacion al admin: {admin_email}')
+        logger.info('[ADMIN] Intentando enviar notificacion al admin de la cita %s', cita.id)
         
         precio_info = calcular_precio_final(servicio, cita.promo_code)
         
@@ -108,57 +189,69 @@ def enviar_email_notificacion_admin(cita):
         if cita.promo_code:
             context['codigo_promocional'] = cita.promo_code.code
         
-        html_message = render_to_string('emails/notificacion_admin.html', context)
+        with metrics.medir('appointment_email_seconds', stage='render', kind='notificacion_admin'):
+            html_message = render_to_string('emails/notificacion_admin.html', context)
         plain_message = strip_tags(html_message)
         
-        email = EmailMultiAlternatives(
+        logger.debug('[ADMIN] Encolando notificacion de la cita %s', cita.id)
+        encolar_email(
+            'notificacion_admin',
             subject=f'Nueva cita agendada - {servicio.name}',
+            to=[admin_email],
             body=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[admin_email]
+            html=html_message,
+            cita=cita,
         )
-        email.attach_alternative(html_message, "text/html")
-        
-        logger.info(f'[ADMIN] Enviando notificacion desde {settings.DEFAULT_FROM_EMAIL} a {admin_email}')
-        email.send(fail_silently=False)
         
-        logger.info(f'[OK] Notificacion enviada al administrador')
+        logger.info('[OK] Notificacion al administrador lista para envio')
         return True
         
     except Exception as e:
-        logger.error(f'[ERROR] Error al enviar notificacion al admin: {str(e)}')
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.exception('[ERROR] Error al enviar notificacion al admin: %s', e)
         return False
     
 
 
+def email_cancelacion(cita, plantilla=None):
+    """
+    Datos del correo de cancelación de una cita, listos para encolar_email(s).
+    `plantilla` permite reutilizar la plantilla ya compilada en envíos por lote.
+    """
+    contexto = {
+        'nombre': cita.name,
+        'servicio': cita.service.name,
+        'fecha': cita.date.strftime('%d/%m/%Y'),
+        'hora': cita.time.strftime('%H:%M'),
+    }
+    plantilla = plantilla or get_template('emails/cancelacion_cita.html')
+
+    # La cita se va a eliminar: no se enlaza con la bandeja de salida
+    return {
+        'kind': 'cancelacion',
+        'subject': '❌ Cita Cancelada - ' + cita.service.name,
+        'to': [cita.email],
+        'body': '',  # Mensaje en texto plano (vacío si solo usas HTML)
+        'html': plantilla.render(contexto),
+    }
+
+
 def enviar_email_cancelacion(cita):
     """
     Envía un correo electrónico al cliente notificando la cancelación de su cita
     """
     try:
-        contexto = {
-            'nombre': cita.name,
-            'servicio': cita.service.name,
-            'fecha': cita.date.strftime('%d/%m/%Y'),
-            'hora': cita.time.strftime('%H:%M'),
-        }
-        
-        mensaje_html = render_to_string('emails/cancelacion_cita.html', contexto)
-        
-        send_mail(
-            subject='❌ Cita Cancelada - ' + cita.service.name,
-            message='',  # Mensaje en texto plano (vacío si solo usas HTML)
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[cita.email],
-            html_message=mensaje_html,
-            fail_silently=False,
+        datos = email_cancelacion(cita)
+        encolar_email(
+            datos['kind'],
+            subject=datos['subject'],
+            to=datos['to'],
+            body=datos['body'],
+            html=datos['html'],
         )
         
-        logger.info(f'Email de cancelación enviado exitosamente a {cita.email}')
+        logger.info('Email de cancelación de la cita %s listo para envio', cita.id)
         return True
         
     except Exception as e:
-        logger.error(f'Error al enviar email de cancelación: {str(e)}')
-        return False
\ No newline at end of file
+        logger.error('Error al enviar email de cancelación: %s', e)
+        return False
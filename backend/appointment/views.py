@@ -1,6 +1,28 @@
-from django.http import HttpResponse
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+from . import metrics
+
+IPS_LOCALES = {'127.0.0.1', '::1'}
+
 
 def index(request):
     return HttpResponse("Hello, world. You're at the appointment index.")
 
 
+def metricas(request):
+    """Métricas del proceso en formato de texto de Prometheus"""
+    if not getattr(settings, 'METRICS_ENABLED', True):
+        raise Http404
+
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        autorizacion = request.META.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(autorizacion.encode(), f'Bearer {token}'.encode()):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG and request.META.get('REMOTE_ADDR') not in IPS_LOCALES:
+        return HttpResponseForbidden()
+
+    return HttpResponse(metrics.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
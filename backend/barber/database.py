@@ -0,0 +1,54 @@
+# barber/barber/database.py
+"""
+Configuración de la base de datos a partir de DATABASE_URL.
+
+  - Sin DATABASE_URL se usa SQLite en BASE_DIR/db.sqlite3.
+  - postgres://... (o cualquier URL de dj_database_url) se usa tal cual.
+
+En ambos casos las conexiones son persistentes (DB_CONN_MAX_AGE segundos)
+y se comprueban antes de reutilizarse (conn_health_checks), de modo que un
+worker de gunicorn no reabre la conexión en cada petición ni hereda una
+conexión caída.
+
+En SQLite, al abrir cada conexión:
+  - journal_mode=WAL: los lectores no bloquean al escritor ni al revés;
+  - synchronous=NORMAL: seguro con WAL, sin fsync en cada commit;
+  - timeout (busy_timeout): espera al bloqueo de escritura en lugar de
+    fallar al instante con "database is locked";
+  - transaction_mode=IMMEDIATE: cada transaction.atomic() toma el bloqueo
+    de escritura al empezar, así la espera la resuelve busy_timeout y no
+    acaba en un fallo al pasar de lectura a escritura a mitad de transacción.
+"""
+from decouple import config
+import dj_database_url
+
+SQLITE_SYNCHRONOUS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def configurar(base_dir):
+    """Devuelve el diccionario de DATABASES['default']"""
+    url = config('DATABASE_URL', default='') or f"sqlite:///{base_dir / 'db.sqlite3'}"
+    conf = dj_database_url.parse(
+        url,
+        conn_max_age=config('DB_CONN_MAX_AGE', default=600, cast=int),
+        conn_health_checks=True,
+    )
+
+    if conf['ENGINE'] == 'django.db.backends.sqlite3':
+        synchronous = config('DB_SQLITE_SYNCHRONOUS', default='NORMAL').upper()
+        if synchronous not in SQLITE_SYNCHRONOUS:
+            raise ValueError(f"DB_SQLITE_SYNCHRONOUS debe ser uno de {', '.join(SQLITE_SYNCHRONOUS)}")
+        conf.setdefault('OPTIONS', {}).update({
+            'timeout': config('DB_SQLITE_TIMEOUT', default=20, cast=float),  # Segundos
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                f'PRAGMA synchronous={synchronous};'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+        })
+    elif conf['ENGINE'].startswith('django.db.backends.postgresql'):
+        conf.setdefault('OPTIONS', {}).setdefault(
+            'connect_timeout', config('DB_CONNECT_TIMEOUT', default=5, cast=int)
+        )
+    return conf
@@ -1,7 +1,7 @@
 import os
 from pathlib import Path
 from decouple import config
-import dj_database_url
+from . import database
 from dotenv import load_dotenv
 
 
@@ -19,6 +19,13 @@ SECRET_KEY = config('SECRET_KEY')
 
 # Configuration for Fernet encryption
 FERNET_KEY = config('FERNET_KEY')
+# Rotación: FERNET_KEYS="nueva,anterior" cifra con la primera y lee con todas.
+# FERNET_KEY sigue siendo la base del índice ciego mientras no haya BLIND_INDEX_KEY.
+FERNET_KEYS = config('FERNET_KEYS', default=FERNET_KEY, cast=lambda v: [c.strip() for c in v.split(',') if c.strip()])
+# Guardar name/email/phone de cada cita en un único sobre AES-GCM (columna pii)
+PII_ENVELOPE = config('PII_ENVELOPE', default=False, cast=bool)
+# Clave del índice ciego de búsqueda; si está vacía se deriva de FERNET_KEY
+BLIND_INDEX_KEY = config('BLIND_INDEX_KEY', default='')
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = config('DEBUG', default=False, cast=bool)
@@ -50,13 +57,14 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'appointment.middleware.EstaticosMiddleware',  # WhiteNoise, también asíncrono
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'appointment.middleware.ContadorCifradoMiddleware',
 ]
 
 ROOT_URLCONF = 'barber.urls'
@@ -92,54 +100,86 @@ EMAIL_USE_SSL = config('EMAIL_USE_SSL', default=False, cast=bool)
 # Configuración adicional para Gmail
 EMAIL_TIMEOUT = 60  # Timeout en segundos
 
-# Configuración de logging
+# Bandeja de salida: los correos se encolan y los envía `manage.py procesar_outbox`
+EMAIL_OUTBOX = config('EMAIL_OUTBOX', default=True, cast=bool)
+EMAIL_OUTBOX_BACKOFF = config('EMAIL_OUTBOX_BACKOFF', default=30, cast=int)  # Segundos
+
+# Configuración de logging: la petición solo encola; un hilo escribe JSON con rotación por tamaño
+# y sin datos personales (appointment.log)
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+LOG_FILE = config('LOG_FILE', default='django.log')
+LOG_MAX_BYTES = config('LOG_MAX_BYTES', default=10 * 1024 * 1024, cast=int)
+LOG_BACKUP_COUNT = config('LOG_BACKUP_COUNT', default=5, cast=int)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
-        'file': {
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': 'django.log',
-        },
-        'console': {
-            'level': 'INFO',
-            'class': 'logging.StreamHandler',
+        'cola': {
+            'level': LOG_LEVEL,
+            'class': 'appointment.log.ManejadorCola',
+            'filename': LOG_FILE,
+            'max_bytes': LOG_MAX_BYTES,
+            'backup_count': LOG_BACKUP_COUNT,
         },
     },
     'loggers': {
-        'appointment.utils': {
-            'handlers': ['console', 'file'],
-            'level': 'INFO',
-            'propagate': True,
-        },
-        'appointment.api.serializers': {
-            'handlers': ['console', 'file'],
-            'level': 'INFO',
-            'propagate': True,
+        'appointment': {
+            'handlers': ['cola'],
+            'level': LOG_LEVEL,
+            'propagate': False,
         },
     },
 }
 
 WSGI_APPLICATION = 'barber.wsgi.application'
 
-# Database
-'''DATABASES = {
-    'default': dj_database_url.config(
-        default=config('DATABASE_URL'),
-        conn_max_age=600,
-    )
-}'''
+# Caché: CACHE_URL (redis://...) o CACHE_DIR (archivos) la comparten todos los
+# workers de gunicorn. Sin ninguna de las dos se usa memoria local, que es por
+# proceso: solo vale para desarrollo y `check --deploy` la rechaza (appointment/checks.py)
+CACHE_URL = config('CACHE_URL', default='')
+CACHE_DIR = config('CACHE_DIR', default='')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+elif CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_DIR,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'appointment',
+        }
+    }
 
+# Database: SQLite por defecto o DATABASE_URL (ver barber/database.py)
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database.configurar(BASE_DIR),
 }
 
 RECAPTCHA_SECRET_KEY = os.getenv('RECAPTCHA_SECRET_KEY')
 
+# Verificación de captcha (appointment.captcha.StubCaptchaVerifier para pruebas/benchmarks)
+CAPTCHA_BACKEND = config('CAPTCHA_BACKEND', default='appointment.captcha.RecaptchaVerifier')
+CAPTCHA_CONNECT_TIMEOUT = config('CAPTCHA_CONNECT_TIMEOUT', default=2.0, cast=float)
+CAPTCHA_READ_TIMEOUT = config('CAPTCHA_READ_TIMEOUT', default=4.0, cast=float)
+CAPTCHA_REPLAY_TTL = config('CAPTCHA_REPLAY_TTL', default=120, cast=int)  # Segundos que se recuerda un token usado
+CAPTCHA_STUB_LATENCY = config('CAPTCHA_STUB_LATENCY', default=0.0, cast=float)  # Segundos simulados (solo el stub)
+
+# Métricas de rendimiento en GET /metrics (formato de texto de Prometheus).
+# Sin METRICS_TOKEN solo responden a peticiones locales (o con DEBUG)
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # Authorization: Bearer <token>
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -25,7 +25,8 @@ ls -la
 
 # Ejecutar migraciones
 echo "=== RUNNING MIGRATIONS ==="
-python manage.py migrate
+# --fake-initial: bases creadas antes de que existieran las migraciones de appointment
+python manage.py migrate --fake-initial
 
 # Recolectar archivos estáticos para producción
 echo "=== COLLECTING STATIC FILES ==="
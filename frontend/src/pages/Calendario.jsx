@@ -74,6 +74,9 @@ const Calendario = () => {
   const [cargando, setCargando] = useState(true);
   const [error, setError] = useState(null);
   const [breaks, setBreaks] = useState([]);
+  const [disponibilidad, setDisponibilidad] = useState(null);
+  // Token de /booking-bootstrap/ para pedir solo los cambios
+  const versionRef = useRef(null);
 
   const API_BASE = import.meta.env.VITE_API_URL;
 
@@ -88,42 +91,56 @@ const Calendario = () => {
       }
     }
 
-    const fetchAll = async () => {
-      setCargando(true);
-      setError(null);
-      
+    const fetchBreaks = async () => {
       try {
         const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000/api';
-        
-        console.log('🔗 Conectando a API:', apiUrl);
-        
-        const [srv, wd, wh, schedule, blocked, brks] = await Promise.all([
-          axios.get(`${apiUrl}/service/`),
-          axios.get(`${apiUrl}/weekday/`),
-          axios.get(`${apiUrl}/workinghours/`),
-          axios.get(`${apiUrl}/schedule/`),
-          axios.get(`${apiUrl}/blocked-dates/`, { 
-            params: { year: new Date().getFullYear() } 
-          }).catch(err => {
-            console.warn('⚠️ No se pudieron cargar días festivos:', err);
-            return { data: { blocked_dates: [] } };
-          }),
-          axios.get(`${apiUrl}/breaks/`).catch(err => {
-            console.warn('⚠️ No se pudieron cargar breaks:', err);
-            return { data: [] };
-          })
-        ]);
-        
-        console.log('✅ Datos cargados exitosamente');
-        console.log('📅 Días festivos bloqueados:', blocked.data.blocked_dates);
-        
-        setServicios(Array.isArray(srv.data) ? srv.data : []);
-        setWeekdays(Array.isArray(wd.data) ? wd.data : []);
-        setHorarios(Array.isArray(wh.data) ? wh.data : []);
-        setCitas(Array.isArray(schedule.data) ? schedule.data : []);
-        setDiasBloqueados(blocked.data.blocked_dates || []);
+        const brks = await axios.get(`${apiUrl}/breaks/`);
         setBreaks(Array.isArray(brks.data) ? brks.data : []);
-        
+      } catch (err) {
+        console.warn('⚠️ No se pudieron cargar breaks:', err);
+        setBreaks([]);
+      }
+    };
+
+    fetchBreaks();
+  }, []);
+
+  // Catálogo, festivos y ocupación del mes visible en una sola petición.
+  // Con `since` el servidor solo devuelve lo que cambió desde la versión anterior.
+  const cargarBootstrap = async (since = null) => {
+    const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000/api';
+    const params = { year: añoActual, month: mesActual + 1 };
+    if (since) params.since = since;
+
+    const { data } = await axios.get(`${apiUrl}/booking-bootstrap/`, { params });
+    versionRef.current = data.version;
+
+    if (data.catalog) {
+      setServicios(Array.isArray(data.catalog.services) ? data.catalog.services : []);
+      setWeekdays(Array.isArray(data.catalog.weekdays) ? data.catalog.weekdays : []);
+      setHorarios(Array.isArray(data.catalog.workinghours) ? data.catalog.workinghours : []);
+      setDiasBloqueados(data.catalog.blocked_dates || []);
+    }
+
+    if (data.delta) {
+      const cambiados = new Set(data.changed_dates || []);
+      if (cambiados.size > 0) {
+        setCitas(prev => [
+          ...prev.filter(cita => !cambiados.has(cita.date)),
+          ...data.occupancy
+        ]);
+      }
+    } else {
+      setCitas(Array.isArray(data.occupancy) ? data.occupancy : []);
+    }
+  };
+
+  useEffect(() => {
+    const fetchMes = async () => {
+      setError(null);
+      try {
+        await cargarBootstrap(versionRef.current);
+        console.log(`✅ Datos de ${mesActual + 1}/${añoActual} cargados`);
       } catch (err) {
         console.error('❌ Error al cargar datos:', err);
         setError(`Error al cargar los datos: ${err.message}`);
@@ -132,36 +149,45 @@ const Calendario = () => {
         setHorarios([]);
         setCitas([]);
         setDiasBloqueados([]);
+        versionRef.current = null;
       } finally {
         setCargando(false);
       }
     };
-    
-    fetchAll();
-  }, []);
 
+    fetchMes();
+  }, [añoActual, mesActual]);
+
+  // Horarios libres calculados en el servidor para el mes visible
   useEffect(() => {
-    const fetchDiasBloqueados = async () => {
+    if (!servicioSeleccionado) return;
+
+    const fetchDisponibilidad = async () => {
       try {
         const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000/api';
-        const response = await axios.get(`${apiUrl}/blocked-dates/`, {
-          params: { year: añoActual }
+        const primerDia = new Date(añoActual, mesActual, 1);
+        const ultimoDia = new Date(añoActual, mesActual + 1, 0);
+        const response = await axios.get(`${apiUrl}/availability/`, {
+          params: {
+            service: servicioSeleccionado.id,
+            date_from: primerDia.toISOString().split('T')[0],
+            date_to: ultimoDia.toISOString().split('T')[0]
+          }
         });
-        
-        if (response.data.success) {
-          setDiasBloqueados(response.data.blocked_dates);
-          console.log(`📅 Días festivos actualizados para ${añoActual}:`, response.data.blocked_dates);
-        }
+
+        const porFecha = {};
+        response.data.days.forEach(dia => {
+          porFecha[dia.date] = dia.slots;
+        });
+        setDisponibilidad(porFecha);
       } catch (error) {
-        console.warn('⚠️ Error al cargar días festivos:', error);
-        setDiasBloqueados([]);
+        console.warn('⚠️ No se pudo cargar la disponibilidad, se calcula localmente:', error);
+        setDisponibilidad(null);
       }
     };
 
-    if (!cargando) {
-      fetchDiasBloqueados();
-    }
-  }, [añoActual, cargando]);
+    fetchDisponibilidad();
+  }, [servicioSeleccionado, añoActual, mesActual, citas]);
 
   const dias = obtenerDiasDelMes(añoActual, mesActual);
 
@@ -216,9 +242,7 @@ const Calendario = () => {
   // NUEVA FUNCIÓN: Recargar citas para actualizar disponibilidad
   const recargarCitas = async () => {
     try {
-      const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000/api';
-      const response = await axios.get(`${apiUrl}/schedule/`);
-      setCitas(Array.isArray(response.data) ? response.data : []);
+      await cargarBootstrap(versionRef.current);
       console.log('🔄 Citas recargadas');
     } catch (error) {
       console.error('Error al recargar citas:', error);
@@ -476,6 +500,11 @@ const Calendario = () => {
 
   const horasDisponibles = () => {
     if (!fechaSeleccionada || !servicioSeleccionado) return [];
+
+    if (disponibilidad) {
+      const fechaStr = fechaSeleccionada.toISOString().split('T')[0];
+      return disponibilidad[fechaStr] || [];
+    }
     
     const diaSemana = fechaSeleccionada.getDay();
     const dayMapping = {